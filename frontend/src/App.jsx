@@ -26,6 +26,8 @@ export default function App() {
   const [currentMatchId, setCurrentMatchId] = useState(null);
   // NEW: Store the confirmed match object to persist
   const [confirmedMatch, setConfirmedMatch] = useState(null);
+  // A match pushed by the server for one of the user's earlier reports
+  const [pushedMatchId, setPushedMatchId] = useState(null);
 
   // --- NEW: Helper function to fetch user's match status ---
   const fetchUserStatus = async (token) => {
@@ -71,6 +73,23 @@ export default function App() {
     loadApp();
   }, []);
 
+  // --- Live match notifications (server-sent events) ---
+  // The server pushes a "match" event when any of the user's reports is
+  // matched, including later on by someone else's upload, so there is
+  // no need to poll for it. EventSource reconnects by itself.
+  useEffect(() => {
+    if (!authToken) return;
+    const events = new EventSource(
+      `${API_URL}/events?token=${encodeURIComponent(authToken)}`
+    );
+    events.addEventListener("match", (e) => {
+      const data = JSON.parse(e.data);
+      console.log("Match pushed for report:", data.submission_id);
+      setPushedMatchId(data.submission_id);
+    });
+    return () => events.close();
+  }, [authToken]);
+
   // --- Handler for successful login ---
   const handleLoginSuccess = async (userData, token) => {
     localStorage.setItem("authToken", token);
@@ -98,6 +117,7 @@ export default function App() {
     // NEW: Clear match state on logout
     setConfirmedMatch(null);
     setCurrentMatchId(null);
+    setPushedMatchId(null);
     setCurrentPage("login"); // Go to login after logout
   };
 
@@ -106,6 +126,7 @@ export default function App() {
    */
   const handleMatchFound = (submissionId) => {
     console.log("Match found! Submission ID:", submissionId);
+    setPushedMatchId(null);
     setCurrentMatchId(submissionId);
     // We don't set confirmedMatch here, only after user confirms
     setCurrentPage("match");
@@ -158,6 +179,19 @@ export default function App() {
         confirmedMatch={confirmedMatch}
       />
 
+      {/* Pushed match for an earlier report */}
+      {pushedMatchId && currentPage !== "match" && (
+        <div className="bg-cyan-600 text-white px-4 py-3 flex items-center justify-center gap-4">
+          <span>A possible match was found for one of your reports.</span>
+          <button
+            onClick={() => handleMatchFound(pushedMatchId)}
+            className="bg-white text-cyan-700 font-semibold px-3 py-1 rounded"
+          >
+            Review match
+          </button>
+        </div>
+      )}
+
       <main>
         {/* Conditional Page Rendering */}
 
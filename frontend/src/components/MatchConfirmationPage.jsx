@@ -129,8 +129,12 @@ export default function MatchConfirmationPage({ submissionId, onConfirm, onRejec
     );
 
   // ⚠️ IMPORTANT: Use backend image URLs
-  const parentImage = `${API_URL}${matchData.parent_report.image_path}`;
-  const volunteerImage = `${API_URL}${matchData.volunteer_report.image_path}`;
+  // Cards show the resized "medium" variant (cached, WebP when supported)
+  // instead of the original multi-megabyte upload.
+  const variantUrl = (imagePath, size = "medium") =>
+    imagePath ? `${API_URL}/api/images/${imagePath.replace(/^\/uploads\//, "")}?size=${size}` : "";
+  const parentImage = variantUrl(matchData.parent_report.image_path);
+  const volunteerImage = variantUrl(matchData.volunteer_report.image_path);
   
   // --- Get Parent's submitted name for the title ---
   const parentChildName = matchData.parent_report.child_entered.name || "Child";
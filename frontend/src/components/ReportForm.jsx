@@ -82,6 +82,30 @@ export default function ReportForm({ onMatchFound, authToken }) {
      setPreview(null);
   }
 
+  // ===========================
+  // POLL MATCH JOB STATUS
+  // ===========================
+  // Returns the job once it is "done"/"failed", or the last status
+  // seen after `attempts` polls.
+  const waitForMatchJob = async (statusUrl, attempts = 60, intervalMs = 2000) => {
+    let job = { status: "queued" };
+    for (let i = 0; i < attempts; i++) {
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+      try {
+        const res = await fetch(`http://127.0.0.1:8000${statusUrl}`, {
+          headers: { 'Authorization': `Bearer ${authToken}` }
+        });
+        if (res.ok) {
+          job = await res.json();
+          if (job.status === "done" || job.status === "failed") break;
+        }
+      } catch (e) {
+        console.error("STATUS POLL ERROR", e);
+      }
+    }
+    return job;
+  };
+
   // ===========================
   // SUBMIT TO BACKEND
   // ===========================
@@ -143,7 +167,14 @@ export default function ReportForm({ onMatchFound, authToken }) {
       const data = await res.json();
       console.log("REPORT API RESPONSE →", data);
 
-      if (data.match_found) {
+      // The report is saved; face matching runs in the background.
+      // Poll its job status until it is done.
+      setSuccessMessage("Report submitted. Searching for a match...");
+      clearForm();
+      setLoading(false);
+      const job = await waitForMatchJob(data.status_url);
+
+      if (job.status === "done" && job.match_found) {
         // A match was found! Call the function from App.jsx
         // This will trigger the page switch.
         setSuccessMessage("Match found! Loading details...");
@@ -153,11 +184,13 @@ export default function ReportForm({ onMatchFound, authToken }) {
         } else {
           console.error("onMatchFound is not a function prop", onMatchFound);
         }
-        clearForm();
+      } else if (job.status === "done" && job.face_found === false) {
+        setSuccessMessage("Report submitted, but no face was detected in the photo. Please submit a clearer photo.");
+      } else if (job.status === "failed") {
+        setSuccessMessage("Report saved, but matching failed after several attempts. Please submit the report again.");
       } else {
-        // No match, just show a success message
+        // No match (or still running after the polling window)
         setSuccessMessage("Report submitted successfully. We will notify you if a match is found.");
-        clearForm();
       }
     } catch (e) {
       console.error("UPLOAD ERROR", e);
@@ -1,5 +1,9 @@
 import os
-from fastapi import FastAPI
+import time
+_import_started = time.monotonic()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
@@ -8,6 +12,11 @@ from app.routes.report import router as report_router
 from app.routes.match import router as match_router
 # --- NEW ---
 from app.routes.auth import router as auth_router 
+from app.routes.stats import router as stats_router, STARTUP_STATS, process_stats
+from app.routes.media import router as media_router
+from app.routes.events import router as events_router
+from app.utils import inference, recognition, uploads, auth_utils, match_jobs
+from app.utils.storage import db
 
 # Ensure uploads directory exists
 os.makedirs("app/uploads", exist_ok=True)
@@ -18,6 +27,23 @@ os.makedirs("app/db", exist_ok=True)
 
 app = FastAPI(title="Tether Backend (JSON-File Mode)") # Fixed typo titleA -> title
 
+# --- Upload Size Limit ---
+# (Registered before CORS so CORS headers are added to the 413 too.)
+# Reject oversized uploads from their Content-Length header, before the
+# multipart body is read and spooled. Bodies without the header are still
+# cut off at MAX_UPLOAD_BYTES by uploads.ingest_upload.
+MULTIPART_FORM_OVERHEAD = 64 * 1024 # The report's text fields and boundaries
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > uploads.MAX_UPLOAD_BYTES + MULTIPART_FORM_OVERHEAD:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Image is too large (max {uploads.MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"}
+        )
+    return await call_next(request)
+
 # CORS (Cross-Origin Resource Sharing)
 # ... (no changes) ...
 origins = [
@@ -46,6 +72,38 @@ app.include_router(report_router, prefix="/api")
 app.include_router(match_router, prefix="/api")
 # --- NEW ---
 app.include_router(auth_router, prefix="/api/auth") # Add the auth router
+app.include_router(stats_router, prefix="/api")
+app.include_router(media_router, prefix="/api")
+app.include_router(events_router, prefix="/api")
+
+# Set RECOGNITION_WARMUP=1 on replicas that accept reports, so the
+# face models load in the background instead of on the first upload.
+RECOGNITION_WARMUP = os.getenv("RECOGNITION_WARMUP", "0") == "1"
+
+@app.on_event("startup")
+def report_startup():
+    STARTUP_STATS["startup_seconds"] = time.monotonic() - _import_started
+    stats = process_stats()
+    rss = f"{stats['max_rss_mb']:.0f} MB" if stats["max_rss_mb"] is not None else "n/a"
+    print(
+        f"Startup took {stats['startup_seconds']:.2f}s, "
+        f"RSS {rss}, "
+        f"recognition models loaded: {stats['recognition']['loaded']}"
+    )
+    if RECOGNITION_WARMUP:
+        recognition.warm_up_in_background()
+
+@app.on_event("startup")
+async def start_match_jobs():
+    # Reports accepted before a restart but not yet matched
+    match_jobs.resume_pending()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    match_jobs.shutdown()
+    inference.shutdown()
+    auth_utils.shutdown()
+    db.checkpoint()
 
 @app.get("/")
 def root():
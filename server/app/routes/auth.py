@@ -1,43 +1,69 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.utils import json_db
+from app.utils.storage import db
 from app.utils.models import (
     UserIn, Token, LoginRequest, UserBase, UserDB,
     UserUpdate, PasswordUpdate # --- NEW ---
 )
 from app.utils.auth_utils import (
-    get_password_hash, 
-    verify_password, 
+    get_password_hash_async,
+    verify_password_async,
+    verify_and_update_password_async,
     create_access_token,
-    get_current_user
+    get_current_user,
+    ExecutorSaturated
 )
 import uuid
 
 router = APIRouter()
 
+# Error messages for a unique-index collision, keyed by field
+SIGNUP_DUPLICATE_DETAILS = {
+    "username": "Username already registered",
+    "email": "Email already registered",
+    "phone": "Phone number already registered",
+}
+UPDATE_DUPLICATE_DETAILS = {
+    "username": "Username already taken",
+    "email": "Email already registered",
+    "phone": "Phone already registered",
+}
+
+def _password_pool_busy() -> HTTPException:
+    """503 for when the password hashing pool and its queue are full."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": "2"},
+    )
+
 @router.post("/signup", response_model=Token)
 async def signup(user: UserIn):
     """
     Creates a new user account.
     """
-    # Check for duplicates
-    if json_db.find_user_by_identifier(user.username):
+    # Check for duplicates (O(1) index lookups; this early exit avoids
+    # hashing a password for a signup that is bound to fail)
+    if db.find_user_by_identifier(user.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered",
         )
-    if json_db.find_user_by_identifier(user.email):
+    if db.find_user_by_identifier(user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
-    if json_db.find_user_by_identifier(user.phone):
+    if db.find_user_by_identifier(user.phone):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Phone number already registered",
         )
         
-    # Hash password
-    hashed_password = get_password_hash(user.password)
+    # Hash password (on the password pool, off the event loop)
+    try:
+        hashed_password = await get_password_hash_async(user.password)
+    except ExecutorSaturated:
+        raise _password_pool_busy()
     
     # Create UserDB model
     user_db = UserDB(
@@ -50,7 +76,15 @@ async def signup(user: UserIn):
     
     # Save to users.json
     # Pydantic's .model_dump(by_alias=True) converts `id` to `_id`
-    json_db.insert_submission(user_db.model_dump(by_alias=True), "users")
+    # The unique indexes re-check under a lock, which catches a
+    # concurrent signup that raced past the checks above.
+    try:
+        db.insert_submission(user_db.model_dump(by_alias=True), "users")
+    except db.DuplicateKeyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=SIGNUP_DUPLICATE_DETAILS[e.field],
+        )
     
     # Create and return access token
     access_token = create_access_token(data={"sub": user.username})
@@ -65,7 +99,7 @@ async def login(form_data: LoginRequest):
     """
     Logs in a user and returns an access token.
     """
-    user = json_db.find_user_by_identifier(form_data.identifier)
+    user = db.find_user_by_identifier(form_data.identifier)
     
     if not user:
         raise HTTPException(
@@ -74,12 +108,20 @@ async def login(form_data: LoginRequest):
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    if not verify_password(form_data.password, user["hashed_password"]):
+    try:
+        verified, new_hash = await verify_and_update_password_async(form_data.password, user["hashed_password"])
+    except ExecutorSaturated:
+        raise _password_pool_busy()
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash used older Argon2 parameters (or bcrypt)
+        db.update_user(user["_id"], {"hashed_password": new_hash})
+        user["hashed_password"] = new_hash
         
     # Create and return access token
     access_token = create_access_token(data={"sub": user["username"]})
@@ -106,17 +148,11 @@ async def get_user_match_status(current_user: dict = Depends(get_current_user)):
     to find if any are confirmed.
     """
     user_id = current_user.get("_id")
-    reports = json_db.find_reports_by_user_id(user_id)
+    # Served from an index of the storage backend (no scan over all reports)
+    confirmed = db.find_confirmed_match_by_user_id(user_id)
     
-    confirmed_match = None
-    submission_id = None
-
-    for report in reports:
-        match_info = report.get("match", {})
-        if match_info.get("confirmed"):
-            confirmed_match = match_info
-            submission_id = report.get("_id")
-            break # Found one
+    confirmed_match = confirmed["match"] if confirmed else None
+    submission_id = confirmed["submission_id"] if confirmed else None
             
     return {
         "confirmed_match": confirmed_match,
@@ -136,23 +172,26 @@ async def update_user_details(
     
     # Check for duplicate username, email, phone *that isn't this user*
     if user_update.username != current_user.get("username"):
-        if json_db.find_user_by_identifier(user_update.username):
+        if db.find_user_by_identifier(user_update.username):
             raise HTTPException(status_code=400, detail="Username already taken")
             
     if user_update.email != current_user.get("email"):
-        if json_db.find_user_by_identifier(user_update.email):
+        if db.find_user_by_identifier(user_update.email):
             raise HTTPException(status_code=400, detail="Email already registered")
 
     if user_update.phone != current_user.get("phone"):
-        if json_db.find_user_by_identifier(user_update.phone):
+        if db.find_user_by_identifier(user_update.phone):
             raise HTTPException(status_code=400, detail="Phone already registered")
 
     # Update the user in the db
     updates = user_update.model_dump()
-    json_db.update_user(user_id, updates)
+    try:
+        db.update_user(user_id, updates)
+    except db.DuplicateKeyError as e:
+        raise HTTPException(status_code=400, detail=UPDATE_DUPLICATE_DETAILS[e.field])
     
     # Return the newly updated user object
-    updated_user = json_db.find_user_by_id(user_id)
+    updated_user = db.find_user_by_id(user_id)
     return updated_user
 
 
@@ -167,15 +206,18 @@ async def update_user_password(
     """
     user_id = current_user.get("_id")
     
-    # 1. Verify old password
-    if not verify_password(pass_update.old_password, current_user["hashed_password"]):
-        raise HTTPException(status_code=400, detail="Incorrect old password")
-        
-    # 2. Hash new password
-    new_hashed_password = get_password_hash(pass_update.new_password)
+    try:
+        # 1. Verify old password
+        if not await verify_password_async(pass_update.old_password, current_user["hashed_password"]):
+            raise HTTPException(status_code=400, detail="Incorrect old password")
+
+        # 2. Hash new password
+        new_hashed_password = await get_password_hash_async(pass_update.new_password)
+    except ExecutorSaturated:
+        raise _password_pool_busy()
     
     # 3. Update in DB
-    json_db.update_user(user_id, {"hashed_password": new_hashed_password})
+    db.update_user(user_id, {"hashed_password": new_hashed_password})
     
     return {"message": "Password updated successfully"}
 
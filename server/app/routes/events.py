@@ -0,0 +1,66 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from app.utils import match_events
+from app.utils.storage import db
+from app.utils.auth_utils import get_user_from_token
+
+router = APIRouter()
+
+# --- Other Workers ---
+# A worker only applies another worker's writes when it next reads the
+# data, which an idle worker holding streams may not do for a while.
+# While any stream is open, one task per worker catches up every
+# MATCH_EVENTS_POLL seconds, so their matches reach these streams.
+_poller: Optional[asyncio.Task] = None
+
+async def _poll_other_workers():
+    global _poller
+    try:
+        while match_events.has_subscribers():
+            await asyncio.to_thread(db.catch_up)
+            await asyncio.sleep(match_events.MATCH_EVENTS_POLL)
+    finally:
+        _poller = None
+
+def start_polling():
+    """Starts the catch-up task if it is not running. Call from the event loop."""
+    global _poller
+    if _poller is None:
+        _poller = asyncio.get_running_loop().create_task(_poll_other_workers())
+
+@router.get("/events")
+async def stream_events(request: Request, token: str):
+    """
+    Server-sent events for the logged-in user (EventSource cannot send an
+    Authorization header, so the access token comes as ?token=).
+
+    - `match`: one of the user's reports was given a (still unconfirmed)
+      match, by its own match job or by someone else's report later on.
+    - `report_status`: a report's match job finished (done or failed).
+    """
+    user = await get_user_from_token(token)
+    user_id = user["_id"]
+    queue = match_events.subscribe(user_id)
+    start_polling()
+
+    async def event_stream():
+        try:
+            # Tells EventSource how long to wait before reconnecting
+            yield f"retry: {match_events.MATCH_EVENTS_RETRY_MS}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=match_events.MATCH_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield match_events.format_event(message)
+        finally:
+            match_events.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException
-from app.utils import json_db
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Dict, Any
+from app.utils import match_jobs, recognition
+from app.utils.auth_utils import get_current_user
+from app.utils.storage import db
 from app.utils.models import (
     MatchUpdateRequest, MatchResponse, 
     ChildDB, FinalChildInfo, FinalImages, MatchInfo
@@ -9,6 +12,12 @@ import uuid
 
 router = APIRouter()
 
+# Stored on a report for the server's own use, never sent to clients
+INTERNAL_FIELDS = ("embedding", "embedding_row", "match_job", "match_candidates")
+
+def _public_report(doc: dict) -> dict:
+    return {key: value for key, value in doc.items() if key not in INTERNAL_FIELDS}
+
 def _get_match_pair(submission_id: str):
     """
     Helper to find a submission and its match, returning both
@@ -19,22 +28,22 @@ def _get_match_pair(submission_id: str):
     initial_role = None
     
     # Check if ID is in parents
-    submission = json_db.find_submission(submission_id, 'parents')
+    submission = db.find_submission(submission_id, 'parents')
     if submission:
         initial_role = 'parent'
         parent_report = submission
         matched_id = submission.get("match", {}).get("volunteer_report_id")
         if matched_id:
-            volunteer_report = json_db.find_submission(matched_id, 'volunteers')
+            volunteer_report = db.find_submission(matched_id, 'volunteers')
     else:
         # Check if ID is in volunteers
-        submission = json_db.find_submission(submission_id, 'volunteers')
+        submission = db.find_submission(submission_id, 'volunteers')
         if submission:
             initial_role = 'volunteer'
             volunteer_report = submission
             matched_id = submission.get("match", {}).get("parent_report_id")
             if matched_id:
-                parent_report = json_db.find_submission(matched_id, 'parents')
+                parent_report = db.find_submission(matched_id, 'parents')
         else:
             # If not in parents or volunteers, it's not a valid report ID
             raise HTTPException(status_code=404, detail="Submission not found")
@@ -63,8 +72,8 @@ def get_match(submission_id: str):
     return MatchResponse(
         submission_id=submission_id,
         match_score=match_score,
-        parent_report=parent_report,
-        volunteer_report=volunteer_report
+        parent_report=_public_report(parent_report),
+        volunteer_report=_public_report(volunteer_report)
     )
 
 @router.post("/confirm")
@@ -82,17 +91,15 @@ def confirm_match(request: MatchUpdateRequest):
     parent_id = parent_report["_id"]
     volunteer_id = volunteer_report["_id"]
     
-    # --- 1. Update Parent Record ---
+    # --- 1. Confirm Parent Record ---
     parent_report["match"]["confirmed"] = True
     parent_report["match"]["confirmed_at"] = datetime.utcnow().isoformat()
-    json_db.update_submission(parent_id, {"match": parent_report["match"]}, 'parents')
     
-    # --- 2. Update Volunteer Record ---
+    # --- 2. Confirm Volunteer Record ---
     volunteer_report["match"]["confirmed"] = True
     volunteer_report["match"]["confirmed_at"] = datetime.utcnow().isoformat()
-    json_db.update_submission(volunteer_id, {"match": volunteer_report["match"]}, 'volunteers')
 
-    # --- 3. Create New Child Record ---
+    # --- 3. Build New Child Record ---
     # Combine data from both reports
     combined_child_info = FinalChildInfo(
         final_name=parent_report["child_entered"]["name"], # Use parent's name
@@ -117,7 +124,14 @@ def confirm_match(request: MatchUpdateRequest):
     )
     
     child_doc = new_child_record.model_dump(by_alias=True)
-    json_db.insert_submission(child_doc, 'children')
+
+    # --- 4. Write All Three at Once ---
+    # One transaction: either both reports are confirmed and the child
+    # record exists, or (after a crash) none of it happened.
+    with db.transaction() as txn:
+        txn.update_submission(parent_id, {"match": parent_report["match"]}, 'parents')
+        txn.update_submission(volunteer_id, {"match": volunteer_report["match"]}, 'volunteers')
+        txn.insert_submission(child_doc, 'children')
     
     print(f"Created new child record: {child_doc['_id']}")
         
@@ -130,12 +144,19 @@ def reject_match(request: MatchUpdateRequest):
     Rejects a match. 
     This will clear the match info from BOTH records so they can be 
     matched again in the future.
+
+    Both reports are then matched with their next cached candidate, if
+    any (no rescan), and the owners are told over /api/events. The
+    response says where each report ended up:
+    - next_match_id: the new match of the rejecting report, or None
+    - next_matches: {"parent": id or None, "volunteer": id or None},
+      keyed by the role of the report that was re-matched
     """
     submission_id = request.submission_id
     print(f"Rejecting match for submission_id: {submission_id}")
     
     try:
-        parent_report, volunteer_report, _ = _get_match_pair(submission_id)
+        parent_report, volunteer_report, initial_role = _get_match_pair(submission_id)
     except HTTPException as e:
         # Match might already be broken, which is fine
         if e.status_code == 404:
@@ -148,8 +169,47 @@ def reject_match(request: MatchUpdateRequest):
     # Define the "cleared" match info
     cleared_match_info = MatchInfo(confirmed=False).model_dump()
     
-    # Update both submissions
-    json_db.update_submission(parent_id, {"match": cleared_match_info}, 'parents')
-    json_db.update_submission(volunteer_id, {"match": cleared_match_info}, 'volunteers')
+    # Update both submissions (one transaction)
+    with db.transaction() as txn:
+        txn.update_submission(parent_id, {"match": cleared_match_info}, 'parents')
+        txn.update_submission(volunteer_id, {"match": cleared_match_info}, 'volunteers')
+
+    # The rejecting side first, so it gets first pick of the candidates
+    sides = [('parent', parent_id, 'parents', volunteer_id), ('volunteer', volunteer_id, 'volunteers', parent_id)]
+    if initial_role == 'volunteer':
+        sides.reverse()
+    next_matches = {}
+    for role, report_id, collection_name, rejected_id in sides:
+        next_match = match_jobs.match_next_candidate(report_id, collection_name, rejected_id)
+        next_matches[role] = next_match["submission_id"] if next_match else None
 
-    return {"status": "rejected"}
\ No newline at end of file
+    return {
+        "status": "rejected",
+        "next_match_id": next_matches[initial_role],
+        "next_matches": next_matches
+    }
+
+
+@router.get("/match/{submission_id}/candidates")
+def get_match_candidates(
+    submission_id: str,
+    k: int = Query(recognition.MATCH_CANDIDATES_K, ge=1, le=100),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    The K nearest unmatched reports of the opposite role, nearest first,
+    with their distance, similarity and whether they are under the match
+    threshold. One index search; read-only (the cached candidates used
+    after a rejection are only refreshed by matching).
+    Only the user who submitted the report can see it.
+    """
+    for collection_name in match_jobs.ROLE_COLLECTIONS.values():
+        doc = db.find_submission(submission_id, collection_name)
+        if doc is not None:
+            if doc.get("user_id") != current_user.get("_id"):
+                break
+            candidates = match_jobs.rank_candidates(submission_id, collection_name, k)
+            if candidates is None:
+                raise HTTPException(status_code=409, detail="Submission has no face embedding yet")
+            return {"submission_id": submission_id, "candidates": candidates}
+    raise HTTPException(status_code=404, detail="Submission not found")
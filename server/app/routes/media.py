@@ -0,0 +1,46 @@
+import mimetypes
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from app.utils import image_variants
+
+router = APIRouter()
+
+# Uploads are named by content hash (or, before the blob store, by
+# submission id) and never rewritten, so every response for a given URL
+# is the same bytes forever.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.get("/images/{filename:path}")
+def get_image(filename: str, request: Request, size: str = "medium"):
+    """
+    Serves an uploaded image (`filename` is its image_path without the
+    leading /uploads/), or a resized WebP/JPEG variant of it
+    (`size` = thumb, medium or original), with a strong ETag and a
+    long Cache-Control. Variants are generated on first request.
+    """
+    if size != "original" and size not in image_variants.VARIANT_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown size: {size}")
+
+    if size == "original":
+        path = image_variants.upload_path(filename)
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    else:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+        try:
+            path = image_variants.get_variant(filename, size, fmt)
+        except OSError as e:
+            # Not a decodable image
+            print(f"Could not create {size} variant of {filename}: {e}")
+            raise HTTPException(status_code=415, detail="Unsupported image")
+        media_type = image_variants.FORMATS[fmt][1]
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = image_variants.etag_for(path)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if size != "original":
+        headers["Vary"] = "Accept" # WebP or JPEG depending on the client
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
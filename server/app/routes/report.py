@@ -1,10 +1,12 @@
 import json
+import time
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
-from app.utils import json_db, recognition
+from app.utils import uploads, match_jobs, image_variants
+from app.utils.storage import db
 # Import new models
 from app.utils.models import (
     ParentInfo, ChildInfo, ParentSubmission,
-    VolunteerInfo, FoundChildInfo, VolunteerSubmission, MatchInfo
+    VolunteerInfo, FoundChildInfo, VolunteerSubmission
 )
 # --- NEW ---
 from app.utils.auth_utils import get_current_user
@@ -12,85 +14,6 @@ from typing import Optional, Dict, Any
 
 router = APIRouter()
 
-# --- Helper Function for Matching Logic ---
-
-def find_and_update_match(
-    new_submission_id: str,
-    new_submission_role: str, # Note: This is "parent" or "volunteer" (singular)
-    new_emb: Optional[list]
-    ) -> Optional[dict]:
-    """
-    Compares a new submission against the *opposite* collection.
-    If a match is found, it updates both records in the database.
-    """
-    if not new_emb:
-        print(f"Submission {new_submission_id} has no embedding, skipping match.")
-        return None
-
-    # Determine search collection and keys
-    if new_submission_role == 'parent':
-        search_collection = 'volunteers' # Plural
-        my_match_key = "volunteer_report_id"
-        their_match_key = "parent_report_id"
-        my_collection_name = 'parents' # Plural
-    else:
-        search_collection = 'parents' # Plural
-        my_match_key = "parent_report_id"
-        their_match_key = "volunteer_report_id"
-        my_collection_name = 'volunteers' # Plural
-        
-    all_candidates = json_db.list_submissions(search_collection)
-    
-    # Filter candidates: must have an embedding and not be matched
-    candidates = []
-    for sub in all_candidates:
-        if sub.get("embedding") is not None:
-            # Check if match object is default/empty
-            match_info = sub.get("match", {})
-            if not match_info.get("parent_report_id") and not match_info.get("volunteer_report_id"):
-                candidates.append(sub)
-
-    if not candidates:
-        print(f"No eligible candidates found in '{search_collection}'.")
-        return None
-        
-    print(f"Comparing against {len(candidates)} candidates from '{search_collection}'...")
-    
-    # Find Best Match
-    best_match_result = recognition.find_best_match(
-        target_emb=new_emb,
-        candidates=candidates
-    )
-
-    if not best_match_result:
-        print("No match found above threshold.")
-        return None
-
-    # --- We Found a Match! ---
-    matched_sub = best_match_result["submission"]
-    matched_id = matched_sub["_id"]
-    similarity = best_match_result["similarity"]
-    
-    print(f"MATCH FOUND! ID: {matched_id} with similarity: {similarity:.2f}")
-    
-    # --- Update Both Records ---
-    # 1. Update the new submission (the one just posted)
-    new_match_info = MatchInfo(
-        **{my_match_key: matched_id, "score": similarity, "confirmed": False}
-    ).model_dump() # Use model_dump() for Pydantic v2
-    
-    json_db.update_submission(new_submission_id, {"match": new_match_info}, my_collection_name)
-
-    # 2. Update the existing submission (the one found in DB)
-    existing_match_info = MatchInfo(
-        **{their_match_key: new_submission_id, "score": similarity, "confirmed": False}
-    ).model_dump()
-    json_db.update_submission(matched_id, {"match": existing_match_info}, search_collection)
-    
-    return best_match_result
-
-
-
 # -----------------------------------------------------------------------
 # --- API ROUTES ---
 
@@ -114,20 +37,40 @@ async def create_report(
     birthmarks: str = Form("[]"), # Expecting a JSON string
     file: UploadFile = File(...)
 ):
+    """
+    Saves a report and acknowledges it right away. Embedding and matching
+    run afterwards on the match job queue (see match_jobs.py); poll
+    GET /api/report/{submission_id}/status for the outcome.
+    """
+    started = time.monotonic()
+    upload = None
     try:
         # --- 0. Get User ID ---
         user_id = current_user.get("_id")
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid user data in token")
+        if role not in match_jobs.ROLE_COLLECTIONS:
+            raise HTTPException(status_code=400, detail="Invalid role specified")
+        if match_jobs.queue_full():
+            raise HTTPException(
+                status_code=503,
+                detail="Face recognition is busy, please retry shortly",
+                headers={"Retry-After": "5"}
+            )
           
-        # --- 1. Read Image Bytes & Generate Embedding ---
-        image_bytes = await file.read()
-        embedding_array = recognition.get_embedding(image_bytes)
-        embedding_list = embedding_array.tolist() if embedding_array is not None else None
+        # --- 1. Stage the Image ---
+        # The upload is streamed to a staging file in chunks (hashed on
+        # the way) instead of being read into memory.
+        try:
+            upload = await uploads.ingest_upload(file)
+        except uploads.UploadTooLarge:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image is too large (max {uploads.MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"
+            )
         
         parsed_birthmarks = json.loads(birthmarks)
         
-        submission_id = None
         collection_name = "" 
         
         # --- 2. Create Submission based on Role ---
@@ -152,10 +95,9 @@ async def create_report(
                     birthmarks=parsed_birthmarks,
                     city=city 
                 ),
-                embedding=embedding_list
+                embedding=None # Filled in by the match job
             )
             submission_data = parent_data.model_dump(by_alias=True)
-            submission_id = json_db.insert_submission(submission_data, collection_name)
         
         elif role == 'volunteer':
             collection_name = "volunteers"
@@ -177,42 +119,69 @@ async def create_report(
                     city_found=city,
                     address_found=address
                 ),
-                embedding=embedding_list
+                embedding=None # Filled in by the match job
             )
             submission_data = volunteer_data.model_dump(by_alias=True)
-            submission_id = json_db.insert_submission(submission_data, collection_name)
         
         else:
             raise HTTPException(status_code=400, detail="Invalid role specified")
 
-        # --- 3. Save Image File using the ID ---
-        image_path = await json_db.save_image_file(file, submission_id)
+        # --- 3. Store the Staged Image, referenced by the ID ---
+        # Content-addressed: a photo uploaded before is stored only once
+        submission_id = submission_data["_id"]
+        image_path = db.store_image_blob(upload.path, upload.digest, upload.extension, submission_id)
+        image_digest = upload.digest
+        upload = None
         
-        # --- 4. Update Submission with Image Path ---
-        json_db.update_submission(submission_id, {"image_path": image_path}, collection_name)
+        # --- 4. Save Submission with Image Path and Job State ---
+        # One write: the record never exists without its image or job
+        submission_data["image_path"] = image_path
+        submission_data["match_job"] = match_jobs.queued_job()
+        try:
+            db.insert_submission(submission_data, collection_name)
+        except Exception:
+            # No record holds the blob: drop this report's reference to it
+            image_variants.release_image(image_path, submission_id)
+            raise
         
-        # --- 5. Run Matching Logic ---
-        match_result = find_and_update_match(
-            new_submission_id=submission_id,
-            new_submission_role=role,
-            new_emb=embedding_list
-        )
+        # --- 5. Queue Embedding + Matching ---
+        match_jobs.enqueue(submission_id, role, digest=image_digest, mark_queued=False)
+        match_jobs.note_ingest(time.monotonic() - started)
 
         # --- 6. Return Response ---
-        if match_result:
-            return {
-                "match_found": True,
-                "submission_id": submission_id,
-                "match_score": match_result["similarity"]
-            }
-        else:
-            return {
-                "match_found": False,
-                "submission_id": submission_id
-            }
+        return {
+            "submission_id": submission_id,
+            "status": match_jobs.QUEUED,
+            "status_url": f"/api/report/{submission_id}/status"
+        }
             
+    except HTTPException:
+        raise # Keep intended status codes (400, 401, 413, 503)
     except Exception as e:
         print(f"Error in create_report: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+    finally:
+        # Staged file of a report that failed before it was moved
+        if upload is not None:
+            uploads.discard(upload.path)
+
+
+@router.get("/report/{submission_id}/status")
+def get_report_status(
+    submission_id: str,
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    Progress of a report's match job: queued -> embedding -> matching ->
+    done (or failed), with match_found / match_score once done.
+    Only the user who submitted the report can see it.
+    """
+    for collection_name in match_jobs.ROLE_COLLECTIONS.values():
+        doc = db.find_submission(submission_id, collection_name)
+        if doc is not None:
+            if doc.get("user_id") != current_user.get("_id"):
+                break
+            return match_jobs.job_status(doc)
+    raise HTTPException(status_code=404, detail="Submission not found")
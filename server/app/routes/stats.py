@@ -0,0 +1,51 @@
+import os
+import sys
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, Depends
+from app.utils import inference, recognition, embedding_cache, auth_utils, match_jobs, match_events
+from app.utils.storage import db
+
+router = APIRouter()
+
+# /api/stats needs a logged-in user unless STATS_PUBLIC=1 (e.g. for a
+# monitoring agent on a private network).
+STATS_PUBLIC = os.getenv("STATS_PUBLIC", "0") == "1"
+
+# Filled in by the startup hook in main.py
+STARTUP_STATS: Dict[str, Any] = {}
+
+def _max_rss_mb() -> Optional[float]:
+    """Peak RSS of this process, or None where `resource` is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux and the BSDs
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+def process_stats() -> Dict[str, Any]:
+    """Startup time and peak RSS of this worker."""
+    return {
+        "startup_seconds": STARTUP_STATS.get("startup_seconds"),
+        "max_rss_mb": _max_rss_mb(),
+        "recognition": recognition.model_status(),
+    }
+
+@router.get("/stats", dependencies=[] if STATS_PUBLIC else [Depends(auth_utils.get_current_user)])
+def get_stats():
+    """
+    Runtime counters for the in-process caches and queues.
+    Useful for checking hit rates and load on a running worker.
+    """
+    return {
+        "process": process_stats(),
+        "storage": db.storage_stats(),
+        "reports": match_jobs.stats(),
+        "match_events": match_events.stats(),
+        "inference_pool": inference.stats(),
+        "password_pool": auth_utils.password_pool_stats(),
+        "token_cache": auth_utils.token_cache_stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "uploads": db.blob_stats(),
+    }
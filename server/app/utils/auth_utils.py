@@ -1,11 +1,15 @@
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, Set
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from app.utils import json_db
+from app.utils.storage import db
+from app.utils.executors import BoundedExecutor, ExecutorSaturated
 from app.utils.models import TokenData, UserDB
 
 # --- Configuration ---
@@ -15,7 +19,38 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 # --- Password Hashing ---
-pwd_context = CryptContext(schemes=["argon2","bcrypt"], deprecated="auto")
+# Argon2 cost parameters. Unset variables keep passlib's defaults
+# (time_cost=3, memory_cost=65536 KiB, parallelism=4 in passlib 1.7.4).
+# Hashes made with other parameters keep verifying and are re-hashed on
+# next login, so only set these when the costs should actually change.
+ARGON2_SETTINGS = {
+    f"argon2__{name}": int(os.environ[env])
+    for name, env in (
+        ("time_cost", "ARGON2_TIME_COST"),
+        ("memory_cost", "ARGON2_MEMORY_COST"), # KiB
+        ("parallelism", "ARGON2_PARALLELISM"),
+    )
+    if os.getenv(env)
+}
+
+pwd_context = CryptContext(
+    schemes=["argon2","bcrypt"],
+    deprecated="auto",
+    **ARGON2_SETTINGS,
+)
+
+# Hashing runs on its own bounded thread pool (argon2 releases the GIL),
+# never on the event loop. Each job holds the argon2 memory cost, so the
+# worker count also caps the memory used by a burst of logins.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+_password_executor = BoundedExecutor(
+    "password",
+    kind="thread",
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_MAX_QUEUE
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Checks if a plain password matches a hashed password."""
@@ -25,6 +60,28 @@ def get_password_hash(password: str) -> str:
     """Generates a hash for a plain password."""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password pool. Raises ExecutorSaturated when it is full."""
+    return await _password_executor.run(pwd_context.verify, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a password on the password pool and, if the stored hash uses
+    outdated parameters or scheme, also returns a fresh hash to save
+    (else None). Raises ExecutorSaturated when the pool is full.
+    """
+    return await _password_executor.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the password pool. Raises ExecutorSaturated when it is full."""
+    return await _password_executor.run(pwd_context.hash, password)
+
+def password_pool_stats() -> Dict[str, Any]:
+    return _password_executor.stats()
+
+def shutdown():
+    _password_executor.shutdown()
+
 # --- JWT Token Creation ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Creates a new JWT access token."""
@@ -44,13 +101,86 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 def get_user_from_db(username: str) -> Optional[Dict[str, Any]]:
     """Fetches a user from the users.json file by username."""
     # Note: Our login uses identifier, but token stores username
-    return json_db.find_user_by_identifier(username)
+    return db.find_user_by_identifier(username)
+
+# --- Verified-Token Cache ---
+# token -> (expires_at, user record) for tokens verified recently, so
+# repeat requests skip jwt.decode and the user lookup. Entries are
+# dropped when the user's record changes (see _on_user_update), and live
+# at most TOKEN_CACHE_TTL seconds, which bounds how long a change made
+# by another worker process can go unnoticed.
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+_token_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_tokens_by_user: Dict[str, Set[str]] = {}
+_token_cache_lock = threading.Lock()
+_token_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def _drop_token(token: str):
+    """Caller holds _token_cache_lock."""
+    entry = _token_cache.pop(token, None)
+    if entry is not None:
+        tokens = _tokens_by_user.get(entry[1]["_id"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del _tokens_by_user[entry[1]["_id"]]
+
+def _cached_user(token: str) -> Optional[Dict[str, Any]]:
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                _drop_token(token)
+            _token_cache_stats["misses"] += 1
+            return None
+        _token_cache.move_to_end(token)
+        _token_cache_stats["hits"] += 1
+        return dict(entry[1])
+
+def _cache_user(token: str, user: Dict[str, Any], token_exp: Optional[float]):
+    if TOKEN_CACHE_SIZE <= 0 or not user.get("_id"):
+        return
+    ttl = TOKEN_CACHE_TTL
+    if token_exp is not None:
+        ttl = min(ttl, token_exp - time.time()) # Never outlive the token itself
+    with _token_cache_lock:
+        _drop_token(token)
+        _token_cache[token] = (time.monotonic() + ttl, dict(user))
+        _tokens_by_user.setdefault(user["_id"], set()).add(token)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _drop_token(next(iter(_token_cache)))
+
+def _on_user_update(user_id: str, updates: Dict[str, Any]):
+    """Drops every cached token of a user whose record changed."""
+    with _token_cache_lock:
+        for token in list(_tokens_by_user.get(user_id, ())):
+            _drop_token(token)
+            _token_cache_stats["invalidations"] += 1
+
+db.add_update_listener("users", _on_user_update)
+
+def token_cache_stats() -> Dict[str, Any]:
+    with _token_cache_lock:
+        return {**_token_cache_stats, "entries": len(_token_cache), "max_entries": TOKEN_CACHE_SIZE}
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
     """
     FastAPI Dependency to get the current user from a token.
     This function is used to protect routes.
     """
+    return await get_user_from_token(token)
+
+async def get_user_from_token(token: str) -> Dict[str, Any]:
+    """
+    Resolves a raw access token to its user, raising 401 if invalid.
+    For routes that cannot take an Authorization header (EventSource).
+    """
+    cached = _cached_user(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,6 +198,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict[str, Any
     user = get_user_from_db(username=token_data.username)
     if user is None:
         raise credentials_exception
+
+    _cache_user(token, user, payload.get("exp"))
     
     # Return the user as a dictionary
     return user
\ No newline at end of file
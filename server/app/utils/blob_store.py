@@ -0,0 +1,109 @@
+# app/utils/blob_store.py
+import os
+from typing import Dict, Any, List, Optional
+from app.utils.log_store import LogStore
+from app.utils.file_lock import FileLock
+
+
+class BlobStore:
+    """
+    Content-addressed file storage with reference counts.
+
+    A file is stored once under its sha256 digest, in two levels of
+    hash-prefix subdirectories (root/ab/cd/abcd....jpg), so no directory
+    grows past a few thousand entries and identical uploads share one
+    file. A small log (log_store.py) records for each digest its
+    extension, size and the ids referencing it; a blob whose last
+    reference is released is deleted. Reference changes happen under a
+    file lock after reading other processes' log entries, so server
+    processes sharing the store keep the same counts.
+    """
+
+    def __init__(self, root: str, index_path: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = FileLock(index_path + ".lock")
+        with self._lock:
+            self._index = LogStore(index_path)
+            self._blobs: Dict[str, Dict[str, Any]] = {doc["_id"]: doc for doc in self._index.iter_docs()}
+
+    def _refresh(self):
+        """Applies index entries written by other processes. Caller holds the lock."""
+        entries = self._index.catch_up()
+        if entries is None:
+            self._index.reopen() # Compacted elsewhere
+            self._blobs = {doc["_id"]: doc for doc in self._index.iter_docs()}
+            return
+        for entry in entries:
+            if entry.get("op") == "put":
+                self._blobs[entry["doc"]["_id"]] = entry["doc"]
+            elif entry.get("op") == "update" and entry["_id"] in self._blobs:
+                self._blobs[entry["_id"]].update(entry["set"])
+
+    def relative_path(self, digest: str, extension: str) -> str:
+        """Path of a blob relative to the store root, e.g. 'ab/cd/abcd....jpg'."""
+        return os.path.join(digest[:2], digest[2:4], digest + extension)
+
+    def put_file(self, staged_path: str, digest: str, extension: str, ref: str) -> str:
+        """
+        Stores a staged file under its digest and records `ref` as a holder.
+        The staged file is moved into place, or deleted if the content is
+        already stored. Returns the blob's path relative to the root.
+        """
+        extension = (extension or "").lower()
+        with self._lock:
+            self._refresh()
+            blob = self._blobs.get(digest)
+            if blob is not None and blob["refs"]:
+                os.remove(staged_path) # Duplicate content: keep the stored copy
+                if ref not in blob["refs"]:
+                    blob["refs"] = blob["refs"] + [ref]
+                    self._index.update(digest, {"refs": blob["refs"]})
+                return self.relative_path(digest, blob["ext"])
+
+            relative = self.relative_path(digest, extension)
+            path = os.path.join(self.root, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged_path, path)
+            blob = {"_id": digest, "ext": extension, "size": os.path.getsize(path), "refs": [ref]}
+            self._index.put(blob)
+            self._blobs[digest] = blob
+            return relative
+
+    def release(self, digest: str, ref: str) -> bool:
+        """Drops one reference; deletes the file with the last one. Returns True if deleted."""
+        with self._lock:
+            self._refresh()
+            blob = self._blobs.get(digest)
+            if blob is None or ref not in blob["refs"]:
+                return False
+            blob["refs"] = [r for r in blob["refs"] if r != ref]
+            self._index.update(digest, {"refs": blob["refs"]})
+            if blob["refs"]:
+                return False
+            path = os.path.join(self.root, self.relative_path(digest, blob["ext"]))
+            if os.path.exists(path):
+                os.remove(path)
+            return True
+
+    def refs(self, digest: str) -> List[str]:
+        with self._lock:
+            self._refresh()
+            blob = self._blobs.get(digest)
+            return list(blob["refs"]) if blob else []
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._refresh()
+            live = [blob for blob in self._blobs.values() if blob["refs"]]
+            return {
+                "blobs": len(live),
+                "references": sum(len(blob["refs"]) for blob in live),
+                "bytes": sum(blob["size"] for blob in live),
+            }
+
+
+def digest_from_path(path: str) -> Optional[str]:
+    """The digest a blob path was stored under (its file name without extension)."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name if len(name) == 64 else None
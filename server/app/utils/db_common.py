@@ -0,0 +1,81 @@
+# app/utils/db_common.py
+import os
+import threading
+from typing import Dict, Any, Optional
+from app.utils.blob_store import BlobStore, digest_from_path
+
+# --- Configuration ---
+# Shared by both storage backends (json_db, sqlite_db), so neither has to
+# import the other.
+DB_DIR = "app/db"
+UPLOADS_DIR = "app/uploads"
+
+os.makedirs(DB_DIR, exist_ok=True)
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+# Values are unique across all listed fields, because
+# find_user_by_identifier matches an identifier against any of them.
+UNIQUE_FIELDS = {
+    "users": ("username", "email", "phone"),
+}
+
+class DuplicateKeyError(ValueError):
+    """Raised when a write would reuse a value held unique by another record."""
+    def __init__(self, collection_name: str, field: str, value: Any):
+        super().__init__(f"Duplicate {field} '{value}' in '{collection_name}'")
+        self.field = field
+        self.value = value
+
+def copy_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copies a document deep enough that callers can mutate nested
+    dicts/lists (e.g. report["match"]["confirmed"] = True) without
+    corrupting the cache.
+    """
+    return {
+        key: dict(value) if isinstance(value, dict) else list(value) if isinstance(value, list) else value
+        for key, value in doc.items()
+    }
+
+# --- Image Blob Store ---
+# Uploads are stored content-addressed (see blob_store.py) under
+# app/uploads/blobs/ab/cd/<sha256>.<ext>, still served by the /uploads
+# static mount, whatever backend stores the records. Each blob records
+# the submission ids that reference it.
+BLOBS_DIR = os.path.join(UPLOADS_DIR, "blobs")
+BLOBS_INDEX_PATH = os.path.join(DB_DIR, "blobs.jsonl")
+_blob_store: Optional[BlobStore] = None
+_blob_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore(BLOBS_DIR, BLOBS_INDEX_PATH)
+        return _blob_store
+
+def store_image_blob(staged_path: str, digest: str, extension: str, submission_id: str) -> str:
+    """
+    Stores an upload staged by uploads.ingest_upload (moved, not copied;
+    dropped if the same photo is already stored) and references it from
+    `submission_id`. Returns the web-accessible image_path.
+    """
+    relative = get_blob_store().put_file(staged_path, digest, extension, submission_id)
+    return "/uploads/blobs/" + relative.replace(os.sep, "/")
+
+def release_image_blob(image_path: str, submission_id: str) -> bool:
+    """Drops a submission's reference to its image; True if the file was deleted."""
+    digest = digest_from_path(image_path or "")
+    if digest is None or not image_path.startswith("/uploads/blobs/"):
+        return False
+    return get_blob_store().release(digest, submission_id)
+
+def resolve_image_path(image_path: str) -> Optional[str]:
+    """Filesystem path of an image_path ('/uploads/...'), or None if missing."""
+    if not image_path or not image_path.startswith("/uploads/"):
+        return None
+    path = os.path.join(UPLOADS_DIR, *image_path[len("/uploads/"):].split("/"))
+    return path if os.path.isfile(path) else None
+
+def blob_stats() -> Dict[str, int]:
+    return get_blob_store().stats()
@@ -0,0 +1,192 @@
+# app/utils/embedding_cache.py
+import hashlib
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from app.utils import recognition
+from app.utils.embedding_index import EMBEDDING_DIM
+from app.utils.embedding_store import EmbeddingStore
+from app.utils.log_store import LogStore
+from app.utils.file_lock import FileLock
+
+# --- Configuration ---
+# Embeddings kept in memory (LRU). 0 disables the cache entirely.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+# Persist every computed embedding under app/db so repeat uploads hit
+# after a restart, and in other workers once they reopen the files.
+EMBEDDING_CACHE_DISK = os.getenv("EMBEDDING_CACHE_DISK", "1") == "1"
+# Entries are keyed by the exact content only. Matching re-encoded copies
+# by a perceptual hash is not offered: a different photo can share the
+# hash, and would then be served another person's embedding.
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "app/db")
+
+
+def model_tag() -> str:
+    """
+    Identifies the inference path that produced an embedding, so entries
+    from e.g. a quantized model, another decode size, or the older crop
+    from the capped decode or another crop scale, are not served to the
+    fp32 one.
+    """
+    optimizations = ",".join(sorted(recognition.RECOGNITION_OPTIMIZE)) or "fp32"
+    return (
+        f"{optimizations}@{recognition.RECOGNITION_MAX_SIDE}/{recognition.RECOGNITION_DETECT_SIDE}"
+        f"/crop{recognition.CROP_FACE_SIDE}-{recognition.RECOGNITION_CROP_MAX_SIDE}"
+    )
+
+
+def content_digest(source: recognition.ImageSource) -> str:
+    """sha256 of image bytes, or of a file's content read in chunks."""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of face embeddings keyed by image content.
+
+    The memory tier is an LRU of the most recent EMBEDDING_CACHE_SIZE
+    results. The disk tier stores each embedding once in a binary
+    sidecar (embedding_store.py) and a small key log (log_store.py)
+    mapping digest -> row; only the key table is resident. "No face
+    found" is cached too, as a None embedding.
+    """
+
+    def __init__(self, max_entries: int, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.tag = model_tag()
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Optional[np.ndarray]]" = OrderedDict()
+        self._rows: Dict[str, Optional[int]] = {}   # digest -> sidecar row (None = no face)
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._keys: Optional[LogStore] = None
+        self._vectors: Optional[EmbeddingStore] = None
+        # Server processes sharing the directory append under this lock
+        self._disk_lock: Optional[FileLock] = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_lock = FileLock(os.path.join(directory, "embedding_cache.lock"))
+            with self._disk_lock:
+                self._keys = LogStore(os.path.join(directory, "embedding_cache.jsonl"))
+                self._vectors = EmbeddingStore(os.path.join(directory, "embedding_cache.emb"), dim=EMBEDDING_DIM)
+                self._absorb(self._keys.iter_docs())
+            print(f"Embedding cache: {len(self._rows)} entries on disk for model '{self.tag}'.")
+
+    def _absorb(self, docs):
+        """Learns disk entries (at open, or added by other processes). Caller holds the lock."""
+        for doc in docs:
+            if doc.get("model") == self.tag:
+                self._rows[doc["_id"]] = doc.get("row")
+
+    def _catch_up(self, reopen: bool = False):
+        """
+        Picks up entries other processes added since we last looked.
+        Caller holds the lock; with reopen=True also the disk lock, so a
+        file compacted by another process can be reopened.
+        """
+        if self._keys is None:
+            return
+        entries = self._keys.catch_up()
+        if entries is None:
+            if reopen:
+                self._keys.reopen()
+                self._absorb(self._keys.iter_docs())
+            return
+        self._absorb(entry["doc"] for entry in entries if entry.get("op") == "put")
+
+    def _remember(self, digest: str, embedding: Optional[np.ndarray]):
+        self._lru[digest] = embedding
+        self._lru.move_to_end(digest)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _load(self, digest: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """Memory tier, then disk tier. Caller holds the lock."""
+        if digest in self._lru:
+            self._lru.move_to_end(digest)
+            self._stats["memory_hits"] += 1
+            return True, self._lru[digest]
+        if digest in self._rows:
+            row = self._rows[digest]
+            embedding = self._vectors.get(row) if row is not None else None
+            if row is not None and embedding is None:
+                del self._rows[digest] # Row lost (sidecar truncated); recompute
+                return False, None
+            self._remember(digest, embedding)
+            self._stats["disk_hits"] += 1
+            return True, embedding
+        return False, None
+
+    def get(self, digest: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Looks up an image by its content digest. Returns (hit, embedding);
+        a hit may carry a None embedding. On a miss, put() the embedding
+        once it is computed.
+        """
+        with self._lock:
+            hit, embedding = self._load(digest)
+            if not hit and self._keys is not None:
+                # Maybe embedded meanwhile by another server process
+                self._catch_up()
+                hit, embedding = self._load(digest)
+            if not hit:
+                self._stats["misses"] += 1
+        return hit, embedding
+
+    def put(self, digest: str, embedding: Optional[np.ndarray]):
+        """Stores a freshly computed embedding (or None for 'no face')."""
+        with self._lock:
+            if digest in self._rows or digest in self._lru:
+                return
+            self._remember(digest, embedding)
+            if self._keys is None:
+                return
+            with self._disk_lock:
+                self._catch_up(reopen=True)
+                if digest in self._rows:
+                    return # Another process stored it first
+                row = self._vectors.append(embedding) if embedding is not None else None
+                # Sidecar row first, then the key entry that points at it
+                self._keys.put({"_id": digest, "row": row, "model": self.tag})
+                self._rows[digest] = row
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"] or 1
+            return {
+                **self._stats,
+                "hit_rate": hits / lookups,
+                "memory_entries": len(self._lru),
+                "disk_entries": len(self._rows),
+                "max_entries": self.max_entries,
+                "model": self.tag,
+            }
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """The process-wide cache, opened on first use; None when disabled."""
+    global _cache
+    if EMBEDDING_CACHE_SIZE <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                max_entries=EMBEDDING_CACHE_SIZE,
+                directory=EMBEDDING_CACHE_DIR if EMBEDDING_CACHE_DISK else None
+            )
+        return _cache
+
+def stats() -> Dict[str, Any]:
+    cache = _cache
+    return cache.stats() if cache is not None else {"enabled": EMBEDDING_CACHE_SIZE > 0}
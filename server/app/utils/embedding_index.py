@@ -0,0 +1,600 @@
+# app/utils/embedding_index.py
+import os
+import re
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Union, Set
+from app.utils.embedding_store import MemoryEmbeddingStore
+
+# Facenet (InceptionResnetV1) embeddings are 512-dimensional
+EMBEDDING_DIM = 512
+
+# Only these collections carry face embeddings worth indexing
+INDEXED_COLLECTIONS = ("parents", "volunteers")
+
+# --- Backend Configuration ---
+# "flat" scans every row exactly. "ivf" clusters rows into IVF_NLIST
+# coarse cells and only scans the IVF_NPROBE cells nearest the query:
+# raise IVF_NPROBE for recall, lower it for latency.
+INDEX_BACKEND = os.getenv("EMBEDDING_INDEX_BACKEND", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "256"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# Number of k-means iterations used when (re)training the coarse quantizer
+IVF_TRAIN_ITERATIONS = 20
+
+
+def is_open_for_matching(doc: Dict[str, Any]) -> bool:
+    """A submission can be matched while neither side of its MatchInfo is set."""
+    match_info = doc.get("match") or {}
+    return not match_info.get("parent_report_id") and not match_info.get("volunteer_report_id")
+
+
+# --- Attribute Pre-Filter ---
+# Optional stage before the face-distance scan (MATCH_PREFILTER=1): the
+# index also keeps inverted lists of each report's normalized city and
+# age bucket, and a match search first scans only the rows in the new
+# report's city and nearby age buckets. find_and_update_match falls
+# back to the full scan when those rows yield no match.
+MATCH_PREFILTER = os.getenv("MATCH_PREFILTER", "0") == "1"
+# Ages are bucketed by this many years. A query accepts every bucket
+# that overlaps [age - MATCH_AGE_TOLERANCE, age + MATCH_AGE_TOLERANCE].
+MATCH_AGE_BUCKET_YEARS = max(1, int(os.getenv("MATCH_AGE_BUCKET_YEARS", "2")))
+MATCH_AGE_TOLERANCE = int(os.getenv("MATCH_AGE_TOLERANCE", "2"))
+# Also require the same skin tone. Off by default: it is free text, and
+# the same child is easily described differently by parent and finder.
+MATCH_FILTER_SKIN = os.getenv("MATCH_FILTER_SKIN", "0") == "1"
+
+
+def normalize_text(value: Any) -> Optional[str]:
+    """Case-folded, punctuation-free, single-spaced text ("New  Delhi." -> "new delhi")."""
+    if not isinstance(value, str):
+        return None
+    text = " ".join(re.sub(r"[^\w]+", " ", value.casefold()).split())
+    return text or None
+
+
+def _child_info(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Parents describe the missing child, volunteers the child they found
+    return doc.get("child_entered") or doc.get("found_child") or {}
+
+
+def _age_of(info: Dict[str, Any]) -> Optional[int]:
+    age = info.get("age", info.get("approx_age"))
+    try:
+        return int(age) if age is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def report_attributes(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Pre-filter keys of a stored report: {"city", "age_bucket", "skin"} (missing ones left out)."""
+    info = _child_info(doc)
+    age = _age_of(info)
+    attributes = {
+        "city": normalize_text(info.get("city", info.get("city_found"))),
+        "age_bucket": age // MATCH_AGE_BUCKET_YEARS if age is not None else None,
+        "skin": normalize_text(info.get("skin")),
+    }
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+def prefilter_query(doc: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """
+    Accepted values per attribute for candidates of the report `doc`.
+    Attributes the report does not have are not filtered on; an empty
+    query means there is nothing to pre-filter by.
+    """
+    attributes = report_attributes(doc)
+    query: Dict[str, List[Any]] = {}
+    if "city" in attributes:
+        query["city"] = [attributes["city"]]
+    age = _age_of(_child_info(doc))
+    if age is not None:
+        low = max(0, age - MATCH_AGE_TOLERANCE) // MATCH_AGE_BUCKET_YEARS
+        high = (age + MATCH_AGE_TOLERANCE) // MATCH_AGE_BUCKET_YEARS
+        query["age_bucket"] = list(range(low, high + 1))
+    if MATCH_FILTER_SKIN and "skin" in attributes:
+        query["skin"] = [attributes["skin"]]
+    return query
+
+
+# Rows scored per matrix product during a flat scan; bounds the
+# temporary memory of a search over a large (memory-mapped) matrix.
+SCAN_CHUNK_ROWS = 65536
+
+
+class EmbeddingIndex:
+    """
+    Resident embedding index for one collection.
+
+    Vectors live in a row store: either an in-memory matrix owned by the
+    index, or the collection's memory-mapped sidecar file (see
+    embedding_store.py), in which case the index never copies them.
+    Alongside the store the index keeps, per row, the owning submission
+    id, its squared norm and whether it is still unmatched (`open`), so
+    a search is one vectorized distance computation over the matrix
+    with closed and superseded rows masked out.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, store=None):
+        self.dim = dim
+        self.store = store if store is not None else MemoryEmbeddingStore(dim)
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+        self._open = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = [] # Row -> submission id (None if unused)
+        self._row_of: Dict[str, int] = {}
+        # Pre-filter inverted lists: attribute -> value -> submission ids
+        self._by_attribute: Dict[str, Dict[Any, Set[str]]] = {}
+        self._attributes_of: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    # --- Maintenance ---
+
+    def _grow(self, needed: int):
+        """Doubles the per-row arrays so appends stay amortized O(1)."""
+        capacity = self._sq_norms.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 64)
+        sq_norms = np.zeros(new_capacity, dtype=np.float32)
+        sq_norms[:capacity] = self._sq_norms
+        open_mask = np.zeros(new_capacity, dtype=bool)
+        open_mask[:capacity] = self._open
+        self._sq_norms, self._open = sq_norms, open_mask
+        self._ids.extend([None] * (new_capacity - len(self._ids)))
+
+    def _row_vector(self, row: int) -> np.ndarray:
+        return np.asarray(self.store.matrix()[row], dtype=np.float32)
+
+    def _attach(self, doc_id: str, row: int, is_open: bool, compute_norm: bool = True):
+        """Points `doc_id` at `row`, releasing the row it used before."""
+        old_row = self._row_of.get(doc_id)
+        if old_row is not None and old_row != row:
+            self._ids[old_row] = None
+            self._open[old_row] = False
+        self._grow(row + 1)
+        self._ids[row] = doc_id
+        self._row_of[doc_id] = row
+        self._open[row] = is_open
+        if compute_norm:
+            vec = self._row_vector(row)
+            self._sq_norms[row] = float(vec @ vec)
+
+    def _detach(self, doc_id: str):
+        row = self._row_of.pop(doc_id, None)
+        if row is not None:
+            self._ids[row] = None
+            self._open[row] = False
+        self._set_attributes(doc_id, {})
+
+    def _set_attributes(self, doc_id: str, attributes: Dict[str, Any]):
+        """Moves `doc_id` to the inverted lists of its current attributes."""
+        for key, value in self._attributes_of.pop(doc_id, {}).items():
+            ids = self._by_attribute[key][value]
+            ids.discard(doc_id)
+            if not ids:
+                del self._by_attribute[key][value]
+        for key, value in attributes.items():
+            self._by_attribute.setdefault(key, {}).setdefault(value, set()).add(doc_id)
+        if attributes:
+            self._attributes_of[doc_id] = attributes
+
+    def upsert(self, doc_id: str, embedding: Union[np.ndarray, List[float]], is_open: bool = True):
+        """Adds or replaces the embedding vector for a submission."""
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vec.shape[0] != self.dim:
+            print(f"Warning: Skipping embedding for {doc_id} with shape {vec.shape}")
+            return
+        with self._lock:
+            row = self._row_of.get(doc_id)
+            if row is not None and self.store.mutable:
+                self.store.write(row, vec)
+            else:
+                row = self.store.append(vec)
+            self._attach(doc_id, row, is_open)
+
+    def upsert_row(self, doc_id: str, row: int, is_open: bool = True):
+        """Points a submission at an existing row of the backing store."""
+        with self._lock:
+            if row >= self.store.n_rows:
+                self.store.refresh()
+            if row >= self.store.n_rows:
+                print(f"Warning: Embedding row {row} for {doc_id} is missing from the store")
+                return
+            self._attach(doc_id, row, is_open)
+
+    def set_open(self, doc_id: str, is_open: bool):
+        """Marks a submission as matchable (or not) without touching its row."""
+        with self._lock:
+            row = self._row_of.get(doc_id)
+            if row is not None:
+                self._open[row] = is_open
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._detach(doc_id)
+
+    def sync_document(self, doc: Dict[str, Any]):
+        """Brings the index in line with the current state of one stored document."""
+        doc_id = doc.get("_id")
+        if not doc_id:
+            return
+        with self._lock:
+            if doc.get("embedding_row") is not None:
+                self.upsert_row(doc_id, doc["embedding_row"], is_open_for_matching(doc))
+            elif doc.get("embedding") is not None:
+                self.upsert(doc_id, doc["embedding"], is_open_for_matching(doc))
+            else:
+                self.remove(doc_id)
+                return
+            if doc_id in self._row_of:
+                self._set_attributes(doc_id, report_attributes(doc))
+
+    def rebuild(self, docs: List[Dict[str, Any]]):
+        """Replaces the whole index with the embeddings found in `docs`."""
+        with self._lock:
+            self._reset()
+            if self.store.mutable:
+                # Rows owned by the index: re-added from the docs below
+                self.store.clear()
+            self.store.refresh()
+            inline = []
+            for doc in docs:
+                doc_id = doc.get("_id")
+                row = doc.get("embedding_row")
+                if not doc_id:
+                    continue
+                if row is not None and row < self.store.n_rows:
+                    # Norms are filled in below in one vectorized pass
+                    self._attach(doc_id, row, is_open_for_matching(doc), compute_norm=False)
+                    self._set_attributes(doc_id, report_attributes(doc))
+                elif doc.get("embedding") is not None:
+                    inline.append(doc)
+            # The store may hold rows no doc points at (yet), e.g. ones
+            # another process appended before committing its record
+            n = self.store.n_rows
+            self._grow(n)
+            matrix = self.store.matrix()
+            for start in range(0, n, SCAN_CHUNK_ROWS):
+                chunk = np.asarray(matrix[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+                self._sq_norms[start:start + chunk.shape[0]] = np.einsum("ij,ij->i", chunk, chunk)
+            for doc in inline:
+                self.sync_document(doc)
+            self.loaded = True
+
+    # --- Query ---
+
+    def _live_rows(self) -> np.ndarray:
+        return np.fromiter(self._row_of.values(), dtype=np.int64, count=len(self._row_of))
+
+    def filter_rows(self, query: Dict[str, List[Any]]) -> np.ndarray:
+        """
+        Rows whose report has, for every attribute in `query`, one of the
+        listed values (see prefilter_query). Only the matching inverted
+        lists are touched, not the whole collection.
+        """
+        with self._lock:
+            ids: Optional[Set[str]] = None
+            for key, values in query.items():
+                lists = self._by_attribute.get(key, {})
+                matched = set().union(*(lists.get(value, ()) for value in values))
+                ids = matched if ids is None else ids & matched
+                if not ids:
+                    break
+            rows = [self._row_of[doc_id] for doc_id in ids or () if doc_id in self._row_of]
+            return np.asarray(sorted(rows), dtype=np.int64)
+
+    def search(
+        self,
+        target_emb: Union[np.ndarray, List[float]],
+        k: int = 1,
+        only_open: bool = True,
+        nprobe: Optional[int] = None,
+        rows: Optional[np.ndarray] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns up to `k` (submission_id, L2 distance) pairs, nearest first.
+        `nprobe` only applies to approximate backends; the flat scan is exact.
+        `rows` (from filter_rows) limits the search to those rows, scanned
+        exactly whatever the backend.
+        """
+        target = np.asarray(target_emb, dtype=np.float32).reshape(-1)
+        if target.shape[0] != self.dim:
+            print(f"Warning: Embedding shape mismatch. {target.shape} vs ({self.dim},)")
+            return []
+
+        with self._lock:
+            if rows is not None:
+                return self._search_rows(rows, target, k, only_open)
+            n = min(self.store.n_rows, self._sq_norms.shape[0])
+            if n == 0 or not self._row_of:
+                return []
+            matrix = self.store.matrix()
+            if only_open:
+                usable = self._open[:n]
+            else:
+                usable = np.zeros(n, dtype=bool)
+                usable[self._live_rows()] = True
+            t_sq = float(target @ target)
+
+            best_rows = np.empty(0, dtype=np.int64)
+            best_d = np.empty(0, dtype=np.float32)
+            for start in range(0, n, SCAN_CHUNK_ROWS):
+                end = min(n, start + SCAN_CHUNK_ROWS)
+                # ||a - b||^2 = ||a||^2 - 2 a.b + ||b||^2, one GEMV per chunk
+                sq_dists = self._sq_norms[start:end] - 2.0 * (matrix[start:end] @ target) + t_sq
+                sq_dists = np.where(usable[start:end], sq_dists, np.inf)
+                kk = min(k, end - start)
+                top = np.argpartition(sq_dists, kk - 1)[:kk]
+                best_rows = np.concatenate([best_rows, top + start])
+                best_d = np.concatenate([best_d, sq_dists[top]])
+
+            finite = np.isfinite(best_d)
+            best_rows, best_d = best_rows[finite], best_d[finite]
+            if best_rows.size == 0:
+                return []
+            if best_rows.size > k:
+                keep = np.argpartition(best_d, k - 1)[:k]
+                best_rows = best_rows[keep]
+
+            # Re-rank the shortlist with exact differences to avoid
+            # cancellation error from the expanded form above
+            return self._rank_exact(best_rows, target, k)
+
+    def _search_rows(self, rows: np.ndarray, target: np.ndarray, k: int, only_open: bool) -> List[Tuple[str, float]]:
+        """Exact search over a subset of rows, SCAN_CHUNK_ROWS at a time."""
+        if only_open:
+            rows = rows[self._open[rows]]
+        best: List[Tuple[str, float]] = []
+        for start in range(0, rows.size, SCAN_CHUNK_ROWS):
+            best.extend(self._rank_exact(rows[start:start + SCAN_CHUNK_ROWS], target, k))
+            best = sorted(best, key=lambda pair: pair[1])[:k]
+        return best
+
+    def _rank_exact(self, rows: np.ndarray, target: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        rows = np.sort(rows) # Sequential reads from a mapped file
+        vectors = np.asarray(self.store.matrix()[rows], dtype=np.float32)
+        exact = np.linalg.norm(vectors - target, axis=1)
+        k = min(k, rows.size)
+        top = np.argpartition(exact, k - 1)[:k]
+        top = top[np.argsort(exact[top])]
+        return [(self._ids[rows[i]], float(exact[i])) for i in top]
+
+
+class IVFIndex(EmbeddingIndex):
+    """
+    Approximate index: an inverted file over k-means coarse clusters.
+
+    Rows are stored exactly as in EmbeddingIndex, but each row is also
+    assigned to its nearest centroid. A query ranks the centroids, scans
+    only the rows of the `nprobe` closest cells and re-ranks that
+    shortlist with exact L2 distances. Until enough rows exist to train
+    the quantizer, searches fall back to the exact flat scan.
+
+    Only the trained centroids are persisted: they are the expensive
+    part, and row assignments are recomputed in bulk on rebuild.
+    """
+
+    def __init__(
+        self,
+        dim: int = EMBEDDING_DIM,
+        nlist: int = IVF_NLIST,
+        nprobe: int = IVF_NPROBE,
+        persist_path: Optional[str] = None,
+        store=None
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.persist_path = persist_path
+        self.centroids: Optional[np.ndarray] = None
+        self._cells: List[Dict[str, None]] = []
+        self._cell_of: Dict[str, int] = {}
+        super().__init__(dim, store=store)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    # --- Quantizer ---
+
+    def _nearest_cells(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest centroid for each row of `vectors`, computed in chunks."""
+        c_sq = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        out = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], 8192):
+            chunk = np.asarray(vectors[start:start + 8192], dtype=np.float32)
+            scores = c_sq[None, :] - 2.0 * (chunk @ self.centroids.T)
+            out[start:start + 8192] = np.argmin(scores, axis=1)
+        return out
+
+    def _assign_all(self):
+        """(Re)builds every inverted list from the current rows."""
+        self._cells = [dict() for _ in range(self.centroids.shape[0])]
+        self._cell_of = {}
+        if not self._row_of:
+            return
+        doc_ids = list(self._row_of.keys())
+        rows = np.fromiter(self._row_of.values(), dtype=np.int64, count=len(doc_ids))
+        order = np.argsort(rows) # Sequential reads from a mapped file
+        cells = self._nearest_cells(self.store.matrix()[rows[order]])
+        for i, cell in zip(order, cells):
+            self._cells[cell][doc_ids[i]] = None
+            self._cell_of[doc_ids[i]] = int(cell)
+
+    def train(self, seed: int = 0):
+        """Runs k-means over the current rows and reassigns them to cells."""
+        with self._lock:
+            live_rows = self._live_rows()
+            n = live_rows.size
+            nlist = min(self.nlist, n)
+            if nlist == 0:
+                return
+            rng = np.random.default_rng(seed)
+            # Train on a bounded sample so retraining stays cheap
+            sample_rows = np.sort(rng.choice(live_rows, size=min(n, nlist * 256), replace=False))
+            sample = np.asarray(self.store.matrix()[sample_rows], dtype=np.float32)
+            centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+
+            for _ in range(IVF_TRAIN_ITERATIONS):
+                self.centroids = centroids
+                labels = self._nearest_cells(sample)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                counts = np.bincount(labels, minlength=nlist)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+
+            self.centroids = centroids.astype(np.float32)
+            self._assign_all()
+            print(f"Trained IVF index: {nlist} cells over {n} rows.")
+        self.save()
+
+    def save(self):
+        """Persists the trained quantizer to `persist_path`, if set."""
+        if not self.persist_path or not self.trained:
+            return
+        tmp_path = self.persist_path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self) -> bool:
+        """Loads a previously trained quantizer from `persist_path`."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return False
+        try:
+            with np.load(self.persist_path) as data:
+                centroids = data["centroids"].astype(np.float32)
+        except Exception as e:
+            print(f"Warning: Could not load IVF quantizer {self.persist_path}: {e}")
+            return False
+        if centroids.ndim != 2 or centroids.shape[1] != self.dim:
+            return False
+        self.centroids = centroids
+        return True
+
+    # --- Maintenance ---
+
+    def _attach(self, doc_id: str, row: int, is_open: bool, compute_norm: bool = True):
+        super()._attach(doc_id, row, is_open, compute_norm)
+        if not self.loaded:
+            return # rebuild() assigns every row in bulk
+        if not self.trained:
+            if len(self._row_of) >= self.nlist * 39:
+                self.train()
+            return
+        cell = int(self._nearest_cells(self._row_vector(row)[None, :])[0])
+        old_cell = self._cell_of.get(doc_id)
+        if old_cell != cell:
+            if old_cell is not None:
+                self._cells[old_cell].pop(doc_id, None)
+            self._cells[cell][doc_id] = None
+            self._cell_of[doc_id] = cell
+
+    def _detach(self, doc_id: str):
+        super()._detach(doc_id)
+        cell = self._cell_of.pop(doc_id, None)
+        if cell is not None:
+            self._cells[cell].pop(doc_id, None)
+
+    def rebuild(self, docs: List[Dict[str, Any]]):
+        with self._lock:
+            # Bulk-load exactly, then assign all rows to cells in one pass
+            if self.centroids is None:
+                self.load()
+            self.loaded = False
+            super().rebuild(docs)
+            if self.trained:
+                self._assign_all()
+            elif len(self._row_of) >= self.nlist * 39:
+                # Enough rows for a stable clustering (same rule of thumb as faiss)
+                self.train()
+            else:
+                print(f"IVF index has {len(self._row_of)} rows; using exact search until {self.nlist * 39}.")
+
+    # --- Query ---
+
+    def search(
+        self,
+        target_emb: Union[np.ndarray, List[float]],
+        k: int = 1,
+        only_open: bool = True,
+        nprobe: Optional[int] = None,
+        rows: Optional[np.ndarray] = None
+    ) -> List[Tuple[str, float]]:
+        if not self.trained or rows is not None:
+            # A pre-filtered subset is small enough to scan exactly
+            return super().search(target_emb, k=k, only_open=only_open, rows=rows)
+
+        target = np.asarray(target_emb, dtype=np.float32).reshape(-1)
+        if target.shape[0] != self.dim:
+            print(f"Warning: Embedding shape mismatch. {target.shape} vs ({self.dim},)")
+            return []
+
+        with self._lock:
+            nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+            cell_dists = np.linalg.norm(self.centroids - target, axis=1)
+            probe = np.argpartition(cell_dists, nprobe - 1)[:nprobe]
+
+            rows = [self._row_of[doc_id] for cell in probe for doc_id in self._cells[cell]]
+            if not rows:
+                return []
+            rows = np.asarray(rows, dtype=np.int64)
+            if only_open:
+                rows = rows[self._open[rows]]
+            if rows.size == 0:
+                return []
+
+            # Exact distances on the shortlist: thresholds applied by the
+            # caller see the same numbers as a flat scan would produce
+            return self._rank_exact(rows, target, k)
+
+
+# --- Per-collection registry ---
+_indexes: Dict[str, EmbeddingIndex] = {}
+_registry_lock = threading.Lock()
+
+
+def create_index(
+    backend: str = INDEX_BACKEND,
+    persist_path: Optional[str] = None,
+    store=None
+) -> EmbeddingIndex:
+    """Builds an empty index for the configured backend ("flat" or "ivf")."""
+    if backend == "flat":
+        return EmbeddingIndex(store=store)
+    if backend == "ivf":
+        return IVFIndex(persist_path=persist_path, store=store)
+    raise ValueError(f"Unknown embedding index backend: {backend}")
+
+
+def get_index(collection_name: str, persist_path: Optional[str] = None, store=None) -> EmbeddingIndex:
+    """Returns the (possibly not yet loaded) index for a collection."""
+    with _registry_lock:
+        index = _indexes.get(collection_name)
+        if index is None:
+            index = create_index(persist_path=persist_path, store=store)
+            _indexes[collection_name] = index
+        return index
+
+
+def invalidate(collection_name: str):
+    """Forces a rebuild on next use, e.g. after the collection was reloaded."""
+    index = _indexes.get(collection_name)
+    if index is not None:
+        index.loaded = False
+
+
+def sync_document(collection_name: str, doc: Dict[str, Any]):
+    """Called by json_db after every write. No-op until the index is loaded."""
+    if collection_name not in INDEXED_COLLECTIONS:
+        return
+    index = _indexes.get(collection_name)
+    if index is not None and index.loaded:
+        index.sync_document(doc)
@@ -0,0 +1,144 @@
+# app/utils/embedding_store.py
+import os
+import threading
+import numpy as np
+from typing import Optional, Union, List
+
+# float32 keeps embeddings bit-exact; float16 halves the file (and the
+# page cache it needs) at ~1e-3 precision, far below match thresholds.
+EMBEDDING_DTYPE = np.dtype(os.getenv("EMBEDDING_DTYPE", "float32"))
+
+# fsync every append, like the collection logs (see log_store.py)
+FSYNC_WRITES = os.getenv("JSON_DB_FSYNC", "1") == "1"
+
+
+class MemoryEmbeddingStore:
+    """
+    Growable in-memory matrix of embedding rows.
+    Used by indexes that are not backed by a sidecar file.
+    """
+
+    mutable = True
+
+    def __init__(self, dim: int, dtype: np.dtype = np.float32):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self._matrix = np.empty((0, dim), dtype=self.dtype)
+        self.n_rows = 0
+
+    def append(self, vec: np.ndarray) -> int:
+        row = self.n_rows
+        if row >= self._matrix.shape[0]:
+            grown = np.empty((max(64, 2 * self._matrix.shape[0]), self.dim), dtype=self.dtype)
+            grown[:row] = self._matrix[:row]
+            self._matrix = grown
+        self._matrix[row] = vec
+        self.n_rows += 1
+        return row
+
+    def write(self, row: int, vec: np.ndarray):
+        self._matrix[row] = vec
+
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self.n_rows]
+
+    def refresh(self):
+        pass
+
+    def clear(self):
+        """Drops every row (the owning index is being rebuilt)."""
+        self._matrix = np.empty((0, self.dim), dtype=self.dtype)
+        self.n_rows = 0
+
+
+class EmbeddingStore:
+    """
+    Binary sidecar holding one fixed-size row per stored embedding.
+
+    The file is a bare C-order array of `dim` values of `dtype` per row,
+    so row i lives at byte i * row_bytes. Rows are only ever appended
+    (a re-embedded submission gets a new row); JSON records reference
+    their row as `embedding_row`. Reads go through a read-only memmap,
+    so searches work on the mapped pages without copying or parsing.
+    Processes sharing a file must serialize appends with a common lock
+    (json_db's file lock for the collection sidecars).
+    """
+
+    mutable = False
+
+    def __init__(self, path: str, dim: int, dtype: np.dtype = EMBEDDING_DTYPE):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = dim * self.dtype.itemsize
+        self._lock = threading.RLock()
+        self._map: Optional[np.memmap] = None
+        self._mapped_rows = 0
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self._file = open(path, "ab")
+        self.n_rows = 0
+        self.refresh()
+
+    def refresh(self, repair: bool = False):
+        """
+        Re-reads the row count, e.g. after another process appended rows.
+        A partial last row is ignored, or cut off with repair=True (only
+        safe while holding the appenders' lock: it may be mid-write).
+        """
+        with self._lock:
+            size = os.path.getsize(self.path)
+            if size % self.row_bytes and repair:
+                # Torn append from a crash; no JSON record can reference it
+                # because records are written only after their row.
+                print(f"Warning: Truncating partial row at end of {self.path}")
+                size -= size % self.row_bytes
+                with open(self.path, "r+b") as f:
+                    f.truncate(size)
+            self.n_rows = size // self.row_bytes
+
+    def append(self, vec: Union[np.ndarray, List[float]]) -> int:
+        """Appends one row durably and returns its index."""
+        return self.append_many(np.asarray(vec).reshape(1, self.dim))
+
+    def append_many(self, vectors: np.ndarray) -> int:
+        """Appends several rows with one write/fsync; returns the first row index."""
+        data = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        with self._lock:
+            self.refresh(repair=True)
+            first_row = self.n_rows
+            self._file.write(data.tobytes())
+            self._file.flush()
+            if FSYNC_WRITES:
+                os.fsync(self._file.fileno())
+            self.n_rows += data.shape[0]
+            return first_row
+
+    def write(self, row: int, vec: np.ndarray):
+        raise TypeError("EmbeddingStore rows are append-only")
+
+    def matrix(self) -> np.ndarray:
+        """Read-only (n_rows, dim) view of the file; re-mapped when it grows."""
+        with self._lock:
+            if self.n_rows == 0:
+                return np.empty((0, self.dim), dtype=self.dtype)
+            if self._map is None or self._mapped_rows != self.n_rows:
+                self._map = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.n_rows, self.dim))
+                self._mapped_rows = self.n_rows
+            return self._map
+
+    def get(self, row: int) -> Optional[np.ndarray]:
+        """Returns one row as a float32 array, or None if out of range."""
+        if row is None or row < 0:
+            return None
+        with self._lock:
+            if row >= self.n_rows:
+                self.refresh()
+            if row >= self.n_rows:
+                return None
+            return np.array(self.matrix()[row], dtype=np.float32)
+
+    def close(self):
+        with self._lock:
+            self._map = None
+            self._file.close()
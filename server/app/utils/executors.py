@@ -0,0 +1,121 @@
+# app/utils/executors.py
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when a BoundedExecutor already holds its maximum number of jobs."""
+
+
+def _timed_call(fn: Callable, args: tuple, submitted_at: float) -> Tuple[Any, float, float]:
+    """
+    Runs `fn(*args)` and reports how long it waited and ran.
+    Module-level (and wall-clock based) so it also works in process pools.
+    """
+    started_at = time.time()
+    result = fn(*args)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+class BoundedExecutor:
+    """
+    A thread or process pool with a hard cap on queued work.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more
+    wait for a worker. Anything beyond that is rejected immediately with
+    ExecutorSaturated, so callers can shed load (e.g. answer 503) instead
+    of piling up requests behind a slow CPU-bound job.
+    """
+
+    def __init__(self, name: str, kind: str = "thread", max_workers: int = 1, max_queue: int = 8):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "total_wait_s": 0.0,
+            "max_wait_s": 0.0,
+            "total_run_s": 0.0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: forking a process that already holds torch threads can deadlock
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            elif self.kind == "thread":
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name
+                )
+            else:
+                raise ValueError(f"Unknown executor kind: {self.kind}")
+        return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise ExecutorSaturated(f"{self.name} executor is saturated")
+            self._pending += 1
+            self._stats["submitted"] += 1
+
+    def _release(self, ok: bool, wait_s: float = 0.0, run_s: float = 0.0):
+        with self._lock:
+            self._pending -= 1
+            self._stats["completed" if ok else "failed"] += 1
+            self._stats["total_wait_s"] += wait_s
+            self._stats["max_wait_s"] = max(self._stats["max_wait_s"], wait_s)
+            self._stats["total_run_s"] += run_s
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Runs `fn(*args)` on the pool without blocking the event loop."""
+        self._acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            result, wait_s, run_s = await loop.run_in_executor(
+                self._get_executor(), _timed_call, fn, args, time.time()
+            )
+        except BaseException:
+            self._release(ok=False)
+            raise
+        self._release(ok=True, wait_s=wait_s, run_s=run_s)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and latency counters since process start."""
+        with self._lock:
+            finished = self._stats["completed"] or 1
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._pending,
+                "queued": max(0, self._pending - self.max_workers),
+                "submitted": self._stats["submitted"],
+                "completed": self._stats["completed"],
+                "failed": self._stats["failed"],
+                "rejected": self._stats["rejected"],
+                "avg_wait_ms": 1000 * self._stats["total_wait_s"] / finished,
+                "max_wait_ms": 1000 * self._stats["max_wait_s"],
+                "avg_run_ms": 1000 * self._stats["total_run_s"] / finished,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
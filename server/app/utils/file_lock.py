@@ -0,0 +1,65 @@
+# app/utils/file_lock.py
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError: # Windows: locks only cover the threads of one process
+    fcntl = None
+
+
+class FileLock:
+    """
+    Exclusive lock held across threads and processes, e.g. several
+    `uvicorn --workers` sharing app/db. Threads of one process queue on
+    an RLock; the first acquire of the outermost holder then takes an
+    fcntl.flock on the lock file. Re-entrant within a thread.
+
+    pin() keeps the flock after the last release, so other threads of
+    this process can take the lock while other processes stay locked
+    out, until every pin is dropped with unpin().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._pins = 0
+        self._locked = False
+        self._fd = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and not self._locked and fcntl is not None:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                self._locked = True
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._pins == 0 and self._locked:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._locked = False
+        self._thread_lock.release()
+
+    def pin(self):
+        """Keeps other processes out past the last release. Caller holds the lock."""
+        self._pins += 1
+
+    def unpin(self):
+        """Drops a pin; the next last release unlocks. Caller holds the lock."""
+        self._pins -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
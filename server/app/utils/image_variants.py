@@ -0,0 +1,132 @@
+# app/utils/image_variants.py
+import hashlib
+import os
+import tempfile
+import threading
+from PIL import Image, ImageOps
+from typing import Dict, Optional, Tuple
+from app.utils.storage import db
+
+# --- Configuration ---
+# Long-side size of each resized variant. "thumb" is for lists and
+# small cards, "medium" for the match review page.
+VARIANT_SIZES = {
+    "thumb": int(os.getenv("IMAGE_THUMB_SIDE", "320")),
+    "medium": int(os.getenv("IMAGE_MEDIUM_SIDE", "960")),
+}
+# Encoders and their media types; WebP when the client accepts it
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+
+# Generated variants, outside the statically served uploads directory
+VARIANTS_DIR = os.getenv("IMAGE_VARIANTS_DIR", "app/variants")
+
+os.makedirs(VARIANTS_DIR, exist_ok=True)
+
+# Serialize generation per (file, variant, format) so a burst of first
+# requests for the same image encodes it once.
+_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+_locks_guard = threading.Lock()
+# path -> strong ETag (sha256 of the served bytes)
+_etags: Dict[str, str] = {}
+
+
+def upload_path(filename: str) -> Optional[str]:
+    """
+    Path of an original upload given relative to /uploads/ (a blob like
+    'blobs/ab/cd/<sha256>.jpg' or a legacy '<id>.jpg'), or None for an
+    unknown or unsafe name.
+    """
+    parts = filename.split("/") if filename else []
+    if not parts or any(part in ("", "..") or part.startswith(".") for part in parts):
+        return None
+    return db.resolve_image_path("/uploads/" + filename)
+
+
+def _variant_lock(key: Tuple[str, str, str]) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _render(source_path: str, out_path: str, side: int, fmt: str):
+    """Decodes the original, applies EXIF rotation, resizes and encodes atomically."""
+    with Image.open(source_path) as img:
+        img.draft("RGB", (side, side)) # JPEG: decode at a reduced scale
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((side, side), Image.LANCZOS)
+        fd, tmp_path = tempfile.mkstemp(dir=VARIANTS_DIR, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, FORMATS[fmt][0], quality=VARIANT_QUALITY)
+            os.replace(tmp_path, out_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _variant_path(filename: str, variant: str, fmt: str) -> str:
+    # Blob names are content digests, so identical photos share variants
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(VARIANTS_DIR, f"{stem}.{variant}.{fmt}")
+
+
+def get_variant(filename: str, variant: str, fmt: str) -> Optional[str]:
+    """
+    Returns the path of a resized variant of an upload, generating and
+    caching it on first use. Uploads never change while referenced, so
+    a generated variant stays valid until release_image deletes it.
+    """
+    source_path = upload_path(filename)
+    if source_path is None:
+        return None
+    out_path = _variant_path(filename, variant, fmt)
+    if os.path.exists(out_path):
+        return out_path
+    with _variant_lock((filename, variant, fmt)):
+        if not os.path.exists(out_path):
+            _render(source_path, out_path, VARIANT_SIZES[variant], fmt)
+    return out_path
+
+
+def delete_variants(filename: str) -> int:
+    """Deletes every generated variant of an upload; returns how many existed."""
+    deleted = 0
+    for variant in VARIANT_SIZES:
+        for fmt in FORMATS:
+            out_path = _variant_path(filename, variant, fmt)
+            _etags.pop(out_path, None)
+            try:
+                os.remove(out_path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+    return deleted
+
+
+def release_image(image_path: str, submission_id: str) -> bool:
+    """
+    Drops a report's reference to its upload (db.release_image_blob).
+    When that was the last one, the blob is gone and so are its
+    variants. Returns True if the upload was deleted.
+    """
+    if not db.release_image_blob(image_path, submission_id):
+        return False
+    delete_variants(image_path)
+    return True
+
+
+def etag_for(path: str) -> str:
+    """Strong ETag of a served file, computed once per process."""
+    etag = _etags.get(path)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()[:32]}"'
+        _etags[path] = etag
+    return etag
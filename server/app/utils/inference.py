@@ -0,0 +1,99 @@
+# app/utils/inference.py
+import asyncio
+import os
+import numpy as np
+from typing import Optional, Dict, Any
+from app.utils import recognition, embedding_cache
+from app.utils.executors import BoundedExecutor, ExecutorSaturated
+
+# --- Configuration ---
+# "thread" shares the models loaded in this process (torch releases the
+# GIL during forward passes). "process" loads a copy of the models in
+# each worker process and isolates inference from the web worker.
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+# Uploads allowed to wait for a free worker before we answer 503
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "8"))
+
+# Micro-batching: with INFERENCE_BATCH_SIZE > 1, uploads are grouped by
+# recognition.EmbeddingBatcher (up to the batch size, or whatever
+# arrived within INFERENCE_BATCH_WAIT_MS) instead of using the pool.
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "1"))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "10"))
+
+_batcher = recognition.EmbeddingBatcher(
+    max_batch_size=INFERENCE_BATCH_SIZE,
+    max_wait_ms=INFERENCE_BATCH_WAIT_MS,
+    max_queue=INFERENCE_MAX_QUEUE
+) if INFERENCE_BATCH_SIZE > 1 else None
+
+_executor = BoundedExecutor(
+    "inference",
+    kind=INFERENCE_EXECUTOR,
+    max_workers=INFERENCE_WORKERS,
+    max_queue=INFERENCE_MAX_QUEUE
+)
+
+
+# Digest -> future of an upload currently being embedded, so identical
+# uploads arriving together share one inference run.
+_in_flight: Dict[str, "asyncio.Future"] = {}
+
+
+async def _compute_embedding(source: recognition.ImageSource) -> Optional[np.ndarray]:
+    if _batcher is not None:
+        return await asyncio.wrap_future(_batcher.submit(source))
+    return await _executor.run(recognition.embed_image, source)
+
+
+async def get_embedding_async(source: recognition.ImageSource, digest: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Computes a face embedding on the inference pool and awaits it, so the
+    event loop keeps serving other requests meanwhile. `source` is image
+    bytes or the path of a staged upload (pass its sha256 as `digest`).
+    Photos seen before are answered from the embedding cache without
+    running the models; only real results (an embedding, or None for
+    "no face") are cached.
+    Raises ExecutorSaturated when the pool and its queue are full, and
+    recognition.EmbeddingFailed when the models could not process it.
+    """
+    cache = embedding_cache.get_cache()
+    if cache is None:
+        return await _compute_embedding(source)
+
+    if digest is None:
+        digest = embedding_cache.content_digest(source)
+    hit, embedding = cache.get(digest)
+    if hit:
+        return embedding
+
+    pending = _in_flight.get(digest)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[digest] = future
+    try:
+        embedding = await _compute_embedding(source)
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            future.exception() # Mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _in_flight.pop(digest, None)
+    cache.put(digest, embedding)
+    future.set_result(embedding)
+    return embedding
+
+
+def stats() -> Dict[str, Any]:
+    if _batcher is not None:
+        return {"batcher": _batcher.stats()}
+    return _executor.stats()
+
+
+def shutdown():
+    _executor.shutdown()
@@ -0,0 +1,186 @@
+# app/utils/journal.py
+import json
+import os
+import threading
+import time
+from typing import List, Dict, Any, Tuple
+from app.utils.log_store import FSYNC_WRITES
+
+try:
+    import fcntl
+except ImportError: # Windows: every open counts as a cold start
+    fcntl = None
+
+# --- Group Commit ---
+# Commits are written to the journal under json_db's lock but fsynced
+# after it is released: one fsync makes every record written before it
+# durable, so concurrent commits share it. While a batch is being
+# flushed, the next one gathers. When the last flush covered more than
+# one commit (i.e. there is concurrent load), the flushing thread also
+# waits this long for more commits to join. A lone writer never waits.
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("JSON_DB_GROUP_COMMIT_MS", "2"))
+
+
+class Journal:
+    """
+    Write-ahead journal for multi-collection writes.
+
+    Each committed transaction is one JSON line holding all of its
+    operations. The collection logs are appended (without fsync) only
+    once the record is durable, so they never hold part of a transaction
+    the journal could not replay; a checkpoint fsyncs them and empties
+    the journal. After a crash,
+    replaying every record still in the journal, in order, brings all
+    collections to the committed state: puts and shallow patches give
+    the same result when applied again. A torn last line is an
+    uncommitted transaction and is dropped.
+
+    append() only writes; wait_durable() then blocks until an fsync
+    (group commit, see above) covers the record.
+
+    Records are applied to the logs in journal order (json_db holds its
+    lock from a record's append until its log entries are written), and
+    `<path>.applied` holds the journal offset applied so far, so a
+    process opening the journal while others run only replays records
+    nobody applied (see pending_records).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cond = threading.Condition()
+        self._file = open(path, "ab")
+        self._applied_fd = os.open(path + ".applied", os.O_RDWR | os.O_CREAT, 0o644)
+        self._users_fd = None
+        self.last_end = 0 # Journal offset just past the last record written
+        self._written = 0 # Sequence number of the last record written
+        self._durable = 0 # ... and of the last one known to be on disk
+        self._flushing = False
+        self._last_batch = 0
+        self._stats = {"commits": 0, "fsyncs": 0}
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Writes one transaction record; returns its sequence number for wait_durable()."""
+        data = (json.dumps(record, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._cond:
+            self._file.write(data)
+            self._file.flush()
+            self.last_end = os.lseek(self._file.fileno(), 0, os.SEEK_CUR)
+            self._written += 1
+            self._stats["commits"] += 1
+            return self._written
+
+    def wait_durable(self, seq: int):
+        """Returns once record `seq` is fsynced, flushing it (and any others pending) if needed."""
+        if not FSYNC_WRITES:
+            return
+        with self._cond:
+            while self._durable < seq:
+                if self._flushing:
+                    self._cond.wait() # Another thread's flush may cover us
+                    continue
+                self._flushing = True
+                break
+            else:
+                return
+        target, flushed = 0, False
+        try:
+            if GROUP_COMMIT_WINDOW_MS > 0 and self._last_batch > 1:
+                time.sleep(GROUP_COMMIT_WINDOW_MS / 1000)
+            with self._cond:
+                target = self._written
+            os.fsync(self._file.fileno())
+            flushed = True
+        finally:
+            with self._cond:
+                if flushed and self._durable < target:
+                    self._last_batch = target - self._durable
+                    self._durable = target
+                    self._stats["fsyncs"] += 1
+                self._flushing = False
+                self._cond.notify_all()
+
+    def last_seq(self) -> int:
+        """Sequence number of the last record written."""
+        with self._cond:
+            return self._written
+
+    def size(self) -> int:
+        # Not tell(): another process may have truncated or appended
+        return os.fstat(self._file.fileno()).st_size
+
+    def records(self, start: int = 0) -> List[Dict[str, Any]]:
+        """Complete records in the journal from offset `start`, oldest first."""
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # Torn write: that transaction never committed
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        return records
+
+    def attach(self) -> bool:
+        """
+        Registers this process as a user of the journal for its lifetime
+        (a shared flock on `<path>.users`). Returns True on a cold start,
+        i.e. when no other running process has it open. Call once, under
+        the caller's cross-process lock.
+        """
+        if fcntl is None:
+            return True
+        self._users_fd = os.open(self.path + ".users", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._users_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            cold = True
+        except BlockingIOError:
+            cold = False
+        fcntl.flock(self._users_fd, fcntl.LOCK_SH)
+        return cold
+
+    def pending_records(self, cold: bool) -> List[Dict[str, Any]]:
+        """
+        Records to replay when opening the journal. On a cold start that is
+        all of them: the applied offset is written without fsync, so after
+        a power loss it may be ahead of the logs (replaying is idempotent).
+        With other processes running, only records past the applied offset
+        (left by a process that died before writing its log entries).
+        """
+        start = 0 if cold else self.applied_offset()
+        return self.records(start if start <= self.size() else 0)
+
+    def applied_offset(self) -> int:
+        try:
+            return int(os.pread(self._applied_fd, 20, 0) or 0)
+        except ValueError:
+            return 0
+
+    def set_applied(self, offset: int):
+        """Records that every record up to journal `offset` is in the logs (no fsync)."""
+        os.pwrite(self._applied_fd, str(offset).encode().rjust(20), 0)
+
+    def truncate(self):
+        """
+        Empties the journal once its records are durable elsewhere (the
+        caller fsynced the collection logs), which also settles every
+        commit still waiting for a flush.
+        """
+        with self._cond:
+            self._file.truncate(0)
+            if FSYNC_WRITES:
+                os.fsync(self._file.fileno())
+            self.set_applied(0)
+            self.last_end = 0
+            self._durable = self._written
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            commits = self._stats["commits"]
+            return {
+                **self._stats,
+                "commits_per_fsync": commits / (self._stats["fsyncs"] or 1),
+                "bytes": self.size(),
+            }
@@ -1,32 +1,46 @@
-import json
 import os
+import threading
 import uuid
-import shutil
+import numpy as np
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from fastapi import UploadFile
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from app.utils import embedding_index
+from app.utils.log_store import LogStore, migrate_json_list
+from app.utils.journal import Journal
+from app.utils.file_lock import FileLock
+from app.utils.embedding_store import EmbeddingStore
+from app.utils.db_common import (
+    DB_DIR, UNIQUE_FIELDS, DuplicateKeyError, copy_doc,
+    store_image_blob, release_image_blob, resolve_image_path, blob_stats,
+)
 
 # --- Configuration ---
-# Define paths for our JSON database and image uploads
-DB_DIR = "app/db"
-UPLOADS_DIR = "app/uploads"
-
-# Define paths for our three new JSON database files
-PARENTS_DB_PATH = os.path.join(DB_DIR, "parents.json")
-VOLUNTEERS_DB_PATH = os.path.join(DB_DIR, "volunteers.json")
-CHILDREN_DB_PATH = os.path.join(DB_DIR, "children.json")
-USERS_DB_PATH = os.path.join(DB_DIR, "users.json")
-
-# --- Initialization ---
-# Ensure database and upload directories exist on startup
-os.makedirs(DB_DIR, exist_ok=True)
-os.makedirs(UPLOADS_DIR, exist_ok=True)
-
-# Ensure all FOUR DB files exist
-for path in [PARENTS_DB_PATH, VOLUNTEERS_DB_PATH, CHILDREN_DB_PATH, USERS_DB_PATH]:
-    if not os.path.exists(path):
-        with open(path, "w") as f:
-            json.dump([], f) # Start with an empty list
+# Paths of the JSON database (DB_DIR is shared with sqlite_db, see db_common.py)
+# Each collection is an append-only JSON-lines log (see log_store.py).
+# The old whole-file JSON lists are imported once on first open.
+PARENTS_DB_PATH = os.path.join(DB_DIR, "parents.jsonl")
+VOLUNTEERS_DB_PATH = os.path.join(DB_DIR, "volunteers.jsonl")
+CHILDREN_DB_PATH = os.path.join(DB_DIR, "children.jsonl")
+USERS_DB_PATH = os.path.join(DB_DIR, "users.jsonl")
+# Ranked match candidates of each report (match_jobs), keyed by report _id
+MATCH_CANDIDATES_DB_PATH = os.path.join(DB_DIR, "match_candidates.jsonl")
+
+# Writes are committed to this journal first (see journal.py and
+# Transactions below); the collection logs are appended once a record is
+# durable, and fsynced at checkpoints.
+JOURNAL_PATH = os.path.join(DB_DIR, "journal.jsonl")
+# Checkpoint (fsync the collection logs, empty the journal) past this size
+JOURNAL_CHECKPOINT_BYTES = int(os.getenv("JSON_DB_JOURNAL_CHECKPOINT_BYTES", str(4 * 1024 * 1024)))
+
+# --- Cross-Process Lock ---
+# Several server processes (uvicorn --workers N) may share app/db. Every
+# write, and every catch-up on writes made by the others, happens under
+# this lock. A commit releases it to this process's other threads while
+# its journal record is fsynced (group commit, see journal.py), but stays
+# pinned against other processes until the commit's log entries are
+# appended (see _append_logged). Lock order: _db_lock, then _cache_lock,
+# then _stores_lock.
+_db_lock = FileLock(os.path.join(DB_DIR, "json_db.lock"))
 
 # --- Internal Helper Functions ---
 def _get_db_path(collection_name: str) -> str:
@@ -40,162 +54,612 @@ def _get_db_path(collection_name: str) -> str:
     # --- NEW ---
     elif collection_name == "users":
         return USERS_DB_PATH
+    elif collection_name == "match_candidates":
+        return MATCH_CANDIDATES_DB_PATH
     else:
         raise ValueError(f"Unknown collection name: {collection_name}")
 
-def _load_db(collection_name: str) -> List[Dict[str, Any]]:
-    """Loads the entire database from the correct JSON file."""
-    db_path = _get_db_path(collection_name)
-    try:
-        with open(db_path, "r") as f:
-            data = json.load(f)
-            if not isinstance(data, list):
-                return [] # Ensure it's a list, even if file is corrupt
-            return data
-    except (json.JSONDecodeError, FileNotFoundError):
-        return [] # Return empty list if file is empty or corrupt
-
-def _save_db(data: List[Dict[str, Any]], collection_name: str):
-    """Saves the entire database list back to the correct JSON file."""
-    db_path = _get_db_path(collection_name)
-    with open(db_path, "w") as f:
-        # default=str ensures datetimes are saved in ISO format
-        json.dump(data, f, indent=4, default=str)
-
-# --- Public Database Functions ---
-
-async def save_image_file(file: UploadFile, submission_id: str) -> str:
-    """
-    Saves an uploaded image file to the local filesystem.
-    Returns the relative web-accessible path to the image.
-    (This function remains unchanged)
-    """
-    file_extension = os.path.splitext(file.filename)[-1] or ".jpg"
-    filename = f"{submission_id}{file_extension}"
-    file_path = os.path.join(UPLOADS_DIR, filename)
-    
+_stores: Dict[str, LogStore] = {}
+_stores_lock = threading.Lock()
+_journal: Optional[Journal] = None
+
+def _open_store(collection_name: str) -> LogStore:
+    """Caller holds _stores_lock."""
+    store = _stores.get(collection_name)
+    if store is None:
+        db_path = _get_db_path(collection_name)
+        store = LogStore(db_path)
+        # e.g. app/db/parents.jsonl <- app/db/parents.json
+        migrate_json_list(os.path.splitext(db_path)[0] + ".json", store)
+        _stores[collection_name] = store
+    return store
+
+def _get_journal() -> Journal:
+    """
+    Opens the journal and replays what it holds that is not in the logs:
+    everything on a cold start (a run that stopped before its last
+    checkpoint), only records no process applied when other workers are
+    running (see Journal.pending_records). Caller holds _db_lock and
+    _stores_lock.
+    """
+    global _journal
+    if _journal is None:
+        journal = Journal(JOURNAL_PATH)
+        cold = journal.attach()
+        records = journal.pending_records(cold)
+        if records:
+            by_collection: Dict[str, List[Dict[str, Any]]] = {}
+            for record in records:
+                for op in record["ops"]:
+                    by_collection.setdefault(op["collection"], []).append(_log_entry(op))
+            for collection_name, entries in by_collection.items():
+                store = _open_store(collection_name)
+                store.append_entries(entries, sync=False)
+                store.sync()
+            print(f"Replayed {len(records)} journaled transactions into {sorted(by_collection)}.")
+        if cold:
+            journal.truncate()
+        else:
+            # Other workers' records stay until their logs are fsynced at a checkpoint
+            journal.set_applied(journal.size())
+        _journal = journal
+    return _journal
+
+def _get_store(collection_name: str) -> LogStore:
+    """Opens (once per process) the log store for a collection."""
+    with _stores_lock:
+        store = _stores.get(collection_name)
+    if store is not None:
+        return store
+    # Opening scans the file and may repair a torn tail: not while
+    # another process is appending to it.
+    with _db_lock, _stores_lock:
+        _get_journal()
+        return _open_store(collection_name)
+
+def _log_entry(op: Dict[str, Any]) -> Dict[str, Any]:
+    """The collection log entry of a journaled operation."""
+    return {key: value for key, value in op.items() if key != "collection"}
+
+# --- Resident Collection Cache ---
+# Parsed collections stay in memory and writes are applied to them in
+# place (write-through). Every read compares the log file's
+# (inode, size, mtime) with the value recorded after our own last write;
+# any difference means another process wrote to the file. Its new
+# entries are then read from the tail and applied to the cache (a full
+# reload only happens if the file was compacted and replaced).
+
+# Secondary hash indexes: one per field of UNIQUE_FIELDS (db_common.py)
+
+# Non-unique indexes: value -> ids of the records holding it
+MULTI_FIELDS = {
+    "parents": ("user_id",),
+    "volunteers": ("user_id",),
+}
+
+class _CachedCollection:
+    def __init__(self, collection_name: str, signature: tuple, docs: List[Dict[str, Any]]):
+        self.collection_name = collection_name
+        self.signature = signature
+        self.docs: Dict[str, Dict[str, Any]] = {} # _id -> document, in insertion order
+        self.unique_fields = UNIQUE_FIELDS.get(collection_name, ())
+        self.unique: Dict[str, Dict[Any, str]] = {field: {} for field in self.unique_fields}
+        self.multi_fields = MULTI_FIELDS.get(collection_name, ())
+        self.multi: Dict[str, Dict[Any, Dict[str, None]]] = {field: {} for field in self.multi_fields}
+        # Projection: user_id -> ids of that user's reports whose match is confirmed
+        self.confirmed_by_user: Dict[str, Dict[str, None]] = {}
+        for doc in docs:
+            if doc.get("_id"):
+                self.docs[doc["_id"]] = doc
+                self._index(doc)
+
+    def _index(self, doc: Dict[str, Any]):
+        for field in self.unique_fields:
+            value = doc.get(field)
+            if value is not None:
+                # Keep the first holder if legacy data already has duplicates
+                self.unique[field].setdefault(value, doc["_id"])
+        for field in self.multi_fields:
+            value = doc.get(field)
+            if value is not None:
+                self.multi[field].setdefault(value, {})[doc["_id"]] = None
+        if doc.get("user_id") and (doc.get("match") or {}).get("confirmed"):
+            self.confirmed_by_user.setdefault(doc["user_id"], {})[doc["_id"]] = None
+
+    def _unindex(self, doc: Dict[str, Any]):
+        for field in self.unique_fields:
+            if self.unique[field].get(doc.get(field)) == doc["_id"]:
+                del self.unique[field][doc.get(field)]
+        for field in self.multi_fields:
+            ids = self.multi[field].get(doc.get(field))
+            if ids is not None:
+                ids.pop(doc["_id"], None)
+                if not ids:
+                    del self.multi[field][doc.get(field)]
+        confirmed = self.confirmed_by_user.get(doc.get("user_id"))
+        if confirmed is not None:
+            confirmed.pop(doc["_id"], None)
+            if not confirmed:
+                del self.confirmed_by_user[doc["user_id"]]
+
+    def lookup(self, field: str, value: Any) -> Optional[Dict[str, Any]]:
+        """O(1) lookup through a unique index."""
+        doc_id = self.unique[field].get(value)
+        return self.docs.get(doc_id) if doc_id is not None else None
+
+    def lookup_all(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """All records holding `value` in a non-unique index, in insertion order."""
+        ids = self.multi[field].get(value, {})
+        return [self.docs[doc_id] for doc_id in ids]
+
+    def check_unique(self, doc_id: str, values: Dict[str, Any]):
+        """Raises DuplicateKeyError if any unique value belongs to another record."""
+        for field in self.unique_fields:
+            value = values.get(field)
+            if value is None:
+                continue
+            for index in self.unique.values():
+                holder = index.get(value)
+                if holder is not None and holder != doc_id:
+                    raise DuplicateKeyError(self.collection_name, field, value)
+
+    def put(self, doc: Dict[str, Any]):
+        old = self.docs.get(doc["_id"])
+        if old is not None:
+            self._unindex(old)
+        self.docs[doc["_id"]] = doc
+        self._index(doc)
+
+    def patch(self, doc: Dict[str, Any], updates: Dict[str, Any]):
+        self._unindex(doc)
+        doc.update(updates)
+        self._index(doc)
+
+_cache: Dict[str, _CachedCollection] = {}
+_cache_lock = threading.RLock()
+_cache_stats: Dict[str, Dict[str, int]] = {}
+
+def _file_signature(path: str) -> tuple:
     try:
-        await file.seek(0)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    finally:
-        await file.close()
-        
-    return f"/uploads/{filename}"
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (None, None, None)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+def _count(collection_name: str, key: str, n: int = 1):
+    stats = _cache_stats.setdefault(collection_name, {"hits": 0, "misses": 0, "reloads": 0, "external_writes": 0})
+    stats[key] += n
+
+def _get_cached(collection_name: str) -> _CachedCollection:
+    """Returns the cached collection, catching up first if the file changed underneath us."""
+    store = _get_store(collection_name)
+    with _cache_lock:
+        cached = _cache.get(collection_name)
+        if cached is not None and cached.signature == _file_signature(store.path):
+            _count(collection_name, "hits")
+            return cached
+
+    with _db_lock, _cache_lock:
+        # Re-check: the change may have been our own write in another thread
+        signature = _file_signature(store.path)
+        cached = _cache.get(collection_name)
+        if cached is not None and cached.signature == signature:
+            _count(collection_name, "hits")
+            return cached
+
+        _count(collection_name, "misses")
+        if cached is not None:
+            entries = store.catch_up()
+            if entries is not None:
+                # Appended by another process: apply just those entries
+                _count(collection_name, "external_writes", len(entries))
+                _apply_external(collection_name, cached, entries)
+                cached.signature = _file_signature(store.path)
+                return cached
+            # Compacted by another process: our offset table is stale as well
+            _count(collection_name, "reloads")
+            store.reopen()
+            embedding_index.invalidate(collection_name)
+
+        docs = list(store.iter_docs())
+        _externalize_legacy_embeddings(collection_name, store, docs)
+        signature = _file_signature(store.path)
+        cached = _CachedCollection(collection_name, signature, docs)
+        _cache[collection_name] = cached
+        return cached
+
+def _apply_external(collection_name: str, cached: _CachedCollection, entries: List[Dict[str, Any]]):
+    """Applies log entries written by another process to the cache, index and listeners."""
+    for entry in entries:
+        if entry.get("op") == "put":
+            doc = copy_doc(entry["doc"])
+            cached.put(doc)
+            embedding_index.sync_document(collection_name, doc)
+        elif entry.get("op") == "update":
+            doc = cached.docs.get(entry["_id"])
+            if doc is None:
+                continue
+            updates = entry["set"]
+            cached.patch(doc, copy_doc(updates))
+            if "match" in updates or "embedding" in updates:
+                embedding_index.sync_document(collection_name, doc)
+            for listener in _update_listeners.get(collection_name, ()):
+                listener(entry["_id"], updates)
+
+def _after_write(collection_name: str, cached: _CachedCollection):
+    """Records the file state produced by our own write so it is not seen as external."""
+    cached.signature = _file_signature(_get_store(collection_name).path)
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss/reload counters per collection since process start."""
+    with _cache_lock:
+        return {name: dict(stats) for name, stats in _cache_stats.items()}
+
+# --- Embedding Sidecars ---
+# Face embeddings of parents/volunteers are not stored in the JSON
+# records. They live in a binary sidecar (app/db/<collection>.emb, see
+# embedding_store.py) and the record only keeps `embedding_row`.
+# Note: EMBEDDING_DTYPE must not change once a sidecar has rows.
+_embedding_stores: Dict[str, EmbeddingStore] = {}
+
+def _get_embedding_store(collection_name: str) -> EmbeddingStore:
+    with _stores_lock:
+        store = _embedding_stores.get(collection_name)
+        if store is None:
+            store = EmbeddingStore(
+                os.path.join(DB_DIR, f"{collection_name}.emb"),
+                dim=embedding_index.EMBEDDING_DIM
+            )
+            _embedding_stores[collection_name] = store
+        return store
+
+def _externalize_embeddings(ops: List[Dict[str, Any]]):
+    """
+    Moves the inline embedding lists of staged operations (new docs or
+    updates) into the sidecars, replacing each with a row reference.
+    Runs at commit, once the transaction can no longer be discarded, so
+    an aborted one leaves no rows behind. Caller holds _db_lock.
+    """
+    for op in ops:
+        if op["collection"] not in embedding_index.INDEXED_COLLECTIONS:
+            continue
+        values = op["doc"] if op["op"] == "put" else op["set"]
+        if values.get("embedding") is None:
+            continue
+        values["embedding_row"] = _get_embedding_store(op["collection"]).append(values["embedding"])
+        values["embedding"] = None
+
+def _externalize_legacy_embeddings(collection_name: str, store: LogStore, docs: List[Dict[str, Any]]):
+    """
+    One-time migration: records written before the sidecar existed carry
+    a 512-float JSON list. Their embeddings are appended to the sidecar
+    in one write and the records are rewritten with a row reference.
+    """
+    if collection_name not in embedding_index.INDEXED_COLLECTIONS:
+        return
+    legacy = [doc for doc in docs if doc.get("embedding") is not None and doc.get("_id")]
+    if not legacy:
+        return
+    vectors = np.asarray([doc["embedding"] for doc in legacy], dtype=np.float32)
+    first_row = _get_embedding_store(collection_name).append_many(vectors)
+    for offset, doc in enumerate(legacy):
+        doc["embedding"] = None
+        doc["embedding_row"] = first_row + offset
+    store.put_many(legacy)
+    print(f"Moved {len(legacy)} inline embeddings of '{collection_name}' to the binary sidecar.")
+
+def get_submission_embedding(id_str: str, collection_name: str) -> Optional[np.ndarray]:
+    """Returns a submission's embedding as a float32 array, or None."""
+    doc = _get_cached(collection_name).docs.get(id_str)
+    if doc is None:
+        return None
+    if doc.get("embedding_row") is not None:
+        return _get_embedding_store(collection_name).get(doc["embedding_row"])
+    if doc.get("embedding") is not None:
+        return np.asarray(doc["embedding"], dtype=np.float32)
+    return None
+
+def _load_db(collection_name: str) -> List[Dict[str, Any]]:
+    """Returns copies of every live record of a collection, in insertion order."""
+    return [copy_doc(doc) for doc in _get_cached(collection_name).docs.values()]
+
+def compact_db(collection_name: str):
+    """Forces a compaction of a collection's log (normally automatic)."""
+    with _db_lock:
+        cached = _get_cached(collection_name)
+        _get_store(collection_name).compact()
+        with _cache_lock:
+            _after_write(collection_name, cached)
+
+# --- Transactions ---
+# Every write goes through a Transaction. Its operations are staged,
+# then committed as ONE journal record (one fsync however many records
+# and collections it touches) and appended to each collection's log
+# with one write per collection. A crash either loses the whole
+# transaction (torn journal line) or replays all of it on next open, so
+# e.g. a confirmed match can never exist without its children record.
+#
+#     with json_db.transaction() as txn:
+#         txn.update_submission(parent_id, {...}, "parents")
+#         txn.update_submission(volunteer_id, {...}, "volunteers")
+#         txn.insert_submission(child_doc, "children")
+#
+# The block holds the cache lock, so keep it short (no I/O or
+# inference inside). Reads in the block see committed data only, and an
+# exception in the block discards everything staged.
+
+class Transaction:
+    def __init__(self):
+        self.ops: List[Dict[str, Any]] = []
+        # (collection, _id) -> staged put of a record inserted in this transaction
+        self._inserted: Dict[tuple, Dict[str, Any]] = {}
+
+    def insert_submission(self, doc: Dict[str, Any], collection_name: str) -> str:
+        """Stages an insert; same contract as json_db.insert_submission."""
+        # Add timestamps (Pydantic model already created _id)
+        # Only add created_at if it's not the users collection
+        if collection_name != "users":
+            doc["created_at"] = datetime.utcnow().isoformat()
+        # Checked under the lock held by the transaction (after catching
+        # up on other processes' writes), so two concurrent signups
+        # cannot both claim the same username/email/phone.
+        _get_cached(collection_name).check_unique(doc["_id"], doc)
+        op = {"collection": collection_name, "op": "put", "doc": copy_doc(doc)}
+        self.ops.append(op)
+        self._inserted[(collection_name, doc["_id"])] = op["doc"]
+        return doc["_id"]
+
+    def update_submission(self, id_str: str, updates: Dict[str, Any], collection_name: str) -> bool:
+        """Stages a shallow update; same contract as json_db.update_submission."""
+        staged = self._inserted.get((collection_name, id_str))
+        if staged is None and id_str not in _get_cached(collection_name).docs:
+            return False
+        _get_cached(collection_name).check_unique(id_str, updates)
+        if staged is not None:
+            # Fold into the staged insert: still a single put
+            staged.update(copy_doc(updates))
+        else:
+            self.ops.append({"collection": collection_name, "op": "update", "_id": id_str, "set": copy_doc(updates)})
+        return True
+
+    def _commit(self) -> Tuple[List[tuple], int]:
+        """
+        Journals the staged operations and applies them to the cache.
+        Caller holds _db_lock. Returns (applied, journal sequence number);
+        the collection logs are appended by _append_logged(seq) once
+        journal.wait_durable(seq) has returned.
+        """
+        if not self.ops:
+            return [], 0
+        # Embeddings go to the binary sidecar; the records keep their rows
+        _externalize_embeddings(self.ops)
+        journal = _journal_handle()
+        seq = journal.append({"txn": uuid.uuid4().hex, "at": datetime.utcnow().isoformat(), "ops": self.ops})
+        end = journal.last_end
+
+        by_collection: Dict[str, List[Dict[str, Any]]] = {}
+        for op in self.ops:
+            by_collection.setdefault(op["collection"], []).append(_log_entry(op))
+
+        applied = []
+        with _cache_lock:
+            for op in self.ops:
+                cached = _cache[op["collection"]]
+                if op["op"] == "put":
+                    cached.put(copy_doc(op["doc"]))
+                    applied.append((op["collection"], op["doc"]["_id"], None))
+                else:
+                    cached.patch(cached.docs[op["_id"]], copy_doc(op["set"]))
+                    applied.append((op["collection"], op["_id"], op["set"]))
+        _unlogged.append((seq, end, by_collection))
+        _db_lock.pin()
+
+        if journal.size() > JOURNAL_CHECKPOINT_BYTES:
+            checkpoint()
+        return applied, seq
+
+# Committed transactions of this process whose collection log entries
+# are not appended yet: (journal seq, journal offset past the record,
+# collection -> entries), in commit order. Each holds a pin on _db_lock, so other processes (which only
+# see the logs) cannot take the lock before the entries are there.
+_unlogged: List[Tuple[int, int, Dict[str, List[Dict[str, Any]]]]] = []
+
+def _append_logged(upto: Optional[int] = None):
+    """
+    Appends the log entries of journaled transactions, oldest first, up
+    to sequence `upto` (all of them if None). Only call once their
+    journal records are durable: a crash can then leave a transaction
+    in the journal but never half of it in the logs. Caller holds _db_lock.
+    """
+    while _unlogged and (upto is None or _unlogged[0][0] <= upto):
+        _, end, by_collection = _unlogged.pop(0)
+        for collection_name, entries in by_collection.items():
+            _get_store(collection_name).append_entries(entries, sync=False)
+            with _cache_lock:
+                _after_write(collection_name, _cache[collection_name])
+        _journal_handle().set_applied(end)
+        _db_lock.unpin()
+
+class transaction:
+    """Context manager: `with json_db.transaction() as txn: ...` (see above)."""
+
+    def __enter__(self) -> Transaction:
+        _db_lock.acquire()
+        self.txn = Transaction()
+        return self.txn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            applied, seq = self.txn._commit() if exc_type is None else ([], 0)
+        finally:
+            _db_lock.release()
+        # Outside the lock: concurrent commits of this process share one
+        # journal fsync. Then the logs, which other processes read.
+        if seq:
+            try:
+                _journal_handle().wait_durable(seq)
+            finally:
+                with _db_lock:
+                    _append_logged(seq)
+        # Index syncs and listeners run after the lock is released
+        for collection_name, id_str, updates in applied:
+            if updates is None or "match" in updates or "embedding" in updates:
+                doc = _cache[collection_name].docs.get(id_str)
+                if doc is not None:
+                    embedding_index.sync_document(collection_name, doc)
+            if updates is not None:
+                for listener in _update_listeners.get(collection_name, ()):
+                    listener(id_str, updates)
+        return False
+
+def _journal_handle() -> Journal:
+    if _journal is not None:
+        return _journal
+    with _db_lock, _stores_lock:
+        return _get_journal()
+
+def checkpoint():
+    """fsyncs every collection log and empties the journal."""
+    with _db_lock:
+        journal = _journal_handle()
+        # Commits still waiting for their journal fsync: make them
+        # durable, then put them in the logs before the journal goes
+        journal.wait_durable(journal.last_seq())
+        _append_logged()
+        # Other processes may have written to collections this one never opened
+        for collection_name in ("parents", "volunteers", "children", "users", "match_candidates"):
+            _get_store(collection_name).sync()
+        journal.truncate()
+
+def journal_stats() -> Dict[str, Any]:
+    """Group-commit counters of this process (commits vs. journal fsyncs)."""
+    return _journal_handle().stats()
+
+def catch_up():
+    """Applies writes other worker processes made to the report and user logs (listeners included)."""
+    for collection_name in ("parents", "volunteers", "users"):
+        _get_cached(collection_name)
+
+def storage_stats() -> Dict[str, Any]:
+    """Cache and journal counters, for /api/stats (see storage.py)."""
+    return {"backend": "json", "cache": cache_stats(), "journal": journal_stats()}
 
 def insert_submission(doc: Dict[str, Any], collection_name: str) -> str:
     """
     Inserts a new submission document into the specified JSON file.
     Uses the _id already in the doc (generated by Pydantic).
+    Raises DuplicateKeyError if a unique field (see UNIQUE_FIELDS) is taken.
     """
-    data = _load_db(collection_name)
-    
-   # Add timestamps (Pydantic model already created _id)
-    # --- UPDATED: Only add created_at if it's not the users collection ---
-    if collection_name != "users":
-        doc["created_at"] = datetime.utcnow().isoformat()
-    
-    data.append(doc)
-    _save_db(data, collection_name)
-    
-    return doc["_id"] # Return the ID
+    # A single-operation transaction: one journal append, regardless of collection size
+    with transaction() as txn:
+        return txn.insert_submission(doc, collection_name)
 
 def find_submission(id_str: str, collection_name: str) -> Optional[Dict[str, Any]]:
     """Finds a single submission by its _id in the specified collection."""
-    data = _load_db(collection_name)
-    for item in data:
-        if item.get("_id") == id_str:
-            return item
-    return None
+    doc = _get_cached(collection_name).docs.get(id_str)
+    return copy_doc(doc) if doc is not None else None
 
 # --------------------------------------------------------
 # --- NEW ---
 def find_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     """Finds a user by their _id."""
-    data = _load_db("users")
-    for user in data:
-        if user.get("_id") == user_id:
-            return user
-    return None
+    return find_submission(user_id, "users")
 
 
 # --- NEW ---
 def find_reports_by_user_id(user_id: str) -> List[Dict[str, Any]]:
-    """Finds all reports (parent or volunteer) submitted by a user."""
+    """
+    Finds all reports (parent or volunteer) submitted by a user.
+    Uses the user_id index, so only the caller's records are touched.
+    """
     reports = []
-    
-    # Check parents
-    parent_data = _load_db("parents")
-    for report in parent_data:
-        if report.get("user_id") == user_id:
-            reports.append(report)
-            
-    # Check volunteers
-    volunteer_data = _load_db("volunteers")
-    for report in volunteer_data:
-        if report.get("user_id") == user_id:
-            reports.append(report)
-            
+    for collection_name in ("parents", "volunteers"):
+        for report in _get_cached(collection_name).lookup_all("user_id", user_id):
+            reports.append(copy_doc(report))
     return reports
 
 
+def find_confirmed_match_by_user_id(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns {"submission_id", "match"} for the user's first report with a
+    confirmed match (parents before volunteers), or None.
+    Served from a small projection maintained on every write.
+    """
+    for collection_name in ("parents", "volunteers"):
+        cached = _get_cached(collection_name)
+        confirmed_ids = cached.confirmed_by_user.get(user_id)
+        if confirmed_ids:
+            report = cached.docs[next(iter(confirmed_ids))]
+            return {"submission_id": report["_id"], "match": dict(report["match"])}
+    return None
+
+
 # --- NEW ---
 def find_user_by_identifier(identifier: str) -> Optional[Dict[str, Any]]:
-    """Finds a user by username, email, or phone."""
-    data = _load_db("users")
-    for user in data:
-        if user.get("username") == identifier or \
-           user.get("email") == identifier or \
-           user.get("phone") == identifier:
-            return user
+    """Finds a user by username, email, or phone (O(1) via the unique indexes)."""
+    cached = _get_cached("users")
+    for field in UNIQUE_FIELDS["users"]:
+        user = cached.lookup(field, identifier)
+        if user is not None:
+            return copy_doc(user)
     return None
 
 
 # --- NEW: Generic User Update Function ---
+# --- Update Listeners ---
+# Callbacks run after update_submission changed a record, e.g. so
+# auth_utils can drop cached sessions of a user whose record changed.
+_update_listeners: Dict[str, List[Callable[[str, Dict[str, Any]], None]]] = {}
+
+def add_update_listener(collection_name: str, listener: Callable[[str, Dict[str, Any]], None]):
+    """Registers `listener(id, updates)` for updates in a collection."""
+    _update_listeners.setdefault(collection_name, []).append(listener)
+
 def update_user(user_id: str, updates: Dict[str, Any]):
     """
     Finds a user by ID and updates their record.
-    This is separate from update_submission.
-    """
-    data = _load_db("users")
-    
-    found = False
-    for i, item in enumerate(data):
-        if item.get("_id") == user_id:
-            # Merge the updates into the existing item
-            data[i].update(updates) 
-            found = True
-            break       
-    if found:
-        _save_db(data, "users")
-    
-    return found
+    """
+    return update_submission(user_id, updates, "users")
 
 
 # ------------------------------------------------
 def update_submission(id_str: str, updates: Dict[str, Any], collection_name: str):
     """
     Finds a submission by ID in the specified collection and updates it.
+    Raises DuplicateKeyError if a unique field (see UNIQUE_FIELDS) is taken.
     """
-    data = _load_db(collection_name)
-    
-    found = False
-    for i, item in enumerate(data):
-        if item.get("_id") == id_str:
-            # Merge the updates into the existing item
-            # This is smart, it can update nested keys like 'match'
-            # Note: This is a shallow merge on top-level keys.
-            # To update a nested key, pass the entire top-level key:
-            # e.g., updates = {"match": {"score": 0.9, ...}}
-            data[i].update(updates) 
-            found = True
-            break
-            
-    if found:
-        _save_db(data, collection_name)
-    
-    return found
+    # Appends a patch to the log and merges it into the cached record.
+    # Note: This is a shallow merge on top-level keys.
+    # To update a nested key, pass the entire top-level key:
+    # e.g., updates = {"match": {"score": 0.9, ...}}
+    with transaction() as txn:
+        return txn.update_submission(id_str, updates, collection_name)
 
 def list_submissions(collection_name: str) -> List[Dict[str, Any]]:
     """Returns all submissions from the specified collection."""
-    return _load_db(collection_name)
\ No newline at end of file
+    return _load_db(collection_name)
+
+def get_embedding_index(collection_name: str) -> embedding_index.EmbeddingIndex:
+    """
+    Returns the resident embedding index for 'parents' or 'volunteers'.
+    Built from the JSON file on first use, then kept in sync by
+    insert_submission/update_submission and, for other processes'
+    writes, by the catch-up below. The backend (exact "flat" or
+    approximate "ivf") is chosen by EMBEDDING_INDEX_BACKEND.
+    """
+    if collection_name not in embedding_index.INDEXED_COLLECTIONS:
+        raise ValueError(f"Collection '{collection_name}' has no embedding index")
+    index = embedding_index.get_index(
+        collection_name,
+        persist_path=os.path.join(DB_DIR, f"{collection_name}.ivf.npz"),
+        store=_get_embedding_store(collection_name)
+    )
+    if not index.loaded:
+        with _db_lock:
+            index.rebuild(list(_get_cached(collection_name).docs.values()))
+        print(f"Built embedding index for '{collection_name}' with {len(index)} rows.")
+    else:
+        # Applies reports other worker processes appended since our last
+        # read (_apply_external syncs them into the index)
+        _get_cached(collection_name)
+    return index
\ No newline at end of file
@@ -0,0 +1,271 @@
+# app/utils/log_store.py
+import json
+import os
+import threading
+from typing import List, Dict, Any, Optional, Iterator
+
+# Compact once superseded entries outnumber live records by this factor
+# (and there are at least COMPACT_MIN_DEAD of them).
+COMPACT_DEAD_RATIO = 1.0
+COMPACT_MIN_DEAD = 1000
+
+# fsync every append. Turn off (JSON_DB_FSYNC=0) only for throwaway data.
+FSYNC_WRITES = os.getenv("JSON_DB_FSYNC", "1") == "1"
+
+
+def _encode(entry: Dict[str, Any]) -> bytes:
+    # default=str ensures datetimes are saved in ISO format
+    return (json.dumps(entry, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class LogStore:
+    """
+    Append-only, log-structured storage for one collection.
+
+    The file is JSON lines. Each line is either a full document
+    ({"op": "put", "doc": {...}}) or a shallow patch of top-level keys
+    ({"op": "update", "_id": ..., "set": {...}}). On open the file is
+    scanned once to build an in-memory table of `_id -> [offsets]`, so
+    an insert or update is a single append and a lookup reads only the
+    lines that belong to that record. Compaction rewrites the live
+    records into a fresh file when superseded entries pile up.
+
+    Several processes may share one file as long as every writer holds
+    a common lock (json_db's file lock) around catch_up() and its
+    appends: catch_up() indexes entries appended by the others and
+    returns them, so caches built on top can apply just those.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._offsets: Dict[str, List[int]] = {}
+        self._dead = 0
+        self._file = None
+        self._inode = None
+        self._size = 0 # Bytes indexed so far
+        self._open()
+
+    # --- Opening / Recovery ---
+
+    def _open(self):
+        """Scans the log, builds the offset table and drops a torn tail."""
+        self._offsets = {}
+        self._dead = 0
+        if not os.path.exists(self.path):
+            open(self.path, "wb").close()
+
+        good_end = 0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # Torn write from a crash: ignore the partial line
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self._index_entry(entry, offset)
+                offset += len(line)
+                good_end = offset
+
+        if good_end != os.path.getsize(self.path):
+            print(f"Warning: Truncating torn tail of {self.path} at byte {good_end}")
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+
+        self._file = open(self.path, "ab")
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._size = good_end
+
+    def _index_entry(self, entry: Dict[str, Any], offset: int):
+        op = entry.get("op")
+        if op == "put":
+            doc_id = entry["doc"].get("_id")
+            if doc_id in self._offsets:
+                self._dead += len(self._offsets[doc_id])
+            self._offsets[doc_id] = [offset]
+        elif op == "update":
+            chain = self._offsets.get(entry.get("_id"))
+            if chain is None:
+                self._dead += 1 # Patch for a record we never saw
+            else:
+                chain.append(offset)
+                self._dead += 1
+
+    def reopen(self):
+        """Re-scans the file, e.g. after another process changed it."""
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self._open()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def catch_up(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Indexes entries other processes appended since our last look and
+        returns them in order ([] if none). Returns None if the file was
+        replaced (compacted elsewhere): reopen() and reload instead.
+        A partial last line is left for the next call.
+        """
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return None
+            if st.st_ino != self._inode or st.st_size < self._size:
+                return None
+            entries = []
+            if st.st_size == self._size:
+                return entries
+            with open(self.path, "rb") as f:
+                f.seek(self._size)
+                offset = self._size
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break # Still being written
+                    entry = json.loads(line)
+                    self._index_entry(entry, offset)
+                    entries.append(entry)
+                    offset += len(line)
+            self._size = offset
+            return entries
+
+    # --- Writing ---
+
+    def _append(self, entry: Dict[str, Any]) -> int:
+        """Appends one entry durably and returns its offset."""
+        data = _encode(entry)
+        offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(data)
+        self._file.flush()
+        if FSYNC_WRITES:
+            os.fsync(self._file.fileno())
+        self._size = offset + len(data)
+        return offset
+
+    def put(self, doc: Dict[str, Any]):
+        """Writes a full document (insert or replace)."""
+        with self._lock:
+            entry = {"op": "put", "doc": doc}
+            self._index_entry(entry, self._append(entry))
+            self._maybe_compact()
+
+    def put_many(self, docs: List[Dict[str, Any]]):
+        """Writes several full documents with a single append and fsync."""
+        self.append_entries([{"op": "put", "doc": doc} for doc in docs])
+
+    def append_entries(self, entries: List[Dict[str, Any]], sync: bool = True):
+        """
+        Appends several put/update entries with a single write. With
+        sync=False the data is flushed to the OS but not fsynced; the
+        caller must make it durable some other way (json_db's journal).
+        """
+        with self._lock:
+            encoded = [_encode(entry) for entry in entries]
+            offset = self._file.seek(0, os.SEEK_END)
+            self._file.write(b"".join(encoded))
+            self._file.flush()
+            if sync and FSYNC_WRITES:
+                os.fsync(self._file.fileno())
+            for entry, data in zip(entries, encoded):
+                self._index_entry(entry, offset)
+                offset += len(data)
+            self._size = offset
+            self._maybe_compact()
+
+    def sync(self):
+        """fsyncs appends made with sync=False."""
+        with self._lock:
+            if self._file and FSYNC_WRITES:
+                os.fsync(self._file.fileno())
+
+    def update(self, doc_id: str, updates: Dict[str, Any]) -> bool:
+        """Appends a shallow top-level patch. Returns False if the id is unknown."""
+        with self._lock:
+            if doc_id not in self._offsets:
+                return False
+            entry = {"op": "update", "_id": doc_id, "set": updates}
+            self._index_entry(entry, self._append(entry))
+            self._maybe_compact()
+            return True
+
+    # --- Reading ---
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _read_entry(self, offset: int) -> Dict[str, Any]:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Materializes one document from its put + patches."""
+        with self._lock:
+            chain = self._offsets.get(doc_id)
+            if chain is None:
+                return None
+            doc = self._read_entry(chain[0])["doc"]
+            for offset in chain[1:]:
+                doc.update(self._read_entry(offset)["set"])
+            return doc
+
+    def iter_docs(self) -> Iterator[Dict[str, Any]]:
+        """Yields every live document in insertion order (one sequential scan)."""
+        with self._lock:
+            docs: Dict[str, Dict[str, Any]] = {}
+            with open(self.path, "rb") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["op"] == "put":
+                        docs[entry["doc"].get("_id")] = entry["doc"]
+                    elif entry["op"] == "update" and entry["_id"] in docs:
+                        docs[entry["_id"]].update(entry["set"])
+        return iter(docs.values())
+
+    # --- Compaction ---
+
+    def _maybe_compact(self):
+        if self._dead >= COMPACT_MIN_DEAD and self._dead >= COMPACT_DEAD_RATIO * len(self._offsets):
+            self.compact()
+
+    def compact(self):
+        """Rewrites only the live, fully-merged documents, then swaps files."""
+        with self._lock:
+            tmp_path = self.path + ".compact"
+            with open(tmp_path, "wb") as out:
+                for doc in self.iter_docs():
+                    out.write(_encode({"op": "put", "doc": doc}))
+                out.flush()
+                os.fsync(out.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            print(f"Compacted {self.path}: dropped {self._dead} superseded entries.")
+            self._open()
+
+
+def migrate_json_list(json_path: str, store: LogStore):
+    """
+    One-time import of a legacy whole-file JSON list into an empty log.
+    The old file is renamed to '<name>.migrated' so it is not read again.
+    """
+    if not os.path.exists(json_path) or len(store) > 0:
+        return
+    try:
+        with open(json_path, "r") as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, OSError):
+        data = []
+    if isinstance(data, list):
+        store.put_many([doc for doc in data if isinstance(doc, dict) and doc.get("_id")])
+        print(f"Migrated {len(data)} records from {json_path} to {store.path}")
+    os.replace(json_path, json_path + ".migrated")
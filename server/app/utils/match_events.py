@@ -0,0 +1,84 @@
+# app/utils/match_events.py
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+# --- Configuration ---
+# Events buffered per open connection. A client that stops reading has
+# further events dropped; the report status endpoint still has them.
+MATCH_EVENTS_QUEUE = int(os.getenv("MATCH_EVENTS_QUEUE", "32"))
+# Seconds between keep-alive comments on an idle stream, so proxies do
+# not close it.
+MATCH_EVENTS_KEEPALIVE = float(os.getenv("MATCH_EVENTS_KEEPALIVE", "20"))
+# Delay a dropped EventSource waits before reconnecting
+MATCH_EVENTS_RETRY_MS = int(os.getenv("MATCH_EVENTS_RETRY_MS", "5000"))
+# Seconds between checks for writes made by other worker processes
+# while streams are open (their matches are published from here, see
+# match_jobs._on_report_update)
+MATCH_EVENTS_POLL = float(os.getenv("MATCH_EVENTS_POLL", "1"))
+
+# user_id -> open connections, each a (loop, queue) pair. Events are
+# published from worker threads, so queues are fed through their loop.
+_subscribers: Dict[str, List[Tuple["asyncio.AbstractEventLoop", "asyncio.Queue"]]] = {}
+_lock = threading.Lock()
+_stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+
+def subscribe(user_id: str) -> "asyncio.Queue":
+    """Opens a connection's event queue for a user. Call from the event loop."""
+    queue = asyncio.Queue(maxsize=MATCH_EVENTS_QUEUE)
+    with _lock:
+        _subscribers.setdefault(user_id, []).append((asyncio.get_running_loop(), queue))
+    return queue
+
+def unsubscribe(user_id: str, queue: "asyncio.Queue"):
+    with _lock:
+        remaining = [entry for entry in _subscribers.get(user_id, []) if entry[1] is not queue]
+        if remaining:
+            _subscribers[user_id] = remaining
+        else:
+            _subscribers.pop(user_id, None)
+
+def _deliver(queue: "asyncio.Queue", message: Dict[str, Any]):
+    try:
+        queue.put_nowait(message)
+        delivered = "delivered"
+    except asyncio.QueueFull:
+        delivered = "dropped"
+    with _lock:
+        _stats[delivered] += 1
+
+def publish(user_id: Optional[str], event: str, data: Dict[str, Any]):
+    """
+    Sends an event to every open connection of a user. Safe to call from
+    any thread; a user with no connection open is skipped at no cost.
+    """
+    if not user_id:
+        return
+    message = {"event": event, "data": data}
+    with _lock:
+        targets = list(_subscribers.get(user_id, ()))
+        _stats["published"] += 1
+    for loop, queue in targets:
+        try:
+            loop.call_soon_threadsafe(_deliver, queue, message)
+        except RuntimeError:
+            pass # Loop already closed; the connection is going away
+
+def format_event(message: Dict[str, Any]) -> str:
+    """Encodes one message in the text/event-stream format."""
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+def has_subscribers() -> bool:
+    with _lock:
+        return bool(_subscribers)
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            **_stats,
+            "users": len(_subscribers),
+            "connections": sum(len(entries) for entries in _subscribers.values()),
+        }
@@ -0,0 +1,496 @@
+# app/utils/match_jobs.py
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from app.utils import recognition, inference, match_events, embedding_index, storage
+from app.utils.storage import db
+from app.utils.executors import BoundedExecutor, ExecutorSaturated
+from app.utils.models import MatchInfo
+
+# --- Configuration ---
+# Reports waiting for embedding + matching. When full, new reports are
+# refused with 503 before anything is written.
+MATCH_JOB_MAX_QUEUE = int(os.getenv("MATCH_JOB_MAX_QUEUE", "256"))
+# Jobs processed concurrently. Embedding is further limited by the
+# inference pool; the match step itself always runs one at a time.
+MATCH_JOB_WORKERS = int(os.getenv("MATCH_JOB_WORKERS", "2"))
+# Pause before retrying a job whose embedding hit a full inference pool
+MATCH_JOB_RETRY_SECONDS = float(os.getenv("MATCH_JOB_RETRY_SECONDS", "1"))
+# A job that raises (e.g. the models could not be loaded) is queued again
+# after MATCH_JOB_BACKOFF_SECONDS, doubling each time, and only marked
+# failed after MATCH_JOB_MAX_ATTEMPTS attempts.
+MATCH_JOB_MAX_ATTEMPTS = int(os.getenv("MATCH_JOB_MAX_ATTEMPTS", "3"))
+MATCH_JOB_BACKOFF_SECONDS = float(os.getenv("MATCH_JOB_BACKOFF_SECONDS", "30"))
+# Searches again when the best candidate was claimed by another server
+# process between the search and the write, up to this many times.
+MATCH_CLAIM_ATTEMPTS = 3
+
+# Job states, stored on the submission as match_job.status
+QUEUED, EMBEDDING, MATCHING, DONE, FAILED = "queued", "embedding", "matching", "done", "failed"
+PENDING_STATES = (QUEUED, EMBEDDING, MATCHING)
+
+ROLE_COLLECTIONS = {"parent": "parents", "volunteer": "volunteers"}
+
+# One match at a time per process: two new reports searching
+# concurrently could otherwise both claim the same unmatched candidate.
+# (Across processes, the claim is re-checked inside a storage transaction.)
+_match_executor = BoundedExecutor("match", kind="thread", max_workers=1, max_queue=MATCH_JOB_MAX_QUEUE)
+
+_queue: Optional["asyncio.Queue"] = None
+_loop: Optional["asyncio.AbstractEventLoop"] = None
+_workers: List["asyncio.Task"] = []
+_stats_lock = threading.Lock()
+_stats = {
+    "ingested": 0, "total_ingest_s": 0.0,
+    "completed": 0, "failed": 0, "retried": 0, "matched": 0, "retries": 0,
+    "prefilter_hits": 0, "prefilter_fallbacks": 0, "served_from_cache": 0,
+    "total_embed_s": 0.0, "total_match_s": 0.0, "total_queue_s": 0.0,
+}
+_started_at = time.monotonic()
+
+
+# --- Matching ---
+
+def _opposite(collection_name: str) -> Tuple[str, str, str]:
+    """(search collection, my match key, their match key) for a report collection."""
+    if collection_name == 'parents':
+        return 'volunteers', "volunteer_report_id", "parent_report_id"
+    return 'parents', "parent_report_id", "volunteer_report_id"
+
+def _matchable(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Candidates under the match threshold, as cached in the match_candidates collection."""
+    return [
+        {key: c[key] for key in ("submission_id", "distance", "similarity")}
+        for c in candidates if c["is_match"]
+    ]
+
+def _search(index: embedding_index.EmbeddingIndex, new_emb: list, query: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Open candidates under the match threshold, nearest first (at most
+    MATCH_CANDIDATES_K, from one top-K search). With a pre-filter query,
+    only the rows it selects are scanned first; the full index is
+    searched when they give no match.
+    """
+    if query:
+        rows = index.filter_rows(query)
+        print(f"Pre-filter kept {rows.size} of {len(index)} indexed embeddings.")
+        ranked = _matchable(recognition.find_top_k_in_index(new_emb, index, rows=rows)) if rows.size else []
+        with _stats_lock:
+            _stats["prefilter_hits" if ranked else "prefilter_fallbacks"] += 1
+        if ranked:
+            return ranked
+        print("No match among pre-filtered candidates, searching all of them.")
+    return _matchable(recognition.find_top_k_in_index(new_emb, index))
+
+def _claim_first(submission_id: str, collection_name: str, ranked: List[Dict[str, Any]]) -> Tuple[Optional[dict], bool]:
+    """
+    Matches a report with the first candidate in `ranked` that is still
+    open, trying them in order. The candidates after it are cached in
+    the match_candidates collection (keyed by the report's _id, never on
+    the report itself, which /api/match returns), so a rejection can
+    move on to the next one without another scan (see
+    match_next_candidate).
+
+    Returns (the claimed candidate or None, whether the report itself is
+    still open).
+    """
+    search_collection, my_match_key, their_match_key = _opposite(collection_name)
+    for position, candidate in enumerate(ranked):
+        matched_id = candidate["submission_id"]
+        similarity = candidate["similarity"]
+
+        # --- Update Both Records ---
+        # 1. Update the report we are matching
+        new_match_info = MatchInfo(
+            **{my_match_key: matched_id, "score": similarity, "confirmed": False}
+        ).model_dump() # Use model_dump() for Pydantic v2
+
+        # 2. Update the candidate found in DB
+        existing_match_info = MatchInfo(
+            **{their_match_key: submission_id, "score": similarity, "confirmed": False}
+        ).model_dump()
+
+        # Both sides of the match are written in one transaction, after
+        # checking (under the lock, with other processes' writes applied)
+        # that neither was matched since the search.
+        with db.transaction() as txn:
+            mine = db.find_submission(submission_id, collection_name)
+            theirs = db.find_submission(matched_id, search_collection)
+            mine_open = bool(mine) and embedding_index.is_open_for_matching(mine)
+            claimed = mine_open and bool(theirs) and embedding_index.is_open_for_matching(theirs)
+            if claimed:
+                txn.update_submission(submission_id, {"match": new_match_info}, collection_name)
+                txn.insert_submission({"_id": submission_id, "candidates": ranked[position + 1:]}, "match_candidates")
+                txn.update_submission(matched_id, {"match": existing_match_info}, search_collection)
+        if not mine_open:
+            print(f"Submission {submission_id} was matched meanwhile.")
+            return None, False
+        if claimed:
+            # (Both reporters are notified by _on_report_update)
+            print(f"MATCH FOUND! ID: {matched_id} with similarity: {similarity:.2f}")
+            return candidate, True
+        print(f"Candidate {matched_id} was claimed meanwhile, trying the next one.")
+    return None, True
+
+def find_and_update_match(
+    new_submission_id: str,
+    new_submission_role: str, # Note: This is "parent" or "volunteer" (singular)
+    new_emb: Optional[list]
+    ) -> Optional[dict]:
+    """
+    Compares a new submission against the *opposite* collection.
+    If a match is found, it updates both records in the database.
+    """
+    if not new_emb:
+        print(f"Submission {new_submission_id} has no embedding, skipping match.")
+        return None
+
+    my_collection_name = 'parents' if new_submission_role == 'parent' else 'volunteers' # Plural
+    search_collection = _opposite(my_collection_name)[0]
+
+    # Optional pre-filter on the child's city and age band (MATCH_PREFILTER)
+    query: Dict[str, List[Any]] = {}
+    if embedding_index.MATCH_PREFILTER:
+        query = embedding_index.prefilter_query(db.find_submission(new_submission_id, my_collection_name) or {})
+
+    for attempt in range(MATCH_CLAIM_ATTEMPTS):
+        # The resident index only scans rows that still have no match,
+        # so there is no per-candidate filtering to do here.
+        index = db.get_embedding_index(search_collection)
+        print(f"Searching {len(index)} indexed embeddings in '{search_collection}'...")
+
+        # Rank the K nearest, then take the first one still open
+        ranked = _search(index, new_emb, query)
+        if not ranked:
+            print("No match found above threshold.")
+            return None
+
+        result, still_open = _claim_first(new_submission_id, my_collection_name, ranked)
+        if result is not None or not still_open:
+            return result
+        print("Every ranked candidate was claimed meanwhile, searching again.")
+    return None
+
+def match_next_candidate(submission_id: str, collection_name: str, rejected_id: Optional[str] = None) -> Optional[dict]:
+    """
+    After a rejection: matches the report with the next open candidate
+    from its cached ranked list (match_candidates), without searching
+    the index again. Returns the new match, or None if the list is used
+    up (the report then waits for new reports, as before).
+    """
+    cached = db.find_submission(submission_id, "match_candidates")
+    if not cached:
+        return None
+    ranked = [c for c in cached["candidates"] if c["submission_id"] != rejected_id]
+    if not ranked:
+        return None
+    with _stats_lock:
+        _stats["served_from_cache"] += 1
+    return _claim_first(submission_id, collection_name, ranked)[0]
+
+def rank_candidates(submission_id: str, collection_name: str, k: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    The `k` nearest open reports of the opposite role, with distances,
+    from one index search. Read-only: the report's cached ranked list is
+    left as matching stored it. Returns None if the report has no
+    embedding (yet).
+    """
+    embedding = db.get_submission_embedding(submission_id, collection_name)
+    if embedding is None:
+        return None
+    index = db.get_embedding_index(_opposite(collection_name)[0])
+    return recognition.find_top_k_in_index(embedding, index, k=k)
+
+
+# --- Match Events ---
+# Published from the storage update listeners rather than where the
+# write happens: they run for this process's writes and for the ones
+# applied from other worker processes, so a user gets the event from
+# whichever worker holds their /api/events stream.
+
+def _on_report_update(collection_name: str, submission_id: str, updates: Dict[str, Any]):
+    match_info = updates.get("match") or {}
+    new_match = bool(match_info.get("parent_report_id") or match_info.get("volunteer_report_id")) \
+        and not match_info.get("confirmed")
+    finished = (updates.get("match_job") or {}).get("status") in (DONE, FAILED)
+    if not new_match and not finished:
+        return
+    doc = db.find_submission(submission_id, collection_name)
+    if not doc:
+        return
+    if new_match:
+        match_events.publish(doc.get("user_id"), "match", {
+            "submission_id": submission_id,
+            "role": "parent" if collection_name == "parents" else "volunteer",
+            "match": match_info,
+        })
+    if finished:
+        match_events.publish(doc.get("user_id"), "report_status", job_status(doc))
+
+for _collection_name in ("parents", "volunteers"):
+    db.add_update_listener(
+        _collection_name,
+        lambda submission_id, updates, collection_name=_collection_name:
+            _on_report_update(collection_name, submission_id, updates)
+    )
+
+
+# --- Job Queue ---
+
+def queued_job() -> Dict[str, Any]:
+    """match_job of a report that was just queued, for storing with the report itself."""
+    now = datetime.utcnow().isoformat()
+    return {"status": QUEUED, "updated_at": now, "queued_at": now, "worker": os.getpid()}
+
+def _set_status(submission_id: str, collection_name: str, status: str, txn: Optional[storage.Transaction] = None, **fields):
+    job = {"status": status, "updated_at": datetime.utcnow().isoformat(), **fields}
+    doc = db.find_submission(submission_id, collection_name) or {}
+    updates = {"match_job": {**(doc.get("match_job") or {}), **job}}
+    if txn is not None:
+        txn.update_submission(submission_id, updates, collection_name)
+        return
+    db.update_submission(submission_id, updates, collection_name)
+
+def queue_full() -> bool:
+    return _queue is not None and _queue.full()
+
+def _ensure_started():
+    """Creates the queue and worker tasks on the running event loop (once per loop)."""
+    global _queue, _loop
+    loop = asyncio.get_running_loop()
+    if _queue is None or _loop is not loop:
+        _loop = loop
+        _queue = asyncio.Queue(maxsize=MATCH_JOB_MAX_QUEUE)
+        _workers.clear()
+        for n in range(MATCH_JOB_WORKERS):
+            _workers.append(loop.create_task(_worker(_queue)))
+
+def enqueue(submission_id: str, role: str, digest: Optional[str] = None, mark_queued: bool = True):
+    """
+    Queues embedding + matching for a saved report. Call from the event
+    loop. Raises ExecutorSaturated if the queue is full (check queue_full()
+    before saving the report to refuse it cleanly instead). Pass
+    mark_queued=False if the report was saved with queued_job() already.
+    """
+    _ensure_started()
+    collection_name = ROLE_COLLECTIONS[role]
+    try:
+        _queue.put_nowait((submission_id, role, digest, time.monotonic()))
+    except asyncio.QueueFull:
+        raise ExecutorSaturated("match job queue is full")
+    if mark_queued:
+        _set_status(submission_id, collection_name, QUEUED, queued_at=datetime.utcnow().isoformat(), worker=os.getpid())
+
+def note_ingest(seconds: float):
+    """Records the request-side time of one accepted report."""
+    with _stats_lock:
+        _stats["ingested"] += 1
+        _stats["total_ingest_s"] += seconds
+
+async def _embed(image_source: str, digest: Optional[str]):
+    """Embeds on the inference pool, waiting out a full pool instead of failing."""
+    while True:
+        try:
+            return await inference.get_embedding_async(image_source, digest=digest)
+        except ExecutorSaturated:
+            with _stats_lock:
+                _stats["retries"] += 1
+            await asyncio.sleep(MATCH_JOB_RETRY_SECONDS)
+
+async def _run_job(submission_id: str, role: str, digest: Optional[str]):
+    collection_name = ROLE_COLLECTIONS[role]
+    doc = db.find_submission(submission_id, collection_name)
+    if doc is None:
+        return
+    image_source = db.resolve_image_path(doc.get("image_path"))
+    if image_source is None:
+        raise FileNotFoundError(f"Image of {submission_id} is missing")
+
+    _set_status(submission_id, collection_name, EMBEDDING)
+    started = time.monotonic()
+    embedding = await _embed(image_source, digest)
+    embedded = time.monotonic()
+    embedding_list = embedding.tolist() if embedding is not None else None
+    with db.transaction() as txn:
+        if embedding_list is not None:
+            txn.update_submission(submission_id, {"embedding": embedding_list}, collection_name)
+        _set_status(submission_id, collection_name, MATCHING, txn=txn)
+    result = await _match_executor.run(find_and_update_match, submission_id, role, embedding_list)
+    matched = time.monotonic()
+
+    _set_status(
+        submission_id, collection_name, DONE,
+        finished_at=datetime.utcnow().isoformat(),
+        face_found=embedding_list is not None,
+    )
+    with _stats_lock:
+        _stats["completed"] += 1
+        _stats["matched"] += result is not None
+        _stats["total_embed_s"] += embedded - started
+        _stats["total_match_s"] += matched - embedded
+
+async def _worker(queue: "asyncio.Queue"):
+    while True:
+        submission_id, role, digest, queued_at = await queue.get()
+        with _stats_lock:
+            _stats["total_queue_s"] += time.monotonic() - queued_at
+        try:
+            await _run_job(submission_id, role, digest)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Match job for {submission_id} failed: {e}")
+            try:
+                _job_failed(submission_id, role, digest, e)
+            except Exception:
+                pass
+        finally:
+            queue.task_done()
+
+def _job_failed(submission_id: str, role: str, digest: Optional[str], error: Exception):
+    """
+    Queues a failed job again after a backoff, or marks it failed once
+    it has used up MATCH_JOB_MAX_ATTEMPTS. A job waiting for its retry
+    stays queued, so resume_pending picks it up after a restart.
+    """
+    collection_name = ROLE_COLLECTIONS[role]
+    doc = db.find_submission(submission_id, collection_name)
+    if doc is None:
+        return
+    attempts = (doc.get("match_job") or {}).get("attempts", 0) + 1
+    if attempts >= MATCH_JOB_MAX_ATTEMPTS:
+        with _stats_lock:
+            _stats["failed"] += 1
+        _set_status(
+            submission_id, collection_name, FAILED,
+            error=str(error), attempts=attempts, finished_at=datetime.utcnow().isoformat(),
+        )
+        return
+    with _stats_lock:
+        _stats["retried"] += 1
+    delay = MATCH_JOB_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    _set_status(
+        submission_id, collection_name, QUEUED,
+        error=str(error), attempts=attempts, worker=os.getpid(),
+        retry_at=(datetime.utcnow() + timedelta(seconds=delay)).isoformat(),
+    )
+    asyncio.get_running_loop().call_later(delay, _retry, submission_id, role, digest)
+
+def _retry(submission_id: str, role: str, digest: Optional[str]):
+    try:
+        enqueue(submission_id, role, digest=digest, mark_queued=False)
+    except ExecutorSaturated:
+        asyncio.get_running_loop().call_later(MATCH_JOB_RETRY_SECONDS, _retry, submission_id, role, digest)
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _resumable(job: Dict[str, Any]) -> bool:
+    """Pending, or failed before MATCH_JOB_MAX_ATTEMPTS (jobs from before retries)."""
+    status = job.get("status")
+    return status in PENDING_STATES or (status == FAILED and job.get("attempts", 0) < MATCH_JOB_MAX_ATTEMPTS)
+
+def _claim_pending(submission_id: str, collection_name: str) -> bool:
+    """
+    Takes over a pending job unless another live server process (the
+    job's `worker`) still owns it, so that with several workers each
+    job is resumed once.
+    """
+    with db.transaction() as txn:
+        job = (db.find_submission(submission_id, collection_name) or {}).get("match_job") or {}
+        if not _resumable(job):
+            return False
+        owner = job.get("worker")
+        if owner and owner != os.getpid() and _process_alive(owner):
+            return False
+        txn.update_submission(submission_id, {"match_job": {**job, "worker": os.getpid()}}, collection_name)
+        return True
+
+def resume_pending():
+    """
+    Re-queues reports whose job was still pending (or waiting for a
+    retry) when the process stopped, and failed ones with attempts left;
+    their status lives on the submission. Call at startup.
+    """
+    _ensure_started()
+    resumed = 0
+    for role, collection_name in ROLE_COLLECTIONS.items():
+        for doc in db.list_submissions(collection_name):
+            if _resumable(doc.get("match_job") or {}):
+                if not _claim_pending(doc["_id"], collection_name):
+                    continue
+                try:
+                    enqueue(doc["_id"], role)
+                    resumed += 1
+                except ExecutorSaturated:
+                    print("Match job queue full; remaining pending jobs resume on next start.")
+                    return resumed
+    if resumed:
+        print(f"Resumed {resumed} pending match jobs.")
+    return resumed
+
+def job_status(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The public view of a submission's match job. The match fields come
+    from the record itself, so a report matched later by someone else's
+    job (or whose match was rejected) shows its current state.
+    """
+    job = doc.get("match_job") or {}
+    match = doc.get("match") or {}
+    match_found = bool(match.get("parent_report_id") or match.get("volunteer_report_id"))
+    return {
+        "submission_id": doc["_id"],
+        "status": job.get("status", DONE), # Reports from before the job queue
+        "face_found": job.get("face_found"),
+        "match_found": match_found,
+        "match_score": match.get("score") if match_found else None,
+        "error": job.get("error"),
+        "attempts": job.get("attempts", 0),
+        "retry_at": job.get("retry_at") if job.get("status") == QUEUED else None,
+        "queued_at": job.get("queued_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+def stats() -> Dict[str, Any]:
+    """Ingest and matching throughput, measured separately."""
+    with _stats_lock:
+        uptime = time.monotonic() - _started_at
+        ingested = _stats["ingested"] or 1
+        finished = _stats["completed"] or 1
+        return {
+            "ingest": {
+                "reports": _stats["ingested"],
+                "per_minute": 60 * _stats["ingested"] / uptime,
+                "avg_ms": 1000 * _stats["total_ingest_s"] / ingested,
+            },
+            "matching": {
+                "queued": _queue.qsize() if _queue is not None else 0,
+                "max_queue": MATCH_JOB_MAX_QUEUE,
+                "completed": _stats["completed"],
+                "failed": _stats["failed"],
+                "retried": _stats["retried"],
+                "matched": _stats["matched"],
+                "inference_retries": _stats["retries"],
+                "prefilter_hits": _stats["prefilter_hits"],
+                "prefilter_fallbacks": _stats["prefilter_fallbacks"],
+                "served_from_cache": _stats["served_from_cache"],
+                "per_minute": 60 * _stats["completed"] / uptime,
+                "avg_queue_ms": 1000 * _stats["total_queue_s"] / finished,
+                "avg_embed_ms": 1000 * _stats["total_embed_s"] / finished,
+                "avg_match_ms": 1000 * _stats["total_match_s"] / finished,
+            },
+        }
+
+def shutdown():
+    for task in _workers:
+        task.cancel()
+    _match_executor.shutdown()
@@ -1,67 +1,475 @@
 # app/utils/recognition.py
 import numpy as np
 from PIL import Image
-from facenet_pytorch import MTCNN, InceptionResnetV1
-import torch
 import io
+import math
+import os
+import queue
+import threading
+from concurrent.futures import Future
 # FIX: Import Union for Python 3.9 compatibility
-from typing import List, Dict, Any, Optional, Union 
+from typing import List, Dict, Any, Optional, Union, Tuple, TYPE_CHECKING
 import time
+from app.utils.embedding_index import EmbeddingIndex
+from app.utils.executors import ExecutorSaturated
+
+if TYPE_CHECKING:
+    import torch
+
+# --- Lazy Model Loading ---
+# torch and facenet_pytorch are imported, and the models built, on the
+# first embedding request (or by warm_up_in_background). Workers that
+# only serve auth/match routes never pay for them.
 
 # Use CPU, as GPU might not be available in all prototype environments
 # Change to "cuda:0" if you have a GPU and torch with CUDA installed
-device = torch.device("cpu") 
+DEVICE_NAME = os.getenv("RECOGNITION_DEVICE", "cpu")
+
+# --- Optimized CPU Inference (opt-in) ---
+# Comma-separated subset of "channels_last", "quantize" (dynamic int8 on
+# Linear layers) and "jit" (trace + freeze). Check the result with
+# scripts/check_embedding_parity.py before enabling it in production.
+RECOGNITION_OPTIMIZE = [
+    opt.strip() for opt in os.getenv("RECOGNITION_OPTIMIZE", "").split(",") if opt.strip()
+]
+# torch intra-op threads; 0 keeps torch's default (one per core)
+RECOGNITION_NUM_THREADS = int(os.getenv("RECOGNITION_NUM_THREADS", "0"))
+
+# Images are decoded at most this many pixels on the long side for face
+# detection. JPEGs are decoded straight at a reduced scale, so detection
+# never works on a 48 MP bitmap; the face crop decodes the original again
+# at the scale it needs (see below), so embeddings do not depend on this
+# setting.
+RECOGNITION_MAX_SIDE = int(os.getenv("RECOGNITION_MAX_SIDE", "1600"))
 
-print(f"Running facial recognition on device: {device}")
+# The face crop re-reads the original at the smallest JPEG draft scale
+# that keeps the face box at least CROP_FACE_SIDE pixels (twice the
+# 160 px crop, so the resampled crop matches one from the full decode),
+# but never above RECOGNITION_CROP_MAX_SIDE on the long side, which
+# bounds its memory. Only the region around the face is converted.
+CROP_FACE_SIDE = 320
+RECOGNITION_CROP_MAX_SIDE = int(os.getenv("RECOGNITION_CROP_MAX_SIDE", "4096"))
 
-try:
-    mtcnn = MTCNN(
-        image_size=160, 
-        margin=20, 
-        keep_all=False, 
-        device=device,
-        post_process=False # We want tensors, not PIL Images
-    )
-    resnet = InceptionResnetV1(pretrained="vggface2").eval().to(device)
-except Exception as e:
-    print(f"Warning: Could not load facenet models. ML will fail. Error: {e}")
-    mtcnn = None
-    resnet = None
+# MTCNN runs on a copy box-reduced to at most this long side (its image
+# pyramid costs grow with pixel count); the face is then cropped from a
+# re-read of the original. Faces smaller than ~20 px at this size are
+# missed, so lower it only for portrait-style photos. 0 detects on the
+# full decode.
+RECOGNITION_DETECT_SIDE = int(os.getenv("RECOGNITION_DETECT_SIDE", "640"))
 
-def image_bytes_to_embedding(img_bytes: bytes) -> Optional[np.ndarray]:
+# Image input: raw bytes, or the path of a file on disk
+ImageSource = Union[bytes, str]
+
+
+class EmbeddingFailed(RuntimeError):
     """
-    Takes image bytes, detects a face, and returns the 512D embedding.
+    The models could not tell whether a photo has a face (not loaded, or
+    inference raised). Unlike a None embedding, this is not a result and
+    must not be cached as one.
     """
-    if not resnet or not mtcnn:
-        print("Error: Facenet models are not loaded.")
-        return None
-        
+
+
+device = None
+mtcnn = None
+resnet = None
+# The unmodified fp32 model; only kept when an optimized path is enabled
+resnet_fp32 = None
+_channels_last = False
+_models_loaded = False
+_models_lock = threading.Lock()
+_load_seconds: Optional[float] = None
+
+def load_models():
+    """Builds MTCNN and InceptionResnetV1 once per process (thread-safe)."""
+    global device, mtcnn, resnet, resnet_fp32, _models_loaded, _load_seconds
+    if _models_loaded:
+        return
+    with _models_lock:
+        if _models_loaded:
+            return
+        started = time.monotonic()
+        try:
+            import torch
+            from facenet_pytorch import MTCNN, InceptionResnetV1
+
+            device = torch.device(DEVICE_NAME)
+            print(f"Running facial recognition on device: {device}")
+            mtcnn = MTCNN(
+                image_size=160, 
+                margin=20, 
+                keep_all=False, 
+                device=device,
+                post_process=False # We want tensors, not PIL Images
+            )
+            if RECOGNITION_NUM_THREADS > 0:
+                torch.set_num_threads(RECOGNITION_NUM_THREADS)
+            resnet = InceptionResnetV1(pretrained="vggface2").eval().to(device)
+            if RECOGNITION_OPTIMIZE:
+                resnet_fp32 = resnet
+                resnet = optimize_model(resnet, RECOGNITION_OPTIMIZE)
+        except Exception as e:
+            print(f"Warning: Could not load facenet models. ML will fail. Error: {e}")
+            mtcnn = None
+            resnet = None
+        _load_seconds = time.monotonic() - started
+        _models_loaded = True
+        print(f"Facenet models loaded in {_load_seconds:.2f}s")
+
+def optimize_model(model, options: List[str]):
+    """
+    Returns an optimized copy of an fp32 InceptionResnetV1 for CPU inference.
+    Each step is applied independently; a step that fails is skipped.
+    """
+    global _channels_last
+    import copy
+    import torch
+
+    model = copy.deepcopy(model).eval()
+    example = torch.zeros(1, 3, 160, 160, device=device)
+
+    if "channels_last" in options:
+        model = model.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+        _channels_last = True
+        print("Recognition: using channels_last layout")
+
+    if "quantize" in options:
+        try:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            print("Recognition: dynamic int8 quantization applied")
+        except Exception as e:
+            print(f"Warning: Dynamic quantization failed, skipping. Error: {e}")
+
+    if "jit" in options:
+        try:
+            with torch.no_grad():
+                traced = torch.jit.trace(model, example)
+                model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+            print("Recognition: TorchScript trace + freeze applied")
+        except Exception as e:
+            print(f"Warning: TorchScript optimization failed, skipping. Error: {e}")
+
+    return model
+
+def warm_up_in_background() -> threading.Thread:
+    """Starts loading the models on a daemon thread and returns it."""
+    thread = threading.Thread(target=load_models, name="recognition-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def model_status() -> Dict[str, Any]:
+    return {
+        "loaded": _models_loaded and resnet is not None,
+        "load_seconds": _load_seconds,
+        "optimizations": RECOGNITION_OPTIMIZE,
+    }
+
+def _decode_image(source: ImageSource) -> Optional[Image.Image]:
     try:
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+        img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        img.draft("RGB", (RECOGNITION_MAX_SIDE, RECOGNITION_MAX_SIDE))
+        img = img.convert("RGB")
+        img.thumbnail((RECOGNITION_MAX_SIDE, RECOGNITION_MAX_SIDE))
+        return img
     except Exception as e:
         print(f"Error opening image: {e}")
         return None
+
+def _detection_image(img: Image.Image) -> Image.Image:
+    """Box-reduces an image so its long side is at most RECOGNITION_DETECT_SIDE."""
+    if RECOGNITION_DETECT_SIDE <= 0:
+        return img
+    factor = math.ceil(max(img.size) / RECOGNITION_DETECT_SIDE)
+    return img.reduce(factor) if factor > 1 else img
+
+def _crop_region(img: Image.Image, source: ImageSource, box: np.ndarray) -> Tuple[Image.Image, np.ndarray]:
+    """
+    The region around `box` (given on `img`) decoded from the original at
+    the scale the face crop needs, and the box on that region. Falls back
+    to `img` when its decode already has that scale.
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as full:
+        width, height = full.size
+        factor = width / img.width
+        face_side = max(1.0, min(box[2] - box[0], box[3] - box[1]) * factor)
+        scale = min(1.0, CROP_FACE_SIDE / face_side, RECOGNITION_CROP_MAX_SIDE / max(width, height))
+        if scale * width <= img.width:
+            return img, box
+        # JPEG only: decodes at the smallest 1/2^n scale of at least this size
+        full.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        box = box * (full.width / img.width)
+        # Padding covers MTCNN's margin, so its clamping to the image bounds is unchanged
+        pad = max(box[2] - box[0], box[3] - box[1]) / 2
+        region = (
+            max(0, math.floor(box[0] - pad)),
+            max(0, math.floor(box[1] - pad)),
+            min(full.width, math.ceil(box[2] + pad)),
+            min(full.height, math.ceil(box[3] + pad)),
+        )
+        crop = full.crop(region).convert("RGB")
+    return crop, box - np.array([region[0], region[1], region[0], region[1]], dtype=np.float64)
+
+def _crop_face(img: Image.Image, source: ImageSource, small: Image.Image, boxes, probs, points) -> Optional["torch.Tensor"]:
+    """
+    Picks the face MTCNN would pick from the boxes found on `small`,
+    maps the box back to the original of `img` and extracts the aligned
+    crop from the region around it (see _crop_region).
+    """
+    if boxes is None:
+        return None
+    box, _, _ = mtcnn.select_boxes(boxes, probs, points, small, method=mtcnn.selection_method)
+    if box is None:
+        return None
+    scale_x = img.width / small.width
+    scale_y = img.height / small.height
+    box = np.asarray(box, dtype=np.float64) * np.array([scale_x, scale_y, scale_x, scale_y])
+    region, box = _crop_region(img, source, box)
+    return mtcnn.extract(region, box, None)
+
+def _detect_faces(imgs: List[Image.Image], sources: List[ImageSource]) -> List[Union["torch.Tensor", None, EmbeddingFailed]]:
+    """
+    Returns the aligned 160x160 face tensor (or None) for each decoded
+    image, or EmbeddingFailed for images whose detection batch raised.
+    Detection runs on a reduced copy of each image (see _detection_image)
+    and the face is cropped from a re-read of its source. MTCNN can only batch
+    images of identical size, so images are grouped by reduced size and
+    each group goes through detection as one batch.
+    """
+    faces: List[Union["torch.Tensor", None, EmbeddingFailed]] = [None] * len(imgs)
+    smalls = [_detection_image(img) for img in imgs]
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for i, small in enumerate(smalls):
+        groups.setdefault(small.size, []).append(i)
+
+    for slots in groups.values():
+        try:
+            # Detect face(s) on the reduced images
+            batch_boxes, batch_probs, batch_points = mtcnn.detect([smalls[i] for i in slots], landmarks=True)
+            detected = [
+                _crop_face(imgs[i], sources[i], smalls[i], boxes, probs, points)
+                for i, boxes, probs, points in zip(slots, batch_boxes, batch_probs, batch_points)
+            ]
+        except Exception as e:
+            print(f"Error during face detection: {e}")
+            for slot in slots:
+                faces[slot] = EmbeddingFailed(f"face detection failed: {e}")
+            continue
+        for slot, face in zip(slots, detected):
+            if face is None:
+                print("No face detected.")
+            faces[slot] = face
+    return faces
+
+def _embed_faces(faces: List["torch.Tensor"], model) -> np.ndarray:
+    """Runs one batched forward pass and returns an (N, 512) float array."""
+    import torch # Already imported by load_models(); this is a dict lookup
+
+    # Stack into one (N, 3, 160, 160) batch and send to device
+    batch = torch.stack(faces).to(device)
+    if _channels_last:
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    
+    # Generate embeddings
+    with torch.no_grad():
+        embs = model(batch)
         
+    # Detach from graph, move to CPU, convert to numpy
+    return embs.detach().cpu().numpy()
+
+def _embed_batch(images: List[ImageSource]) -> List[Union[np.ndarray, None, EmbeddingFailed]]:
+    """
+    Embeds a batch of images: batched MTCNN detection (per image size),
+    then a single batched InceptionResnetV1 forward pass over every
+    detected face. Returns, per input and in order, the 512D embedding,
+    None when the photo has no detectable face (or cannot be decoded), or
+    EmbeddingFailed when the models could not give an answer.
+    """
+    results: List[Union[np.ndarray, None, EmbeddingFailed]] = [None] * len(images)
+    load_models()
+    if resnet is None or mtcnn is None:
+        print("Error: Facenet models are not loaded.")
+        return [EmbeddingFailed("facenet models are not loaded")] * len(images)
+
+    decoded = [(i, _decode_image(source)) for i, source in enumerate(images)]
+    decoded = [(i, img) for i, img in decoded if img is not None]
+    detected = _detect_faces([img for _, img in decoded], [images[i] for i, _ in decoded])
+
+    faces = []
+    face_slots = []
+    for (i, _), face in zip(decoded, detected):
+        if isinstance(face, EmbeddingFailed):
+            results[i] = face
+        elif face is not None:
+            faces.append(face)
+            face_slots.append(i)
+
+    if not faces:
+        return results
+
     try:
-        # Detect face
-        face = mtcnn(img)
-        
-        if face is None:
-            print("No face detected.")
-            return None
-        
-        # Add batch dimension and send to device
-        face = face.unsqueeze(0).to(device)
-        
-        # Generate embedding
-        with torch.no_grad():
-            emb = resnet(face)
-            
-        # Detach from graph, move to CPU, convert to numpy, and flatten
-        return emb.detach().cpu().numpy()[0]
+        embs = _embed_faces(faces, resnet)
     except Exception as e:
         print(f"Error during embedding generation: {e}")
-        return None
+        for slot in face_slots:
+            results[slot] = EmbeddingFailed(f"embedding generation failed: {e}")
+        return results
+
+    for row, slot in enumerate(face_slots):
+        results[slot] = embs[row]
+    return results
+
+def images_to_embeddings(images: List[ImageSource]) -> List[Optional[np.ndarray]]:
+    """
+    Embeds a batch of images (see _embed_batch). Returns one 512D
+    embedding (or None) per input, in order; failures also give None.
+    """
+    return [None if isinstance(emb, EmbeddingFailed) else emb for emb in _embed_batch(images)]
+
+def image_bytes_to_embedding(img_bytes: ImageSource) -> Optional[np.ndarray]:
+    """
+    Takes image bytes (or an image file path), detects a face, and
+    returns the 512D embedding.
+    """
+    return images_to_embeddings([img_bytes])[0]
+
+def embed_image(img_bytes: ImageSource) -> Optional[np.ndarray]:
+    """
+    Like image_bytes_to_embedding, but None only ever means "no face":
+    raises EmbeddingFailed when the models are missing or inference fails.
+    """
+    result = _embed_batch([img_bytes])[0]
+    if isinstance(result, EmbeddingFailed):
+        raise result
+    return result
+
+def check_optimized_parity(images: List[bytes]) -> Dict[str, Any]:
+    """
+    Compares the optimized model against the fp32 model on a reference set.
+
+    Reports per-image embedding drift (L2 between fp32 and optimized
+    embeddings) and, for every pair of reference images, whether the
+    match decision (distance < MATCH_THRESHOLD_DISTANCE) changed.
+    """
+    load_models()
+    if resnet is None or mtcnn is None:
+        raise RuntimeError("Facenet models are not loaded.")
+    if resnet_fp32 is None:
+        raise RuntimeError("No optimized path enabled; set RECOGNITION_OPTIMIZE first.")
+
+    decoded = [(b, img) for b, img in ((b, _decode_image(b)) for b in images) if img is not None]
+    detected = _detect_faces([img for _, img in decoded], [b for b, _ in decoded])
+    faces = [face for face in detected if face is not None and not isinstance(face, EmbeddingFailed)]
+    if not faces:
+        raise RuntimeError("No faces detected in the reference set.")
+
+    ref = _embed_faces(faces, resnet_fp32)
+    opt = _embed_faces(faces, resnet)
+    drift = np.linalg.norm(ref - opt, axis=1)
+
+    def decisions(embs: np.ndarray) -> np.ndarray:
+        dists = np.linalg.norm(embs[:, None, :] - embs[None, :, :], axis=2)
+        upper = np.triu_indices(len(embs), k=1)
+        return dists[upper] < MATCH_THRESHOLD_DISTANCE
+
+    ref_decisions = decisions(ref)
+    changed = int(np.count_nonzero(ref_decisions != decisions(opt)))
+    return {
+        "optimizations": RECOGNITION_OPTIMIZE,
+        "faces": len(faces),
+        "max_drift": float(drift.max()),
+        "mean_drift": float(drift.mean()),
+        "pairs": int(ref_decisions.size),
+        "matching_pairs_fp32": int(np.count_nonzero(ref_decisions)),
+        "changed_decisions": changed,
+        "decisions_unchanged": changed == 0,
+    }
+
+
+# --- Micro-batching ---
+
+class EmbeddingBatcher:
+    """
+    Groups concurrent embedding requests into batched forward passes.
+
+    `submit` queues an image and returns a Future. A background thread
+    takes the first waiting request, keeps collecting until it has
+    `max_batch_size` requests or `max_wait_ms` has passed, runs them
+    through _embed_batch as one batch and resolves each Future (with
+    EmbeddingFailed for images the models could not process).
+    Under bursty load, per-core throughput then grows with the batch
+    size instead of paying a batch-of-one forward pass per upload.
+    """
+
+    def __init__(self, max_batch_size: int = 8, max_wait_ms: float = 10.0, max_queue: int = 64):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[Tuple[ImageSource, Future]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "rejected": 0}
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, img_bytes: ImageSource) -> Future:
+        """Queues one image. Raises ExecutorSaturated if the queue is full."""
+        self._ensure_started()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((img_bytes, future))
+        except queue.Full:
+            self._stats["rejected"] += 1
+            raise ExecutorSaturated("embedding batcher queue is full")
+        return future
+
+    def _collect(self) -> List[Tuple[ImageSource, Future]]:
+        batch = [self._queue.get()] # Block until there is work
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Drop requests whose caller already gave up
+            batch = [(img, fut) for img, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self._stats["requests"] += len(batch)
+            self._stats["batches"] += 1
+            try:
+                embeddings = _embed_batch([img for img, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), emb in zip(batch, embeddings):
+                if isinstance(emb, EmbeddingFailed):
+                    fut.set_exception(emb)
+                else:
+                    fut.set_result(emb)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self._stats["batches"] or 1
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queued": self._queue.qsize(),
+            "requests": self._stats["requests"],
+            "batches": self._stats["batches"],
+            "rejected": self._stats["rejected"],
+            "avg_batch_size": self._stats["requests"] / batches,
+        }
 
 
 def euclidean_distance(a: np.ndarray, b: np.ndarray) -> float:
@@ -86,6 +494,13 @@ def distance_to_similarity(dist: float, max_dist: float = 1.2) -> float:
     similarity = max(0.0, 1.0 - (dist / max_dist))
     return float(similarity)
 
+# A good threshold for Facenet L2 distance
+# Matches below this are likely the same person.
+# We can tune this: 0.8 is strict, 1.0 is more lenient.
+MATCH_THRESHOLD_DISTANCE = 1.0
+# Candidates returned by one top-K search (find_top_k_in_index)
+MATCH_CANDIDATES_K = int(os.getenv("MATCH_CANDIDATES_K", "10"))
+
 def find_best_match(
     # FIX: Use Union[] instead of | for Python 3.9 compatibility
     target_emb: Union[np.ndarray, List[float]], # Accept list or array
@@ -101,52 +516,100 @@ def find_best_match(
     Returns:
         Optional[Dict]: A dict with match info, or None.
     """
-    best_match = None
-    lowest_distance = float('inf')
+    target_emb = np.asarray(target_emb, dtype=np.float32).reshape(-1)
+    print(f"Target embedding shape: {target_emb.shape}")
 
-    # A good threshold for Facenet L2 distance
-    # Matches below this are likely the same person.
-    # We can tune this: 0.8 is strict, 1.0 is more lenient.
-    MATCH_THRESHOLD_DISTANCE = 1.0 
+    # Stack all usable candidate embeddings into one matrix so the
+    # distances are computed in a single vectorized pass
+    usable = [
+        c for c in candidates
+        if c.get("embedding") is not None and len(c["embedding"]) == target_emb.shape[0]
+    ]
+    if not usable:
+        print("No match found below threshold.")
+        return None
 
-    # --- FIX (from previous error) ---
-    # The target_emb is passed as a list from report.py,
-    # but we need it as a numpy array for .shape and calculations.
-    if not isinstance(target_emb, np.ndarray):
-        target_emb = np.array(target_emb)
-    # --- END FIX ---
+    matrix = np.asarray([c["embedding"] for c in usable], dtype=np.float32)
+    distances = np.linalg.norm(matrix - target_emb, axis=1)
+    best_row = int(np.argmin(distances))
+    lowest_distance = float(distances[best_row])
 
-    print(f"Target embedding shape: {target_emb.shape}")
-    for candidate in candidates:
-        cand_emb = candidate.get("embedding")
-        if not cand_emb:
-            # print(f"Candidate {candidate.get('_id')} has no embedding.")
-            continue # Skip candidates with no embedding
-        
-        # Ensure candidate embedding is also a numpy array
-        cand_emb_arr = cand_emb if isinstance(cand_emb, np.ndarray) else np.array(cand_emb)
-        
-        dist = euclidean_distance(target_emb, cand_emb_arr)
-        # print(f"Dist to {candidate.get('_id')}: {dist}")
-        
-        if dist < lowest_distance:
-            lowest_distance = dist
-            best_match = candidate
-            
     # Check if the best match is good enough
     print(f"Lowest distance found: {lowest_distance}")
-    if best_match and lowest_distance < MATCH_THRESHOLD_DISTANCE:
-        similarity_score = distance_to_similarity(lowest_distance)
+    if lowest_distance < MATCH_THRESHOLD_DISTANCE:
         return {
-            "submission": best_match,
+            "submission": usable[best_row],
             "distance": lowest_distance,
-            "similarity": similarity_score
+            "similarity": distance_to_similarity(lowest_distance)
         }
     
     print("No match found below threshold.")
     return None # No match found
 
 
+def find_best_match_in_index(
+    target_emb: Union[np.ndarray, List[float]],
+    index: EmbeddingIndex,
+    nprobe: Optional[int] = None,
+    rows: Optional[np.ndarray] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Finds the nearest *unmatched* submission in a resident EmbeddingIndex.
+    
+    With an approximate (IVF) index, `nprobe` trades recall for latency.
+    The shortlist it returns carries exact distances, so
+    MATCH_THRESHOLD_DISTANCE is applied exactly as for a flat scan.
+    `rows` (from EmbeddingIndex.filter_rows) restricts the candidates.
+    
+    Returns:
+        Optional[Dict]: {"submission_id", "distance", "similarity"}, or None
+        if the index is empty or the nearest row is above the threshold.
+    """
+    nearest = index.search(target_emb, k=1, only_open=True, nprobe=nprobe, rows=rows)
+    if not nearest:
+        print("No eligible candidates in index.")
+        return None
+
+    submission_id, lowest_distance = nearest[0]
+    print(f"Lowest distance found: {lowest_distance}")
+    if lowest_distance < MATCH_THRESHOLD_DISTANCE:
+        return {
+            "submission_id": submission_id,
+            "distance": lowest_distance,
+            "similarity": distance_to_similarity(lowest_distance)
+        }
+
+    print("No match found below threshold.")
+    return None
+
+
+def find_top_k_in_index(
+    target_emb: Union[np.ndarray, List[float]],
+    index: EmbeddingIndex,
+    k: int = MATCH_CANDIDATES_K,
+    nprobe: Optional[int] = None,
+    rows: Optional[np.ndarray] = None
+) -> List[Dict[str, Any]]:
+    """
+    The `k` nearest *unmatched* submissions in one index search, nearest
+    first, whether or not they are under the match threshold.
+
+    Returns:
+        List[Dict]: {"submission_id", "distance", "similarity",
+        "is_match"} per candidate; "is_match" is distance <
+        MATCH_THRESHOLD_DISTANCE.
+    """
+    return [
+        {
+            "submission_id": submission_id,
+            "distance": distance,
+            "similarity": distance_to_similarity(distance),
+            "is_match": distance < MATCH_THRESHOLD_DISTANCE,
+        }
+        for submission_id, distance in index.search(target_emb, k=k, only_open=True, nprobe=nprobe, rows=rows)
+    ]
+
+
 # Compatibility aliases for older route code
 get_embedding = image_bytes_to_embedding
 l2 = euclidean_distance
\ No newline at end of file
@@ -0,0 +1,490 @@
+# app/utils/sqlite_db.py
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from app.utils import embedding_index
+from app.utils.log_store import FSYNC_WRITES
+from app.utils.db_common import (
+    DB_DIR, UNIQUE_FIELDS, DuplicateKeyError, copy_doc,
+    # Uploads stay files under app/uploads whatever stores the records
+    store_image_blob, release_image_blob, resolve_image_path, blob_stats,
+)
+
+# --- Configuration ---
+# SQLite storage backend (STORAGE_BACKEND=sqlite, see storage.py). Same
+# functions and document shapes as json_db; fill it from the JSON logs
+# once with scripts/migrate_to_sqlite.py.
+SQLITE_PATH = os.getenv("SQLITE_DB_PATH", os.path.join(DB_DIR, "tether.sqlite3"))
+# How long a writer waits for another process's write transaction
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "10"))
+# Rows of the change feed (see below) kept at each checkpoint
+CHANGES_KEEP = int(os.getenv("SQLITE_CHANGES_KEEP", "10000"))
+
+COLLECTIONS = ("parents", "volunteers", "children", "users", "match_candidates")
+
+# --- Schema ---
+# One table per collection, all with the same columns. The whole
+# document is stored as JSON in `doc`; the fields we query by are
+# copied into indexed columns on every write (see _columns). rowid
+# keeps insertion order. Embeddings are float32 BLOBs, never in `doc`.
+#
+# Uniqueness of username/email/phone is checked in _check_unique rather
+# than by UNIQUE constraints, because a value must be unique across all
+# three columns and legacy data may already hold duplicates.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    _id TEXT PRIMARY KEY,
+    doc TEXT NOT NULL,
+    user_id TEXT,
+    username TEXT,
+    email TEXT,
+    phone TEXT,
+    match_id TEXT,
+    match_confirmed INTEGER NOT NULL DEFAULT 0,
+    embedding BLOB
+);
+CREATE INDEX IF NOT EXISTS {table}_user_id ON {table} (user_id, match_confirmed);
+CREATE INDEX IF NOT EXISTS {table}_match_id ON {table} (match_id);
+"""
+
+_USERS_SCHEMA = """
+CREATE INDEX IF NOT EXISTS users_username ON users (username);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE INDEX IF NOT EXISTS users_phone ON users (phone);
+"""
+
+# --- Change Feed ---
+# Every write also appends (collection, _id, updated keys) here, tagged
+# with the writing process. Each process applies the other processes'
+# rows to its embedding index and update listeners (e.g. auth_utils'
+# token cache), as json_db does with their log appends. `updates` is
+# NULL for a full put.
+_CHANGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    updates TEXT,
+    pid INTEGER NOT NULL
+);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+_changes_lock = threading.Lock()
+# Held while an index is built from the tables and for each sync, so a
+# commit landing during the build is applied after it rather than lost
+_index_lock = threading.Lock()
+_last_seq = 0 # Last change feed row this process has applied (or written)
+_stats = {"commits": 0, "external_writes": 0, "resyncs": 0}
+
+
+def _table(collection_name: str) -> str:
+    if collection_name not in COLLECTIONS:
+        raise ValueError(f"Unknown collection name: {collection_name}")
+    return collection_name
+
+
+def _create_schema(conn: sqlite3.Connection):
+    global _schema_ready, _last_seq
+    with _schema_lock:
+        if _schema_ready:
+            return
+        # WAL: readers never block the writer and vice versa; several
+        # server processes can share the file.
+        conn.execute("PRAGMA journal_mode=WAL")
+        script = "".join(_SCHEMA.format(table=table) for table in COLLECTIONS)
+        conn.executescript(script + _USERS_SCHEMA + _CHANGES_SCHEMA)
+        _last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        _schema_ready = True
+
+
+def _connect() -> sqlite3.Connection:
+    """This thread's connection (sqlite3 connections are not shared between threads)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        # isolation_level=None: we issue BEGIN/COMMIT ourselves (see transaction)
+        conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+        # FULL fsyncs every commit, like json_db's journal; JSON_DB_FSYNC=0 turns it off
+        conn.execute(f"PRAGMA synchronous={'FULL' if FSYNC_WRITES else 'OFF'}")
+        _create_schema(conn)
+        _local.conn = conn
+        _local.data_version = None
+        _local.txn = None
+    return conn
+
+
+def _connection() -> sqlite3.Connection:
+    """Connection for a read, after applying other processes' changes."""
+    conn = _connect()
+    _catch_up(conn)
+    return conn
+
+
+# --- Encoding ---
+
+def _encode_doc(doc: Dict[str, Any]) -> str:
+    # default=str ensures datetimes are saved in ISO format
+    return json.dumps(doc, default=str, separators=(",", ":"))
+
+
+def _decode_doc(text: str) -> Dict[str, Any]:
+    return json.loads(text)
+
+
+def _encode_embedding(embedding: Any) -> Optional[bytes]:
+    if embedding is None:
+        return None
+    return np.asarray(embedding, dtype=np.float32).reshape(-1).tobytes()
+
+
+def _decode_embedding(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    if blob is None:
+        return None
+    return np.frombuffer(blob, dtype=np.float32).copy()
+
+
+def _columns(doc: Dict[str, Any]) -> Tuple:
+    """Values of the indexed columns for a document."""
+    match = doc.get("match") or {}
+    return (
+        doc.get("user_id"),
+        doc.get("username"),
+        doc.get("email"),
+        doc.get("phone"),
+        match.get("parent_report_id") or match.get("volunteer_report_id"),
+        1 if match.get("confirmed") else 0,
+    )
+
+
+def _select_doc(conn: sqlite3.Connection, collection_name: str, id_str: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute(f"SELECT doc FROM {_table(collection_name)} WHERE _id = ?", (id_str,)).fetchone()
+    return _decode_doc(row[0]) if row else None
+
+
+def _check_unique(conn: sqlite3.Connection, collection_name: str, doc_id: str, values: Dict[str, Any]):
+    """Raises DuplicateKeyError if any unique value is held by another record (in any unique column)."""
+    fields = UNIQUE_FIELDS.get(collection_name, ())
+    for field in fields:
+        value = values.get(field)
+        if value is None:
+            continue
+        taken = conn.execute(
+            f"SELECT 1 FROM {collection_name} WHERE ({' OR '.join(f'{f} = ?' for f in fields)}) AND _id != ? LIMIT 1",
+            (value,) * len(fields) + (doc_id,)
+        ).fetchone()
+        if taken:
+            raise DuplicateKeyError(collection_name, field, value)
+
+
+# --- Transactions ---
+# Same contract as json_db.transaction():
+#
+#     with sqlite_db.transaction() as txn:
+#         txn.update_submission(parent_id, {...}, "parents")
+#         txn.insert_submission(child_doc, "children")
+#
+# The block is one SQLite write transaction (BEGIN IMMEDIATE), so it
+# holds the database write lock across processes until it ends: keep
+# it short. Unlike json_db, reads inside the block on the same thread
+# already see the block's own writes. An exception rolls everything back.
+
+class Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        # (collection, _id, updates or None for a put), for after the commit
+        self.applied: List[Tuple[str, str, Optional[Dict[str, Any]]]] = []
+
+    def _record_change(self, collection_name: str, id_str: str, updates: Optional[Dict[str, Any]]):
+        keys = None
+        if updates is not None:
+            # Listeners only look at which keys changed and their plain values
+            keys = _encode_doc({key: (None if key == "embedding" else value) for key, value in updates.items()})
+        self.conn.execute(
+            "INSERT INTO changes (collection, doc_id, updates, pid) VALUES (?, ?, ?, ?)",
+            (collection_name, id_str, keys, os.getpid())
+        )
+        self.applied.append((collection_name, id_str, updates))
+
+    def insert_submission(self, doc: Dict[str, Any], collection_name: str) -> str:
+        """Stages an insert; same contract as sqlite_db.insert_submission."""
+        table = _table(collection_name)
+        # Only add created_at if it's not the users collection
+        if collection_name != "users":
+            doc["created_at"] = datetime.utcnow().isoformat()
+        _check_unique(self.conn, collection_name, doc["_id"], doc)
+        embedding = _encode_embedding(doc.get("embedding"))
+        if embedding is not None:
+            doc["embedding"] = None # Stored in the BLOB column only
+        stored = dict(doc)
+        stored.pop("embedding_row", None) # json_db sidecar reference, meaningless here
+        # Upsert rather than INSERT OR REPLACE: a replaced record keeps its rowid (order)
+        self.conn.execute(
+            f"""INSERT INTO {table} (_id, doc, user_id, username, email, phone, match_id, match_confirmed, embedding)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(_id) DO UPDATE SET
+                    doc = excluded.doc, user_id = excluded.user_id, username = excluded.username,
+                    email = excluded.email, phone = excluded.phone, match_id = excluded.match_id,
+                    match_confirmed = excluded.match_confirmed, embedding = excluded.embedding""",
+            (doc["_id"], _encode_doc(stored)) + _columns(stored) + (embedding,)
+        )
+        self._record_change(collection_name, doc["_id"], None)
+        return doc["_id"]
+
+    def update_submission(self, id_str: str, updates: Dict[str, Any], collection_name: str) -> bool:
+        """Stages a shallow update; same contract as sqlite_db.update_submission."""
+        table = _table(collection_name)
+        doc = _select_doc(self.conn, collection_name, id_str)
+        if doc is None:
+            return False
+        _check_unique(self.conn, collection_name, id_str, updates)
+        doc.update(copy_doc(updates))
+        if "embedding" in updates:
+            doc["embedding"] = None
+        assignments = "doc = ?, user_id = ?, username = ?, email = ?, phone = ?, match_id = ?, match_confirmed = ?"
+        params = (_encode_doc(doc),) + _columns(doc)
+        if "embedding" in updates:
+            assignments += ", embedding = ?"
+            params += (_encode_embedding(updates["embedding"]),)
+        self.conn.execute(f"UPDATE {table} SET {assignments} WHERE _id = ?", params + (id_str,))
+        self._record_change(collection_name, id_str, updates)
+        return True
+
+
+class transaction:
+    """Context manager: `with sqlite_db.transaction() as txn: ...` (see above)."""
+
+    def __enter__(self) -> Transaction:
+        conn = _connection()
+        self.outer = _local.txn
+        if self.outer is not None:
+            # Nested on the same thread: becomes part of the outer transaction
+            return self.outer
+        conn.execute("BEGIN IMMEDIATE")
+        self.txn = _local.txn = Transaction(conn)
+        return self.txn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.outer is not None:
+            return False
+        _local.txn = None
+        if exc_type is not None:
+            self.txn.conn.execute("ROLLBACK")
+            return False
+        self.txn.conn.execute("COMMIT")
+        _stats["commits"] += 1
+        _apply_changes(self.txn.conn, self.txn.applied)
+        return False
+
+
+def _apply_changes(conn: sqlite3.Connection, changes: List[Tuple[str, str, Optional[Dict[str, Any]]]]):
+    """Index syncs and update listeners for committed changes."""
+    for collection_name, id_str, updates in changes:
+        if collection_name in embedding_index.INDEXED_COLLECTIONS and (
+                updates is None or "match" in updates or "embedding" in updates):
+            with _index_lock:
+                doc = _index_doc(conn, collection_name, id_str)
+                if doc is not None:
+                    embedding_index.sync_document(collection_name, doc)
+        if updates is not None:
+            for listener in _update_listeners.get(collection_name, ()):
+                listener(id_str, updates)
+
+
+def _catch_up(conn: sqlite3.Connection):
+    """Applies change feed rows written by other processes since our last look."""
+    global _last_seq
+    # data_version changes whenever another connection committed; skip
+    # the change feed query while nothing happened
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if version == _local.data_version or _local.txn is not None:
+        return
+    _local.data_version = version
+    with _changes_lock:
+        rows = conn.execute(
+            "SELECT seq, collection, doc_id, updates, pid FROM changes WHERE seq > ? ORDER BY seq", (_last_seq,)
+        ).fetchall()
+        if not rows:
+            return
+        if rows[0][0] > _last_seq + 1:
+            # Rows we never saw were pruned: rebuild the indexes from the tables
+            _stats["resyncs"] += 1
+            for collection_name in embedding_index.INDEXED_COLLECTIONS:
+                embedding_index.invalidate(collection_name)
+        _last_seq = rows[-1][0]
+        external = [
+            (collection_name, doc_id, json.loads(updates) if updates is not None else None)
+            for _, collection_name, doc_id, updates, pid in rows if pid != os.getpid()
+        ]
+        _stats["external_writes"] += len(external)
+    _apply_changes(conn, external)
+
+
+def catch_up():
+    """Applies change feed rows other worker processes wrote (index and listeners)."""
+    _connection()
+
+
+def checkpoint():
+    """Folds the WAL back into the database file and prunes the change feed."""
+    conn = _connect()
+    conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGES_KEEP,))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def storage_stats() -> Dict[str, Any]:
+    """Commit and cross-process counters of this process, and file sizes."""
+    def size(path: str) -> int:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+    return {
+        "backend": "sqlite",
+        **_stats,
+        "db_bytes": size(SQLITE_PATH),
+        "wal_bytes": size(SQLITE_PATH + "-wal"),
+    }
+
+
+# --- Records ---
+
+def insert_submission(doc: Dict[str, Any], collection_name: str) -> str:
+    """
+    Inserts a new document into the collection's table (replacing one
+    with the same _id). Uses the _id already in the doc (generated by
+    Pydantic). Raises DuplicateKeyError if a unique field is taken.
+    """
+    with transaction() as txn:
+        return txn.insert_submission(doc, collection_name)
+
+
+def find_submission(id_str: str, collection_name: str) -> Optional[Dict[str, Any]]:
+    """Finds a single submission by its _id in the specified collection."""
+    return _select_doc(_connection(), collection_name, id_str)
+
+
+def update_submission(id_str: str, updates: Dict[str, Any], collection_name: str) -> bool:
+    """
+    Shallow-merges `updates` into a record (pass whole top-level keys,
+    e.g. {"match": {...}}). Returns False if the id is unknown.
+    Raises DuplicateKeyError if a unique field is taken.
+    """
+    with transaction() as txn:
+        return txn.update_submission(id_str, updates, collection_name)
+
+
+def list_submissions(collection_name: str) -> List[Dict[str, Any]]:
+    """Returns all submissions from the specified collection, in insertion order."""
+    rows = _connection().execute(f"SELECT doc FROM {_table(collection_name)} ORDER BY rowid")
+    return [_decode_doc(text) for (text,) in rows]
+
+
+# --- Update Listeners ---
+# Callbacks run after update_submission changed a record (in this or
+# another process), e.g. so auth_utils can drop cached sessions.
+_update_listeners: Dict[str, List[Callable[[str, Dict[str, Any]], None]]] = {}
+
+def add_update_listener(collection_name: str, listener: Callable[[str, Dict[str, Any]], None]):
+    """Registers `listener(id, updates)` for updates in a collection."""
+    _update_listeners.setdefault(collection_name, []).append(listener)
+
+
+# --- Users ---
+
+def find_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
+    """Finds a user by their _id."""
+    return find_submission(user_id, "users")
+
+
+def find_user_by_identifier(identifier: str) -> Optional[Dict[str, Any]]:
+    """Finds a user by username, email, or phone (one indexed lookup each)."""
+    conn = _connection()
+    for field in UNIQUE_FIELDS["users"]:
+        row = conn.execute(f"SELECT doc FROM users WHERE {field} = ? ORDER BY rowid LIMIT 1", (identifier,)).fetchone()
+        if row:
+            return _decode_doc(row[0])
+    return None
+
+
+def update_user(user_id: str, updates: Dict[str, Any]) -> bool:
+    """Finds a user by ID and updates their record."""
+    return update_submission(user_id, updates, "users")
+
+
+def find_reports_by_user_id(user_id: str) -> List[Dict[str, Any]]:
+    """Finds all reports (parent or volunteer) submitted by a user."""
+    conn = _connection()
+    reports = []
+    for collection_name in ("parents", "volunteers"):
+        rows = conn.execute(f"SELECT doc FROM {collection_name} WHERE user_id = ? ORDER BY rowid", (user_id,))
+        reports.extend(_decode_doc(text) for (text,) in rows)
+    return reports
+
+
+def find_confirmed_match_by_user_id(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns {"submission_id", "match"} for the user's first report with a
+    confirmed match (parents before volunteers), or None.
+    """
+    conn = _connection()
+    for collection_name in ("parents", "volunteers"):
+        row = conn.execute(
+            f"SELECT doc FROM {collection_name} WHERE user_id = ? AND match_confirmed = 1 ORDER BY rowid LIMIT 1",
+            (user_id,)
+        ).fetchone()
+        if row:
+            report = _decode_doc(row[0])
+            return {"submission_id": report["_id"], "match": dict(report["match"])}
+    return None
+
+
+# --- Embeddings ---
+
+def _index_doc(conn: sqlite3.Connection, collection_name: str, id_str: str) -> Optional[Dict[str, Any]]:
+    """A record with its embedding inline, as the embedding index expects it."""
+    row = conn.execute(f"SELECT doc, embedding FROM {_table(collection_name)} WHERE _id = ?", (id_str,)).fetchone()
+    if row is None:
+        return None
+    doc = _decode_doc(row[0])
+    doc["embedding"] = _decode_embedding(row[1])
+    return doc
+
+
+def get_submission_embedding(id_str: str, collection_name: str) -> Optional[np.ndarray]:
+    """Returns a submission's embedding as a float32 array, or None."""
+    row = _connection().execute(
+        f"SELECT embedding FROM {_table(collection_name)} WHERE _id = ?", (id_str,)
+    ).fetchone()
+    return _decode_embedding(row[0]) if row else None
+
+
+def get_embedding_index(collection_name: str) -> embedding_index.EmbeddingIndex:
+    """
+    Returns the resident embedding index for 'parents' or 'volunteers'.
+    Built from the embedding BLOBs on first use (vectors held in memory),
+    then kept in sync on every write and change feed row.
+    """
+    if collection_name not in embedding_index.INDEXED_COLLECTIONS:
+        raise ValueError(f"Collection '{collection_name}' has no embedding index")
+    conn = _connection()
+    index = embedding_index.get_index(
+        collection_name,
+        # Same trained quantizer file as json_db: it only holds centroids
+        persist_path=os.path.join(DB_DIR, f"{collection_name}.ivf.npz")
+    )
+    if not index.loaded:
+        with _index_lock:
+            if not index.loaded:
+                docs = []
+                for text, blob in conn.execute(
+                        f"SELECT doc, embedding FROM {collection_name} WHERE embedding IS NOT NULL ORDER BY rowid"):
+                    doc = _decode_doc(text)
+                    doc["embedding"] = _decode_embedding(blob)
+                    docs.append(doc)
+                index.rebuild(docs)
+                print(f"Built embedding index for '{collection_name}' with {len(index)} rows.")
+    return index
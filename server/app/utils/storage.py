@@ -0,0 +1,99 @@
+# app/utils/storage.py
+import os
+from types import ModuleType
+from typing import Protocol, List, Dict, Any, Optional, Callable, ContextManager
+import numpy as np
+from app.utils import embedding_index
+
+# --- Configuration ---
+# Which module stores the collections: "json" (json_db.py, JSON-lines
+# logs in app/db) or "sqlite" (sqlite_db.py, app/db/tether.sqlite3).
+# Existing JSON data is copied over with scripts/migrate_to_sqlite.py.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+
+
+class Transaction(Protocol):
+    """Writes staged inside `with db.transaction() as txn:`, committed together."""
+
+    def insert_submission(self, doc: Dict[str, Any], collection_name: str) -> str: ...
+
+    def update_submission(self, id_str: str, updates: Dict[str, Any], collection_name: str) -> bool: ...
+
+
+class StorageBackend(Protocol):
+    """
+    What the routes and services need from a storage backend. Backends
+    are modules exposing these functions (json_db, sqlite_db); they are
+    checked structurally, there is no base class to inherit from.
+
+    Documents are plain dicts keyed by `_id`. Reads return copies the
+    caller may mutate. Updates are shallow merges of top-level keys.
+    Embeddings are never returned inline (`embedding` is None); use
+    get_submission_embedding or get_embedding_index.
+    """
+
+    DuplicateKeyError: type
+
+    # --- Records ---
+    def insert_submission(self, doc: Dict[str, Any], collection_name: str) -> str: ...
+
+    def find_submission(self, id_str: str, collection_name: str) -> Optional[Dict[str, Any]]: ...
+
+    def update_submission(self, id_str: str, updates: Dict[str, Any], collection_name: str) -> bool: ...
+
+    def list_submissions(self, collection_name: str) -> List[Dict[str, Any]]: ...
+
+    def transaction(self) -> ContextManager[Transaction]: ...
+
+    def add_update_listener(self, collection_name: str, listener: Callable[[str, Dict[str, Any]], None]): ...
+
+    # --- Users ---
+    def find_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]: ...
+
+    def find_user_by_identifier(self, identifier: str) -> Optional[Dict[str, Any]]: ...
+
+    def update_user(self, user_id: str, updates: Dict[str, Any]) -> bool: ...
+
+    def find_reports_by_user_id(self, user_id: str) -> List[Dict[str, Any]]: ...
+
+    def find_confirmed_match_by_user_id(self, user_id: str) -> Optional[Dict[str, Any]]: ...
+
+    # --- Embeddings ---
+    def get_submission_embedding(self, id_str: str, collection_name: str) -> Optional[np.ndarray]: ...
+
+    def get_embedding_index(self, collection_name: str) -> embedding_index.EmbeddingIndex: ...
+
+    # --- Uploads (files under app/uploads, the same for every backend) ---
+    def store_image_blob(self, staged_path: str, digest: str, extension: str, submission_id: str) -> str: ...
+
+    def release_image_blob(self, image_path: str, submission_id: str) -> bool: ...
+
+    def resolve_image_path(self, image_path: str) -> Optional[str]: ...
+
+    def blob_stats(self) -> Dict[str, int]: ...
+
+    # --- Maintenance ---
+    def catch_up(self):
+        """Applies other worker processes' writes now instead of on the next read."""
+        ...
+
+    def checkpoint(self): ...
+
+    def storage_stats(self) -> Dict[str, Any]: ...
+
+
+def load_backend(name: Optional[str] = None) -> StorageBackend:
+    """Imports the backend module called `name` (default: STORAGE_BACKEND)."""
+    name = name or STORAGE_BACKEND
+    backend: ModuleType
+    if name == "json":
+        from app.utils import json_db as backend
+    elif name == "sqlite":
+        from app.utils import sqlite_db as backend
+    else:
+        raise ValueError(f"Unknown storage backend: {name}")
+    return backend
+
+
+# The selected backend. Import it as `from app.utils.storage import db`.
+db: StorageBackend = load_backend()
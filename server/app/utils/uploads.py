@@ -0,0 +1,64 @@
+# app/utils/uploads.py
+import hashlib
+import os
+import tempfile
+from typing import NamedTuple, Optional
+from fastapi import UploadFile
+
+# --- Configuration ---
+# Largest accepted image upload; larger ones are answered with 413.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+# Bytes read from the client upload per step
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Uploads are staged here (outside the statically served app/uploads)
+# and renamed into place once the submission has an _id.
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "app/tmp")
+
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+class IngestedUpload(NamedTuple):
+    path: str        # staged file under UPLOAD_TMP_DIR
+    digest: str      # sha256 of the content
+    size: int
+    extension: str   # from the client filename, e.g. ".jpg"
+
+
+async def ingest_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> IngestedUpload:
+    """
+    Copies an upload to a staging file in fixed-size chunks, hashing it
+    on the way, so at most one chunk is in memory at a time however big
+    the file is. Raises UploadTooLarge as soon as `max_bytes` is passed.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard(path)
+        raise
+    finally:
+        await file.close()
+
+    extension = os.path.splitext(file.filename or "")[-1] or ".jpg"
+    return IngestedUpload(path=path, digest=digest.hexdigest(), size=size, extension=extension)
+
+
+def discard(path: Optional[str]):
+    """Removes a staged upload that was not moved into place."""
+    if path and os.path.exists(path):
+        os.remove(path)
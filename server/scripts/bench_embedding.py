@@ -0,0 +1,70 @@
+"""
+Measures end-to-end embedding latency (decode + MTCNN + ResNet) against
+input size: the full-resolution path (whole image decoded and passed to
+MTCNN) versus the configured one (decode capped at RECOGNITION_MAX_SIDE,
+detection on a RECOGNITION_DETECT_SIDE copy, crop from the original).
+
+Run from the server/ directory with a photo containing one face:
+    python scripts/bench_embedding.py path/to/face.jpg [repeats]
+
+The photo is resized to each size in MEGAPIXELS and re-encoded as JPEG,
+like a phone upload of that resolution.
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from app.utils import recognition
+
+MEGAPIXELS = (0.5, 1, 3, 6, 12, 24)
+
+
+def jpeg_at(img: Image.Image, megapixels: float) -> bytes:
+    scale = (megapixels * 1e6 / (img.width * img.height)) ** 0.5
+    resized = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def time_embedding(image_bytes: bytes, max_side: int, detect_side: int, repeats: int):
+    """Best-of-`repeats` latency in ms, and whether a face was found."""
+    recognition.RECOGNITION_MAX_SIDE = max_side
+    recognition.RECOGNITION_DETECT_SIDE = detect_side
+    best = float("inf")
+    found = False
+    for _ in range(repeats):
+        started = time.perf_counter()
+        found = recognition.image_bytes_to_embedding(image_bytes) is not None
+        best = min(best, time.perf_counter() - started)
+    return 1000 * best, found
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print(__doc__)
+        sys.exit(2)
+    repeats = int(sys.argv[2]) if len(sys.argv) == 3 else 3
+    source = Image.open(sys.argv[1]).convert("RGB")
+
+    recognition.load_models()
+    max_side = recognition.RECOGNITION_MAX_SIDE
+    detect_side = recognition.RECOGNITION_DETECT_SIDE
+    print(f"configured: decode max side {max_side}, detection side {detect_side}")
+    print(f"{'MP':>5} {'KB':>7} {'full-res ms':>12} {'configured ms':>14} {'speedup':>8}  face found")
+    for megapixels in MEGAPIXELS:
+        image_bytes = jpeg_at(source, megapixels)
+        full_ms, full_found = time_embedding(image_bytes, 1 << 20, 0, repeats)
+        fast_ms, fast_found = time_embedding(image_bytes, max_side, detect_side, repeats)
+        print(
+            f"{megapixels:>5} {len(image_bytes) // 1024:>7} {full_ms:>12.1f} {fast_ms:>14.1f} "
+            f"{full_ms / fast_ms:>7.1f}x  {full_found}/{fast_found}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Checks that the optimized embedding path (RECOGNITION_OPTIMIZE) does not
+change match decisions compared with the fp32 model.
+
+Run from the server/ directory:
+    RECOGNITION_OPTIMIZE=channels_last,quantize,jit \
+        python scripts/check_embedding_parity.py path/to/reference_faces/
+
+Exits with status 1 if any match decision changed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import recognition
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(2)
+
+    ref_dir = sys.argv[1]
+    paths = sorted(
+        os.path.join(ref_dir, name) for name in os.listdir(ref_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+
+    report = recognition.check_optimized_parity(images)
+    for key, value in report.items():
+        print(f"{key:>20}: {value}")
+    sys.exit(0 if report["decisions_unchanged"] else 1)
+
+
+if __name__ == "__main__":
+    main()
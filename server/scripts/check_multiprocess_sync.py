@@ -0,0 +1,85 @@
+"""
+Checks that a worker process sees reports written by another worker:
+the second process's report must reach the first one's embedding index
+(so find_and_update_match can match it) and the match it makes must be
+pushed to event streams held by the first process.
+
+Runs against a scratch app/db in a temporary directory, never the real
+one. Run from the server/ directory:
+    python scripts/check_multiprocess_sync.py [json|sqlite]
+
+Exits with status 1 if a check fails.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+DIM = 512
+
+
+def vector(seed: int, noise: float = 0.0) -> list:
+    import numpy as np
+    base = np.random.default_rng(0).normal(size=DIM)
+    base /= np.linalg.norm(base)
+    return list(base + noise * np.random.default_rng(seed).normal(size=DIM) / np.sqrt(DIM))
+
+
+def second_worker():
+    """Runs in the other process: adds a volunteer report and matches it."""
+    from app.utils.storage import db
+    from app.utils import match_jobs
+    emb = vector(1, noise=0.1)
+    db.insert_submission({"_id": "v1", "user_id": "volunteer-user", "embedding": emb, "match": {}}, "volunteers")
+    result = match_jobs.find_and_update_match("v1", "volunteer", emb)
+    print(f"  second worker matched v1 with {result and result['submission_id']}")
+
+
+async def first_worker() -> bool:
+    from app.utils.storage import db
+    from app.utils import match_events, match_jobs # match_jobs registers the event listeners
+
+    db.insert_submission({"_id": "p1", "user_id": "parent-user", "embedding": vector(0), "match": {}}, "parents")
+    volunteers = db.get_embedding_index("volunteers") # Loaded (empty) before the other worker writes
+    db.get_embedding_index("parents")
+    from app.routes import events as events_route
+    events = match_events.subscribe("parent-user")
+    events_route.start_polling() # As GET /api/events does
+
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--second-worker"], check=True)
+
+    ok = True
+    found = [doc_id for doc_id, _ in db.get_embedding_index("volunteers").search(vector(1, 0.1), k=1, only_open=False)]
+    print(f"  index of the first worker holds {found}")
+    ok &= found == ["v1"] and volunteers is db.get_embedding_index("volunteers")
+
+    try:
+        message = await asyncio.wait_for(events.get(), timeout=5)
+    except asyncio.TimeoutError:
+        message = None
+    print(f"  event pushed to the first worker's stream: {message and message['event']}")
+    ok &= bool(message) and message["event"] == "match" and message["data"]["submission_id"] == "p1"
+    return ok
+
+
+def main():
+    if "--second-worker" in sys.argv:
+        second_worker()
+        return
+    backend = sys.argv[1] if len(sys.argv) > 1 else "json"
+    with tempfile.TemporaryDirectory() as scratch:
+        os.makedirs(os.path.join(scratch, "app", "db"))
+        os.chdir(scratch) # app/db is relative to the working directory
+        os.environ["STORAGE_BACKEND"] = backend
+        print(f"Storage backend: {backend}")
+        ok = asyncio.run(first_worker())
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
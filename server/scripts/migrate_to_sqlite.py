@@ -0,0 +1,70 @@
+"""
+Copies every collection from the JSON-lines logs in app/db (json_db)
+into the SQLite database used with STORAGE_BACKEND=sqlite
+(app/db/tether.sqlite3, or SQLITE_DB_PATH). Records keep their _id,
+order and created_at; embeddings move from the .emb sidecars into BLOB
+columns. Uploads are files and stay where they are.
+
+Run from the server/ directory, with the API stopped:
+    python scripts/migrate_to_sqlite.py [--dry-run] [--force]
+
+Refuses to write into a database that already has records, unless
+--force is given (records with the same _id are then overwritten).
+The JSON files are left untouched.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import json_db, sqlite_db
+
+COLLECTIONS = ("users", "parents", "volunteers", "children", "match_candidates")
+
+
+def existing_records() -> int:
+    conn = sqlite_db._connect()
+    return sum(conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in COLLECTIONS)
+
+
+def migrate_collection(collection_name: str, dry_run: bool) -> tuple:
+    """Copies one collection in a single SQLite transaction; returns (records, embeddings)."""
+    docs = json_db.list_submissions(collection_name)
+    embeddings = 0
+    if dry_run:
+        embeddings = sum(
+            1 for doc in docs if json_db.get_submission_embedding(doc["_id"], collection_name) is not None
+        )
+        return len(docs), embeddings
+    with sqlite_db.transaction() as txn:
+        for doc in docs:
+            created_at = doc.get("created_at")
+            embedding = json_db.get_submission_embedding(doc["_id"], collection_name)
+            if embedding is not None:
+                doc["embedding"] = embedding
+                embeddings += 1
+            doc.pop("embedding_row", None)
+            txn.insert_submission(doc, collection_name)
+            if created_at is not None and doc.get("created_at") != created_at:
+                # insert_submission stamps a new created_at: put the original back
+                txn.update_submission(doc["_id"], {"created_at": created_at}, collection_name)
+    return len(docs), embeddings
+
+
+def main():
+    args = sys.argv[1:]
+    dry_run = "--dry-run" in args
+    existing = existing_records()
+    if existing and not dry_run and "--force" not in args:
+        print(f"{sqlite_db.SQLITE_PATH} already holds {existing} records; re-run with --force to overwrite.")
+        sys.exit(1)
+    for collection_name in COLLECTIONS:
+        records, embeddings = migrate_collection(collection_name, dry_run)
+        print(f"{collection_name}: {records} records ({embeddings} embeddings) {'to copy' if dry_run else 'copied'}")
+    if not dry_run:
+        sqlite_db.checkpoint()
+        print(f"Done. Start the API with STORAGE_BACKEND=sqlite to use {sqlite_db.SQLITE_PATH}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Moves uploads from the flat app/uploads/<submission_id>.<ext> layout into
+the content-addressed blob store (app/uploads/blobs/ab/cd/<sha256>.<ext>)
+and rewrites `image_path` in parents, volunteers and children records.
+Identical photos end up stored once.
+
+Run from the server/ directory, with the API stopped:
+    python scripts/migrate_uploads.py [--dry-run]
+
+Safe to re-run, including after a crash: each upload is copied into the
+blob store before its record is updated, and the flat originals are
+deleted only once every record points at its blob. Records already
+pointing into the blob store are skipped.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import db_common, image_variants, uploads
+from app.utils.storage import db
+from app.utils.embedding_cache import content_digest
+
+SUBMISSION_COLLECTIONS = ("parents", "volunteers")
+
+
+def migrate_submissions(collection_name: str, dry_run: bool) -> dict:
+    """Copies each record's upload into the blob store; returns old -> new image_path."""
+    moved = {}
+    for doc in db.list_submissions(collection_name):
+        old_path = doc.get("image_path")
+        if not old_path or old_path.startswith("/uploads/blobs/"):
+            continue
+        file_path = db.resolve_image_path(old_path)
+        if file_path is None:
+            print(f"  {collection_name}/{doc['_id']}: {old_path} is missing, left as is")
+            continue
+        digest = content_digest(file_path)
+        extension = os.path.splitext(file_path)[1]
+        if dry_run:
+            new_path = "/uploads/blobs/" + db_common.get_blob_store().relative_path(digest, extension.lower())
+        else:
+            # The blob store takes ownership of (moves) the staged copy; the
+            # original stays until remove_originals, so a crash before the
+            # record update leaves it in place for the rerun.
+            fd, staged_path = tempfile.mkstemp(dir=uploads.UPLOAD_TMP_DIR, suffix=".part")
+            os.close(fd)
+            try:
+                shutil.copyfile(file_path, staged_path)
+                new_path = db.store_image_blob(staged_path, digest, extension, doc["_id"])
+            finally:
+                uploads.discard(staged_path)
+            db.update_submission(doc["_id"], {"image_path": new_path}, collection_name)
+            # Variants were cached under the old file name
+            stem = os.path.splitext(os.path.basename(file_path))[0]
+            for name in os.listdir(image_variants.VARIANTS_DIR):
+                if name.startswith(stem + "."):
+                    os.remove(os.path.join(image_variants.VARIANTS_DIR, name))
+        moved[old_path] = new_path
+    return moved
+
+
+def migrate_children(moved: dict, dry_run: bool) -> int:
+    """
+    Points confirmed-children records at the blob of each linked report.
+    Looked up through the reports rather than `moved` alone, so children
+    missed by an interrupted run are fixed by the next one.
+    """
+    current = {}
+    for collection_name in SUBMISSION_COLLECTIONS:
+        for doc in db.list_submissions(collection_name):
+            image_path = doc.get("image_path")
+            current[doc["_id"]] = moved.get(image_path, image_path)
+
+    updated = 0
+    for doc in db.list_submissions("children"):
+        images = dict(doc.get("images") or {})
+        changed = False
+        for key, report_key in (("parent_image_path", "parent_report_id"), ("volunteer_image_path", "volunteer_report_id")):
+            new_path = current.get(doc.get(report_key)) or moved.get(images.get(key))
+            if (
+                images.get(key) and not images[key].startswith("/uploads/blobs/")
+                and new_path and new_path.startswith("/uploads/blobs/")
+            ):
+                images[key] = new_path
+                changed = True
+        if changed:
+            updated += 1
+            if not dry_run:
+                db.update_submission(doc["_id"], {"images": images}, "children")
+    return updated
+
+
+def remove_originals() -> int:
+    """
+    Deletes the flat uploads/<id>.<ext> files of records that now point
+    into the blob store, including ones left by an interrupted run.
+    """
+    migrated = {
+        doc["_id"]
+        for collection_name in SUBMISSION_COLLECTIONS
+        for doc in db.list_submissions(collection_name)
+        if (doc.get("image_path") or "").startswith("/uploads/blobs/")
+    }
+    removed = 0
+    for name in os.listdir(db_common.UPLOADS_DIR):
+        path = os.path.join(db_common.UPLOADS_DIR, name)
+        if os.path.isfile(path) and os.path.splitext(name)[0] in migrated:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def main():
+    dry_run = "--dry-run" in sys.argv[1:]
+    moved = {}
+    for collection_name in SUBMISSION_COLLECTIONS:
+        result = migrate_submissions(collection_name, dry_run)
+        print(f"{collection_name}: {len(result)} uploads {'to move' if dry_run else 'copied'}")
+        moved.update(result)
+    children = migrate_children(moved, dry_run)
+    print(f"children: {children} records {'to update' if dry_run else 'updated'}")
+    if not dry_run:
+        db.checkpoint()
+        print(f"originals: {remove_originals()} files removed")
+        stats = db.blob_stats()
+        print(f"blob store: {stats['blobs']} files for {stats['references']} references, {stats['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()